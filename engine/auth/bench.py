@@ -0,0 +1,180 @@
+# Run from the project folder: python -m engine.auth.bench --help
+# Replays video files through detection, tracking, recognition and the
+# accept/reject decision without a camera or a window, so it runs headless.
+import itertools
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from engine.auth import trainer
+from engine.auth.decision import ACCEPT, SequentialDecision
+from engine.auth.detectors import BACKENDS
+from engine.auth.matcher import FACE_SIZE, FaceMatcher, extract
+from engine.auth.pipeline import FacePipeline
+from engine.auth.service import predict_tracks
+from engine.config import FACE_AUTH_DEADLINE
+
+
+def owner_samples(user_id=1):
+    # every enrolled crop of one user, from loose JPEGs and sample.py archives
+    manifest = trainer.load_manifest()
+    trainer.init_worker()
+    faces = []
+    for name in sorted(os.listdir(trainer.path)):
+        if not name.lower().endswith(('.jpg', '.png', '.zip')) or trainer.label_of(name) != user_id:
+            continue
+        faces += trainer.prepare_sample((os.path.join(trainer.path, name), manifest.get(name, {}).get('crop', False)))
+    return faces
+
+
+# (frame, face box) pairs of a face moving over a blurred noise background:
+# moving for the first third, still for the middle third, moving again at the end
+def synthetic_frames(faces, frames=300, size=(640, 480), seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (31, 31), 0)
+    side = FACE_SIZE[0]
+    for i in range(frames):
+        frame = background.copy()
+        face = cv2.resize(faces[(i // 10) % len(faces)], (side, side))
+        t = i if i < frames // 3 else (frames // 3 if i < 2 * frames // 3 else i - frames // 3)
+        x = (width - side) // 2 + int((width - side) // 2 * 0.9 * np.sin(t / 20))
+        y = (height - side) // 2 + int((height - side) // 4 * np.cos(t / 25))
+        frame[y:y + side, x:x + side] = cv2.cvtColor(face, cv2.COLOR_GRAY2BGR)
+        yield frame, (x, y, side, side)
+
+
+def synthetic_video(path, faces, frames=300, fps=30, size=(640, 480), seed=0):
+    video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    for frame, _ in synthetic_frames(faces, frames, size, seed):
+        video.write(frame)
+    video.release()
+    return path
+
+
+# Per-frame cost and predictions for one pass over a video
+def replay(video_path, detector, matcher, scale):
+    video = cv2.VideoCapture(video_path)
+    fps = video.get(cv2.CAP_PROP_FPS) or 30.0
+    pipeline = FacePipeline(detector, scale=scale)
+    seconds, observations = [], []
+    wall, cpu = time.perf_counter(), time.process_time()
+    while True:
+        ok, frame = video.read()
+        if not ok:
+            break
+        started = time.perf_counter()
+        tracks = pipeline.process(frame)
+        observations.append(predict_tracks(matcher, pipeline, tracks))
+        seconds.append(time.perf_counter() - started)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    video.release()
+    return {"fps": fps, "seconds": seconds, "observations": observations, "wall": wall, "cpu": cpu,
+            "detections": pipeline.stats["detections"]}
+
+
+# Authentication attempts starting every `stride` frames. Time follows the
+# video, or the processing when that is slower than the camera would be.
+def attempts(run, owners, stride=30, deadline=FACE_AUTH_DEADLINE):
+    fps, seconds, observations = run["fps"], run["seconds"], run["observations"]
+    results = []
+    for start in range(0, max(1, len(observations) - stride), stride):
+        now = [0.0]
+        decision = SequentialDecision(deadline, owners, clock=lambda: now[0])
+        busy = 0.0
+        for i in range(start, len(observations)):
+            busy += seconds[i]
+            now[0] = max((i - start + 1) / fps, busy)
+            for label, distance, weight in observations[i]:
+                decision.add(label, distance, weight)
+            if decision.tick() is not None:
+                break
+        results.append((decision.result, decision.elapsed))
+    return results
+
+
+def _percentile(samples, p):
+    return round(1000 * samples[min(len(samples) - 1, int(p * len(samples)))]) if samples else None
+
+
+# Detector configurations to compare: the cascade settings only apply to haar and lbp
+def configurations(detectors, scales, scale_factors, min_neighbors):
+    for name in detectors:
+        cascade = name in ("haar", "lbp")
+        for scale, scaleFactor, minNeighbors in itertools.product(scales, scale_factors if cascade else [None],
+                                                                  min_neighbors if cascade else [None]):
+            detector = BACKENDS[name](scaleFactor, minNeighbors) if cascade else BACKENDS[name]()
+            if not detector.available():
+                print(f"skipping {detector.missing()}")
+                break
+            yield name, detector, scale, scaleFactor, minNeighbors
+
+
+def evaluate(genuine, impostor, matcher, owners, detectors, scales, scale_factors, min_neighbors, stride=30):
+    results = []
+    for name, detector, scale, scaleFactor, minNeighbors in configurations(detectors, scales, scale_factors,
+                                                                           min_neighbors):
+        frames = wall = cpu = 0
+        outcomes = {"genuine": [], "impostor": []}
+        for kind, videos in (("genuine", genuine), ("impostor", impostor)):
+            for video_path in videos:
+                run = replay(video_path, detector, matcher, scale)
+                frames += len(run["seconds"])
+                wall += run["wall"]
+                cpu += run["cpu"]
+                outcomes[kind] += attempts(run, owners, stride)
+        accepted_times = sorted(elapsed for result, elapsed in outcomes["genuine"] if result == ACCEPT)
+        decided_times = sorted(elapsed for result, elapsed in outcomes["genuine"] + outcomes["impostor"]
+                               if result is not None)
+        genuine_n, impostor_n = len(outcomes["genuine"]), len(outcomes["impostor"])
+        results.append({
+            "detector": name, "scale": scale, "scaleFactor": scaleFactor, "minNeighbors": minNeighbors,
+            "fps": round(frames / wall, 1) if wall else 0.0,
+            "cpu_percent": round(100 * cpu / wall, 1) if wall else 0.0,
+            "cpu_ms_per_frame": round(1000 * cpu / frames, 2) if frames else 0.0,
+            "accept_p50_ms": _percentile(accepted_times, 0.5), "accept_p90_ms": _percentile(accepted_times, 0.9),
+            "decision_p50_ms": _percentile(decided_times, 0.5),
+            "FRR": round(sum(result != ACCEPT for result, _ in outcomes["genuine"]) / genuine_n, 3) if genuine_n else None,
+            "FAR": round(sum(result == ACCEPT for result, _ in outcomes["impostor"]) / impostor_n, 3) if impostor_n else None,
+            "attempts": genuine_n + impostor_n,
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline face auth benchmark: FPS, CPU, time to decision, FAR/FRR")
+    parser.add_argument("--genuine", nargs="*", default=[], help="videos of the enrolled user")
+    parser.add_argument("--impostor", nargs="*", default=[], help="videos of somebody else")
+    parser.add_argument("--user", type=int, default=1, help="enrolled user the model is trained on")
+    parser.add_argument("--model", action="store_true",
+                        help="use the trained model instead of training on half of the user's samples")
+    parser.add_argument("--detectors", nargs="+", default=list(BACKENDS), choices=list(BACKENDS),
+                        help="detector backends to compare (see detectors.py)")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 1.0], help="detection downscale factors")
+    parser.add_argument("--scale-factors", type=float, nargs="+", default=[1.1, 1.3])
+    parser.add_argument("--min-neighbors", type=int, nargs="+", default=[4])
+    parser.add_argument("--stride", type=int, default=30, help="frames between the starts of two attempts")
+    args = parser.parse_args()
+
+    faces = owner_samples(args.user)
+    if args.model:
+        from engine.auth.enroll import load_model
+        matcher, _ = load_model()
+    else:
+        # train on every other sample so the genuine video shows faces the model hasn't seen
+        matcher = FaceMatcher(extract(faces[::2]), np.full(len(faces[::2]), args.user))
+    held_out = faces[1::2] or faces
+
+    with tempfile.TemporaryDirectory(prefix="facebench-") as workdir:
+        genuine = args.genuine or [synthetic_video(os.path.join(workdir, "genuine.avi"), held_out)]
+        # without recordings of another person, mirrored faces stand in: still faces, but LBPH-far from the user
+        impostor = args.impostor or [synthetic_video(os.path.join(workdir, "impostor.avi"),
+                                                     [cv2.flip(face, 1) for face in held_out], seed=1)]
+        for row in evaluate(genuine, impostor, matcher, {args.user}, args.detectors, args.scales, args.scale_factors,
+                            args.min_neighbors, args.stride):
+            print(row)
@@ -0,0 +1,162 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+
+from engine.auth.capture import CameraStream
+from engine.config import CAMERA_CACHE_PATH, CAMERA_HOLD_TTL, CAMERA_MAX_INDEX, CAMERA_PREFERRED_INDEX, CAMERA_WARM_TTL
+
+
+def _backends():
+    if sys.platform == "win32":
+        return [cv2.CAP_DSHOW, cv2.CAP_MSMF, cv2.CAP_ANY]
+    if sys.platform == "darwin":
+        return [cv2.CAP_AVFOUNDATION, cv2.CAP_ANY]
+    return [cv2.CAP_V4L2, cv2.CAP_ANY]
+
+
+# Finds a working camera once and remembers it, and can open it ahead of
+# time so the first frame is ready by the time face auth asks for it.
+class CameraManager:
+    def __init__(self, cache_path=CAMERA_CACHE_PATH):
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.warm = None  # opened stream waiting for its first user
+        self.warming = None
+        self.shared = None  # low-rate reader (the presence monitor) that gives the device up to face auth
+
+    def _cached(self):
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+            return data["index"], data["backend"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _remember(self, index, backend):
+        data = {"index": index, "backend": backend, "backend_name": cv2.videoio_registry.getBackendName(backend),
+                "probed": time.strftime("%Y-%m-%d %H:%M:%S")}
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(self.cache_path, "w") as f:
+            json.dump(data, f, indent=2)
+
+    def _candidates(self):
+        indices = [CAMERA_PREFERRED_INDEX] + [i for i in range(CAMERA_MAX_INDEX) if i != CAMERA_PREFERRED_INDEX]
+        for backend in _backends():
+            for index in indices:
+                yield index, backend
+
+    # Try every index and backend until one gives a frame, and cache the winner
+    def probe(self):
+        started = time.perf_counter()
+        for index, backend in self._candidates():
+            stream = CameraStream(index, backend).start()
+            if stream.opened:
+                self._remember(index, backend)
+                print(f"camera: found index {index} on {cv2.videoio_registry.getBackendName(backend)} "
+                      f"after {time.perf_counter() - started:.2f}s of probing")
+                return stream
+            stream.stop()
+        print("Error: Could not open webcam.")
+        return None
+
+    # Let `reader` hold the camera between attempts; it is closed before
+    # anything here opens the device, and opens it again on its own
+    def share(self, reader):
+        self.shared = reader
+
+    def _open(self):
+        shared = self.shared
+        if shared is not None:
+            shared.close()
+        cached = self._cached()
+        if cached is not None:
+            stream = CameraStream(*cached).start()
+            if stream.opened:
+                return stream
+            stream.stop()
+            print("camera: cached device failed, probing again")
+        return self.probe()
+
+    # Open the camera in the background; acquire() picks the stream up
+    def prewarm(self):
+        with self.lock:
+            if self.warm is not None or (self.warming is not None and self.warming.is_alive()):
+                return self
+
+            def run():
+                started = time.perf_counter()
+                stream = self._open()
+                if stream is None:
+                    return
+                print(f"camera: warm, first frame {time.perf_counter() - started:.2f}s after prewarm")
+                self._park(stream, CAMERA_WARM_TTL)
+
+            self.warming = threading.Thread(target=run, name="camera-prewarm", daemon=True)
+            self.warming.start()
+        return self
+
+    def _park(self, stream, ttl):
+        with self.lock:
+            self.warm = stream
+        timer = threading.Timer(ttl, self._expire, args=(stream,))
+        timer.daemon = True
+        timer.start()
+
+    # Hand an acquired stream back open, for another attempt that follows
+    # right away; it is stopped when nobody acquires it within `ttl` seconds
+    def release(self, stream, ttl=CAMERA_HOLD_TTL):
+        with self.lock:
+            previous = self.warm
+        if previous is not None and previous is not stream:
+            previous.stop()
+        self._park(stream, ttl)
+
+    # Stop a warm or released stream now instead of at its expiry
+    def close(self):
+        with self.lock:
+            stream, self.warm = self.warm, None
+        if stream is not None:
+            stream.stop()
+
+    def _expire(self, stream):
+        # nobody used the warm camera in time: don't keep the webcam light on
+        with self.lock:
+            if self.warm is not stream:
+                return
+            self.warm = None
+        stream.stop()
+
+    # An opened CameraStream, warm if prewarm() ran; stop() it when done
+    def acquire(self, timeout=None):
+        started = time.perf_counter()
+        warming = self.warming
+        if warming is not None:
+            warming.join(timeout)
+        with self.lock:
+            stream, self.warm = self.warm, None
+        if stream is None or not stream.opened:
+            stream = self._open()
+        if stream is not None:
+            print(f"camera: acquired in {time.perf_counter() - started:.2f}s")
+        return stream
+
+
+_manager = None
+
+
+def getManager():
+    global _manager
+    if _manager is None:
+        _manager = CameraManager()
+    return _manager
+
+
+if __name__ == "__main__":
+    stream = getManager().probe()
+    if stream is not None:
+        print("cached in", CAMERA_CACHE_PATH)
+        stream.stop()
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import cv2
+
+
+# Reads the camera on its own thread and keeps only the newest frame.
+#
+# Two preallocated buffers are used: the consumer holds `front` between two
+# read() calls and the thread decodes into `back`. While the consumer still
+# holds its frame the thread only grab()s, which throws stale frames away
+# without decoding them; once the consumer asks for the next frame the thread
+# decodes the newest one into `back` and swaps. Frames are never copied.
+class CameraStream:
+    def __init__(self, index=1, backend=cv2.CAP_DSHOW, width=640, height=480):
+        self.index = index
+        self.backend = backend
+        self.width = width
+        self.height = height
+        self.cam = None
+        self.front = None
+        self.back = None
+        self.seq = 0  # number of the frame in `front`
+        self.consumed = 0  # last frame number handed to the consumer
+        self.leased = False
+        self.running = False
+        self.failed = False
+        self.cond = threading.Condition()
+        self.thread = None
+        self.open_seconds = None
+        self.first_frame_seconds = None
+        self.stats = {"grabbed": 0, "delivered": 0, "dropped": 0}
+
+    @property
+    def opened(self):
+        return self.cam is not None and self.cam.isOpened() and not self.failed
+
+    def start(self):
+        started = time.perf_counter()
+        self.cam = cv2.VideoCapture(self.index, self.backend)
+        self.open_seconds = time.perf_counter() - started
+        if not self.cam.isOpened():
+            self.failed = True
+            return self
+        self.cam.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.cam.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        ok, frame = self.cam.read()
+        self.first_frame_seconds = time.perf_counter() - started
+        if not ok:
+            self.failed = True
+            return self
+        print(f"camera {self.index}: opened in {self.open_seconds:.2f}s, first frame after {self.first_frame_seconds:.2f}s")
+        self.front = frame
+        self.back = frame.copy()
+        self.seq = 1
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="camera", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while self.running:
+            if not self.cam.grab():
+                with self.cond:
+                    self.failed = True
+                    self.cond.notify_all()
+                break
+            self.stats["grabbed"] += 1
+            with self.cond:
+                if self.leased and self.consumed == self.seq:
+                    # the consumer is busy with the current frame: drop this one undecoded
+                    self.stats["dropped"] += 1
+                    continue
+            ok, _ = self.cam.retrieve(self.back)
+            if not ok:
+                continue
+            with self.cond:
+                if self.leased and self.consumed == self.seq:
+                    self.stats["dropped"] += 1
+                    continue
+                if self.seq > self.consumed:
+                    # the frame in front was never picked up and is now stale
+                    self.stats["dropped"] += 1
+                self.front, self.back = self.back, self.front
+                self.seq += 1
+                self.cond.notify_all()
+
+    # Newest frame not seen before, or None when the camera stopped. The
+    # returned array belongs to the caller until the next read() call.
+    def read(self, timeout=1.0):
+        with self.cond:
+            self.leased = False
+            if not self.cond.wait_for(lambda: self.seq > self.consumed or self.failed or not self.running, timeout):
+                return None
+            if self.seq <= self.consumed:
+                return None
+            self.consumed = self.seq
+            self.leased = True
+            self.stats["delivered"] += 1
+            return self.front
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        if self.cam is not None:
+            self.cam.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
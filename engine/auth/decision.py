@@ -0,0 +1,107 @@
+import math
+import threading
+import time
+from collections import deque
+
+from engine.config import (FACE_GENUINE_DISTANCE, FACE_IMPOSTOR_DISTANCE, FACE_LLR_CLIP, FACE_REJECT_MIN_FRAMES,
+                           FACE_REJECT_MIN_SECONDS, FACE_SPRT_ALPHA, FACE_SPRT_BETA)
+
+ACCEPT = 1
+REJECT = 0
+
+_history = deque(maxlen=200)
+_history_lock = threading.Lock()
+
+
+def _log_normal(x, mean, std):
+    return -0.5 * ((x - mean) / std) ** 2 - math.log(std)
+
+
+# Sequential probability ratio test over per-frame LBPH distances.
+#
+# Every recognised face adds log P(distance | owner) - log P(distance | someone
+# else), clipped so one noisy frame can't decide on its own. The attempt is
+# accepted as soon as the sum passes log((1 - beta) / alpha), rejected when it
+# falls below log(beta / (1 - alpha)), and rejected when the deadline passes.
+# A reject before the deadline also needs min_frames predictions over
+# min_seconds: until then the sum stops at the reject bound, so someone still
+# sitting down isn't turned away after two frames and can still be accepted.
+class SequentialDecision:
+    def __init__(self, deadline, owners, alpha=FACE_SPRT_ALPHA, beta=FACE_SPRT_BETA,
+                 genuine=FACE_GENUINE_DISTANCE, impostor=FACE_IMPOSTOR_DISTANCE, clip=FACE_LLR_CLIP,
+                 min_frames=FACE_REJECT_MIN_FRAMES, min_seconds=FACE_REJECT_MIN_SECONDS, clock=time.monotonic):
+        self.clock = clock  # replays pass a clock that follows the video
+        self.deadline = deadline  # clock() value
+        self.owners = set(owners)
+        self.accept_at = math.log((1 - beta) / alpha)
+        self.reject_at = math.log(beta / (1 - alpha))
+        self.genuine = genuine
+        self.impostor = impostor
+        self.clip = clip
+        self.min_frames = min_frames
+        self.min_seconds = min_seconds
+        self.llr = 0.0
+        self.frames = 0
+        self.result = None
+        self.reason = None
+        self.started = clock()
+        self.elapsed = None
+
+    @property
+    def pending(self):
+        return self.result is None
+
+    def _decide(self, result, reason):
+        self.result = result
+        self.reason = reason
+        self.elapsed = self.clock() - self.started
+        with _history_lock:
+            _history.append((self.elapsed, reason, result))
+
+    # Add one prediction; weight < 1 for faces that didn't move since the last one
+    def add(self, label, distance, weight=1.0):
+        if not self.pending:
+            return self.result
+        self.frames += 1
+        if label in self.owners:
+            step = _log_normal(distance, *self.genuine) - _log_normal(distance, *self.impostor)
+        else:
+            # the recogniser picked someone else: counts as strong evidence against
+            step = -self.clip
+        self.llr += weight * max(-self.clip, min(self.clip, step))
+        if self.llr >= self.accept_at:
+            self._decide(ACCEPT, "accepted")
+        elif self.llr <= self.reject_at:
+            if self.frames >= self.min_frames and self.clock() - self.started >= self.min_seconds:
+                self._decide(REJECT, "rejected")
+            else:
+                self.llr = self.reject_at
+        return self.tick()
+
+    # Enforce the deadline; call once per frame even when no face was seen
+    def tick(self):
+        if self.pending and self.clock() >= self.deadline:
+            self._decide(REJECT, "deadline")
+        return self.result
+
+    def cancel(self):
+        if self.pending:
+            self._decide(REJECT, "cancelled")
+
+
+def _percentile(samples, p):
+    return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000)
+
+
+# Time-to-decision percentiles over recent attempts
+def stats():
+    with _history_lock:
+        history = list(_history)
+    if not history:
+        return {}
+    times = sorted(elapsed for elapsed, _, _ in history)
+    reasons = {}
+    for _, reason, _ in history:
+        reasons[reason] = reasons.get(reason, 0) + 1
+    return {"attempts": len(history), "p50_ms": _percentile(times, 0.5), "p90_ms": _percentile(times, 0.9),
+            "p99_ms": _percentile(times, 0.99), **reasons}
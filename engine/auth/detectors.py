@@ -0,0 +1,234 @@
+# Run from the project folder: python -m engine.auth.detectors calibrate
+import json
+import os
+import time
+
+import cv2
+
+from engine.config import (FACE_DETECT_MIN_NEIGHBORS, FACE_DETECT_MIN_SIZE, FACE_DETECT_SCALE,
+                           FACE_DETECT_SCALE_FACTOR, FACE_DETECTOR, FACE_DETECTOR_MIN_PRECISION,
+                           FACE_DETECTOR_MIN_RECALL, FACE_DETECTOR_PROFILE_PATH, FACE_DNN_CONFIDENCE)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HAAR_PATH = os.path.join(BASE_DIR, 'haarcascade_frontalface_default.xml')
+
+# The lbp and dnn models aren't in the repo or in the opencv-python wheels.
+# `python -m engine.auth.detectors fetch` downloads them next to this file;
+# an OpenCV install that has them (e.g. /usr/share/opencv4) is used as well.
+MODEL_URLS = {
+    'lbpcascade_frontalface_improved.xml':
+        'https://raw.githubusercontent.com/opencv/opencv/4.x/data/lbpcascades/lbpcascade_frontalface_improved.xml',
+    'face_detection_yunet_2023mar.onnx':
+        'https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/face_detection_yunet_2023mar.onnx',
+}
+FETCH_HINT = "get it with: python -m engine.auth.detectors fetch"
+
+
+# First copy of a model file: next to this file, then in the OpenCV data
+# folders. Returns the path next to this file when there is none, which is
+# where fetch() puts it.
+def find_model(filename, subdir):
+    folders = [BASE_DIR]
+    data = getattr(getattr(cv2, "data", None), "haarcascades", None)
+    if data:
+        folders += [data, os.path.join(os.path.dirname(os.path.normpath(data)), subdir)]
+    folders += [os.path.join(prefix, "share", name, subdir) for prefix in ("/usr", "/usr/local")
+                for name in ("opencv4", "opencv")]
+    for folder in folders:
+        if os.path.isfile(os.path.join(folder, filename)):
+            return os.path.join(folder, filename)
+    return os.path.join(BASE_DIR, filename)
+
+
+LBP_PATH = find_model('lbpcascade_frontalface_improved.xml', 'lbpcascades')
+DNN_PATH = find_model('face_detection_yunet_2023mar.onnx', 'dnn')
+
+
+# Finds faces in a grey image; every backend takes the same shared profile
+class Detector:
+    name = None
+
+    def available(self):
+        return True
+
+    def missing(self):
+        return f"face detector {self.name}: model file {self.path} not found, {FETCH_HINT}"
+
+    # (x, y, w, h) boxes of faces at least min_size = (w, h) pixels big
+    def detect(self, gray, min_size):
+        raise NotImplementedError
+
+
+class HaarDetector(Detector):
+    name = "haar"
+    path = HAAR_PATH
+
+    def __init__(self, scaleFactor=FACE_DETECT_SCALE_FACTOR, minNeighbors=FACE_DETECT_MIN_NEIGHBORS):
+        self.scaleFactor = scaleFactor
+        self.minNeighbors = minNeighbors
+        self.cascade = cv2.CascadeClassifier(self.path) if self.available() else None
+
+    def available(self):
+        return os.path.isfile(self.path)
+
+    def detect(self, gray, min_size):
+        return [tuple(box) for box in self.cascade.detectMultiScale(gray, scaleFactor=self.scaleFactor,
+                                                                    minNeighbors=self.minNeighbors, minSize=min_size)]
+
+
+# Same cascade machinery with integer LBP features: faster, a little less accurate
+class LbpDetector(HaarDetector):
+    name = "lbp"
+    path = LBP_PATH
+
+
+# YuNet, a small CNN run by OpenCV's DNN module on the CPU
+class DnnDetector(Detector):
+    name = "dnn"
+
+    def __init__(self, confidence=FACE_DNN_CONFIDENCE, path=DNN_PATH):
+        self.confidence = confidence
+        self.path = path
+        self.net = None
+        self.size = None
+        self.bgr = None
+
+    def available(self):
+        return os.path.isfile(self.path) and hasattr(cv2, "FaceDetectorYN")
+
+    def detect(self, gray, min_size):
+        size = (gray.shape[1], gray.shape[0])
+        if self.net is None:
+            self.net = cv2.FaceDetectorYN.create(self.path, "", size, self.confidence)
+        if self.size != size:
+            self.net.setInputSize(size)
+            self.size = size
+            self.bgr = None
+        # the network wants three channels; the buffer is reused between frames
+        self.bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=self.bgr)
+        _, faces = self.net.detect(self.bgr)
+        if faces is None:
+            return []
+        boxes = []
+        for face in faces:
+            x, y, w, h = (int(round(v)) for v in face[:4])
+            if w >= min_size[0] and h >= min_size[1]:
+                x, y = max(0, x), max(0, y)
+                boxes.append((x, y, min(w, size[0] - x), min(h, size[1] - y)))
+        return boxes
+
+
+BACKENDS = {cls.name: cls for cls in (HaarDetector, LbpDetector, DnnDetector)}
+
+
+def calibrated():
+    try:
+        with open(FACE_DETECTOR_PROFILE_PATH) as f:
+            return json.load(f)["detector"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# Detector by name; without one, the backend calibrate() picked, or FACE_DETECTOR
+def create_detector(name=None, **profile):
+    name = name or calibrated() or FACE_DETECTOR
+    detector = BACKENDS[name](**profile)
+    if not detector.available():
+        raise FileNotFoundError(detector.missing())
+    return detector
+
+
+def fetch():
+    from urllib import request as urlrequest
+
+    for filename, url in MODEL_URLS.items():
+        target = os.path.join(BASE_DIR, filename)
+        if os.path.isfile(target):
+            print(f"{filename}: already there")
+            continue
+        print(f"{filename}: downloading {url}")
+        with urlrequest.urlopen(url, timeout=60) as resp, open(target + ".tmp", "wb") as f:
+            f.write(resp.read())
+        os.replace(target + ".tmp", target)
+    print("run python -m engine.auth.detectors calibrate to compare the backends")
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    return w * h / float(aw * ah + bw * bh - w * h)
+
+
+# Time every available backend on frames with known face positions, at the
+# size the pipeline detects on, and keep the fastest that is accurate enough
+def calibrate(faces, frames=150, min_recall=FACE_DETECTOR_MIN_RECALL, min_precision=FACE_DETECTOR_MIN_PRECISION,
+              save=True):
+    from engine.auth.bench import synthetic_frames
+
+    clip = []
+    for frame, box in synthetic_frames(faces, frames):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=FACE_DETECT_SCALE, fy=FACE_DETECT_SCALE, interpolation=cv2.INTER_AREA)
+        clip.append((small, tuple(int(v * FACE_DETECT_SCALE) for v in box)))
+    side = int(min(clip[0][0].shape) * FACE_DETECT_MIN_SIZE)
+
+    results = {}
+    for name, cls in BACKENDS.items():
+        detector = cls()
+        if not detector.available():
+            print(detector.missing())
+            results[name] = {"available": False, "missing": detector.path}
+            continue
+        detector.detect(clip[0][0], (side, side))  # load lazily created models outside the timing
+        found = hits = 0
+        started = time.perf_counter()
+        for small, truth in clip:
+            boxes = detector.detect(small, (side, side))
+            found += len(boxes)
+            hits += any(_iou(box, truth) >= 0.5 for box in boxes)
+        ms = 1000 * (time.perf_counter() - started) / len(clip)
+        recall, precision = hits / len(clip), hits / found if found else 0.0
+        results[name] = {"available": True, "ms_per_frame": round(ms, 2), "recall": round(recall, 3),
+                         "precision": round(precision, 3),
+                         "passes": recall >= min_recall and precision >= min_precision}
+
+    passing = [name for name, result in results.items() if result.get("passes")]
+    usable = [name for name, result in results.items() if result["available"]]
+    if passing:
+        chosen = min(passing, key=lambda name: results[name]["ms_per_frame"])
+    else:
+        # nothing meets the floor: take the most accurate one there is
+        chosen = max(usable, key=lambda name: (results[name]["recall"], results[name]["precision"]))
+    if save:
+        os.makedirs(os.path.dirname(FACE_DETECTOR_PROFILE_PATH) or ".", exist_ok=True)
+        with open(FACE_DETECTOR_PROFILE_PATH, "w") as f:
+            json.dump({"detector": chosen, "results": results, "calibrated": time.strftime("%Y-%m-%d %H:%M:%S")},
+                      f, indent=2)
+    return chosen, results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Face detector backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    command = sub.add_parser("calibrate", help="benchmark every backend here and remember the best one")
+    command.add_argument("--user", type=int, default=1, help="user whose samples make the test clip")
+    command.add_argument("--frames", type=int, default=150)
+    sub.add_parser("show", help="print the backend in use")
+    sub.add_parser("fetch", help="download the lbp and dnn model files next to this file")
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        from engine.auth.bench import owner_samples
+
+        chosen, results = calibrate(owner_samples(args.user), args.frames)
+        for name, result in results.items():
+            print(f"{name:>5}: {result}")
+        print(f"using {chosen}, saved to {FACE_DETECTOR_PROFILE_PATH}")
+    elif args.command == "fetch":
+        fetch()
+    else:
+        print(create_detector().name, "(calibrated)" if calibrated() else "(from config)")
@@ -0,0 +1,133 @@
+# Run from the project folder after sample.py: python -m engine.auth.enroll <user id>
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from engine.auth import modelfile, trainer
+from engine.auth.matcher import BINS, GRID, NEIGHBORS, RADIUS, FaceMatcher, extract
+from engine.auth.users import getUsers
+
+MODEL_DIR = os.path.dirname(trainer.trainer_path)
+STATE_PATH = os.path.join(MODEL_DIR, 'model.json')
+
+
+# The face model is trainer.lbph (the last full training) plus the enrollments
+# made since, each stored as a small binary model (enroll.<version>.lbph) with
+# the histograms of just the new faces. model.json says which,
+# and which sample files are in the model already:
+#   {"version": 7, "base_version": 5, "deltas": [{"version": 6, "file": ...}, ...],
+#    "enrolled": ["face.1.1.jpg", ...]}
+# Every write bumps "version"; a full retrain bumps "base_version" as well.
+# model.json isn't in git, so enrolling leaves the tracked files alone.
+def read_state():
+    try:
+        with open(STATE_PATH) as f:
+            return dict({"enrolled": []}, **json.load(f))
+    except (OSError, ValueError):
+        return {"version": 0, "base_version": 0, "deltas": [], "enrolled": []}
+
+
+def write_state(state):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    tmp_path = STATE_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, STATE_PATH)
+
+
+# Called by trainer.py once a new trainer.lbph is in place, with the sample files it was trained on
+def commit_base(files):
+    state = read_state()
+    version = state["version"] + 1
+    write_state({"version": version, "base_version": version, "deltas": [], "enrolled": sorted(files)})
+    for delta in state["deltas"]:
+        try:
+            os.remove(os.path.join(MODEL_DIR, delta["file"]))
+        except OSError:
+            pass
+    return version
+
+
+# (histograms, labels) of one enrollment, computed by enroll(): loading only maps the file
+def load_delta(delta):
+    histograms, labels, _ = modelfile.load(os.path.join(MODEL_DIR, delta["file"]))
+    return histograms, labels
+
+
+def apply_deltas(matcher, deltas):
+    for delta in deltas:
+        matcher.add(*load_delta(delta))
+    return matcher
+
+
+# FaceMatcher for the current model. The binary trainer.lbph is mapped straight
+# from disk; a trainer.yml from before it existed is still read through OpenCV.
+def load_model(model_path=trainer.model_path):
+    state = read_state()
+    yaml_path = os.path.splitext(model_path)[0] + '.yml'
+    if os.path.isfile(model_path):
+        histograms, labels, header = modelfile.load(model_path)
+        params = tuple(header[key] for key in ("radius", "neighbors", "grid_x", "grid_y"))
+        if params != (RADIUS, NEIGHBORS) + GRID:
+            raise modelfile.ModelFileError(f"{model_path} uses radius, neighbors, grid {params}, the matcher expects "
+                                           f"{(RADIUS, NEIGHBORS) + GRID}")
+        matcher = FaceMatcher(histograms, labels)
+    elif os.path.isfile(yaml_path):
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(yaml_path)
+        matcher = FaceMatcher.from_recognizer(recognizer)
+    elif state["deltas"]:
+        matcher = FaceMatcher(None, [])
+    else:
+        raise FileNotFoundError(f"Trainer file not found at {model_path}")
+    return apply_deltas(matcher, state["deltas"]), state
+
+
+# Add the samples of one user that aren't in the model yet. Only those files
+# are decoded and written, so the time doesn't depend on how many samples the
+# model already has.
+def enroll(user_id):
+    started = time.perf_counter()
+    manifest = trainer.load_manifest()
+    state = read_state()
+    enrolled = set(state["enrolled"])
+    files = sorted(name for name, meta in manifest.items() if meta.get('user') == user_id and name not in enrolled)
+    if not files:
+        print(f"No new samples for user {user_id}, take some with: python -m engine.auth.sample")
+        return None
+
+    trainer.init_worker()
+    faces = []
+    for name in files:
+        faces += trainer.prepare_sample((os.path.join(trainer.path, name), manifest[name].get('crop', False)))
+
+    version = state["version"] + 1
+    delta = f"enroll.{version}.lbph"
+    # like LBPH update(), only the new faces get histograms, and they are computed once here
+    histograms = extract(faces) if faces else np.empty((0, GRID[0] * GRID[1] * BINS), np.float32)
+    modelfile.save(os.path.join(MODEL_DIR, delta), histograms, np.full(len(faces), user_id, np.int32),
+                   RADIUS, NEIGHBORS, *GRID)
+    state["version"] = version
+    state["deltas"].append({"version": version, "file": delta, "user": user_id, "samples": len(faces)})
+    state["enrolled"] = sorted(enrolled.union(files))
+    write_state(state)  # the running assistant picks the new version up from here
+
+    print(f"Enrolled {len(faces)} faces from {len(files)} new sample files of user {user_id} as model version {version} "
+          f"in {time.perf_counter() - started:.2f}s")
+    return version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Add newly taken samples to the face model without retraining")
+    parser.add_argument("user", type=int, help="numeric user ID used in sample.py")
+    parser.add_argument("--name", help="name to greet the user with")
+    parser.add_argument("--guest", action="store_true", help="recognise this user but don't let them unlock")
+    args = parser.parse_args()
+    if args.name:
+        getUsers().add(args.user, args.name, owner=not args.guest)
+    enroll(args.user)
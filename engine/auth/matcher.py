@@ -0,0 +1,216 @@
+import time
+
+import cv2
+import numpy as np
+
+from engine.config import FACE_MATCH_CANDIDATES, FACE_MATCH_MARGIN, FACE_MATCH_SHORTLIST, FACE_MATCH_SHORTLIST_MAX
+
+FACE_SIZE = (200, 200)  # same as the trainer, so every histogram has the same cells
+RADIUS = 1
+NEIGHBORS = 8
+GRID = (8, 8)
+BINS = 2 ** NEIGHBORS
+
+
+# Circular LBP codes for a batch of equally sized grey faces, computed the
+# way OpenCV's LBPH does (float32 bilinear samples, ties count as brighter)
+def lbp_codes(faces, radius=RADIUS, neighbors=NEIGHBORS):
+    src = faces.astype(np.float32)
+    _, h, w = src.shape
+    center = src[:, radius:h - radius, radius:w - radius]
+    codes = np.zeros(center.shape, np.int32)
+    one, eps = np.float32(1), np.finfo(np.float32).eps
+    for n in range(neighbors):
+        x = np.float32(radius * np.cos(2 * np.pi * n / neighbors))
+        y = np.float32(-radius * np.sin(2 * np.pi * n / neighbors))
+        fx, fy, cx, cy = int(np.floor(x)), int(np.floor(y)), int(np.ceil(x)), int(np.ceil(y))
+        tx, ty = np.float32(x - fx), np.float32(y - fy)
+
+        def at(dy, dx):
+            return src[:, radius + dy:h - radius + dy, radius + dx:w - radius + dx]
+
+        t = ((one - tx) * (one - ty) * at(fy, fx) + tx * (one - ty) * at(fy, cx)
+             + (one - tx) * ty * at(cy, fx) + tx * ty * at(cy, cx))
+        codes |= ((t > center) | (np.abs(t - center) < eps)).astype(np.int32) << n
+    return codes
+
+
+# One normalised 256-bin histogram per grid cell, concatenated row by row
+def spatial_histograms(codes, grid=GRID):
+    n, h, w = codes.shape
+    gx, gy = grid
+    ch, cw = h // gy, w // gx
+    cells = codes[:, :gy * ch, :gx * cw].reshape(n, gy, ch, gx, cw).transpose(0, 1, 3, 2, 4).reshape(n, gy * gx, -1)
+    offsets = (np.arange(n * gy * gx) * BINS).reshape(n, gy * gx, 1)
+    counts = np.bincount((cells + offsets).ravel(), minlength=n * gy * gx * BINS)
+    return (counts.astype(np.float32) / np.float32(ch * cw)).reshape(n, -1)
+
+
+# LBPH histograms for face crops of any size
+def extract(faces):
+    batch = np.empty((len(faces), FACE_SIZE[1], FACE_SIZE[0]), np.uint8)
+    for i, face in enumerate(faces):
+        cv2.resize(face, FACE_SIZE, dst=batch[i], interpolation=cv2.INTER_AREA)
+    return spatial_histograms(lbp_codes(batch))
+
+
+# Same as cv2.compareHist(..., cv2.HISTCMP_CHISQR_ALT), which LBPH predict uses
+def chi_square(query, histograms):
+    total = histograms + query
+    diff = histograms - query
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(total > 0, diff * diff / total, 0)
+    return 2 * terms.sum(axis=1)
+
+
+# Nearest-neighbour search over every stored LBPH histogram.
+#
+# Histograms live in one float32 matrix sorted by user, so each user's samples
+# are a contiguous slice. A query first goes to the few users whose mean
+# square-root histogram is closest (one matrix product for all faces in the
+# frame), then to their samples ranked the same way, and only the best
+# candidates get the exact chi-square distance LBPH reports. The shortlist
+# widens when it's a close call: every user whose centroid is within `margin`
+# of the best one is searched too, up to `widest` users.
+class FaceMatcher:
+    def __init__(self, histograms, labels, shortlist=FACE_MATCH_SHORTLIST, candidates=FACE_MATCH_CANDIDATES,
+                 margin=FACE_MATCH_MARGIN, widest=FACE_MATCH_SHORTLIST_MAX):
+        self.shortlist = shortlist
+        self.candidates = candidates
+        self.margin = margin
+        self.widest = max(widest, shortlist)
+        self.histograms = np.empty((0, GRID[0] * GRID[1] * BINS), np.float32)
+        self.labels = np.empty(0, np.int32)
+        self.add(histograms, labels)
+
+    @classmethod
+    def from_recognizer(cls, recognizer, **kwargs):
+        params = (recognizer.getRadius(), recognizer.getNeighbors(), recognizer.getGridX(), recognizer.getGridY())
+        if params != (RADIUS, NEIGHBORS) + GRID:
+            raise ValueError(f"LBPH model uses radius, neighbors, grid {params}, the matcher expects "
+                             f"{(RADIUS, NEIGHBORS) + GRID}")
+        histograms = recognizer.getHistograms()
+        histograms = np.vstack([h.reshape(1, -1) for h in histograms]) if histograms else None
+        return cls(histograms, recognizer.getLabels().ravel(), **kwargs)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, histograms, labels):
+        if histograms is None or not len(labels):
+            return self
+        labels = np.asarray(labels, np.int32).ravel()
+        if not len(self.labels) and np.all(labels[:-1] <= labels[1:]):
+            # already sorted (a binary model file): use the arrays as they are, even if memory mapped
+            self.histograms = np.asarray(histograms, np.float32)
+            self.labels = labels
+        else:
+            labels = np.concatenate([self.labels, labels])
+            order = np.argsort(labels, kind='stable')
+            self.histograms = np.ascontiguousarray(np.concatenate([self.histograms, histograms])[order], np.float32)
+            self.labels = labels[order]
+        self.users, starts = np.unique(self.labels, return_index=True)
+        self.bounds = np.append(starts, len(self.labels))
+        self.centroids = np.empty((len(self.users), self.histograms.shape[1]), np.float32)
+        for i in range(len(self.users)):
+            self.centroids[i] = np.sqrt(self.histograms[self.bounds[i]:self.bounds[i + 1]]).mean(axis=0)
+        return self
+
+    # (labels, distances) for a batch of query histograms; label -1 when empty
+    def match(self, queries, exact=False):
+        labels = np.full(len(queries), -1, np.int32)
+        distances = np.full(len(queries), np.inf, np.float32)
+        if not len(self.labels) or not len(queries):
+            return labels, distances
+        roots = np.sqrt(queries)
+        if exact or len(self.users) <= self.shortlist:
+            users = np.tile(np.arange(len(self.users)), (len(queries), 1))
+        else:
+            similarity = roots @ self.centroids.T
+            widest = min(self.widest, len(self.users))
+            closest = np.argpartition(-similarity, widest - 1, axis=1)[:, :widest]
+            users = []
+            for q in range(len(queries)):
+                ranked = closest[q][np.argsort(-similarity[q, closest[q]])]
+                close = np.count_nonzero(similarity[q, ranked] >= similarity[q, ranked[0]] * (1 - self.margin))
+                users.append(ranked[:max(self.shortlist, close)])
+        for q, query in enumerate(queries):
+            rows = np.concatenate([np.arange(self.bounds[u], self.bounds[u + 1]) for u in users[q]])
+            if not exact and len(rows) > self.candidates:
+                similarity = np.sqrt(self.histograms[rows]) @ roots[q]
+                rows = rows[np.argpartition(-similarity, self.candidates - 1)[:self.candidates]]
+            scores = chi_square(query, self.histograms[rows])
+            best = int(np.argmin(scores))
+            labels[q], distances[q] = self.labels[rows[best]], scores[best]
+        return labels, distances
+
+    # Like recognizer.predict, but for every face of a frame at once
+    def predict(self, faces):
+        return self.match(extract(faces))
+
+
+# recognizer.predict in a loop vs the matcher, for a growing number of users.
+# Users are made from the real samples with a per-user warp, so they differ
+# like different faces would while staying face-like.
+def benchmark(samples_path, users=(1, 10, 100, 1000), per_user=5, frames=20, faces_per_frame=2, seed=0):
+    import glob
+
+    rng = np.random.default_rng(seed)
+    crops = [cv2.resize(cv2.imread(p, cv2.IMREAD_GRAYSCALE), FACE_SIZE, interpolation=cv2.INTER_AREA)
+             for p in sorted(glob.glob(samples_path + '/*.jpg'))]
+    if not crops:
+        raise FileNotFoundError(f"No samples in {samples_path}")
+    warps = {}
+
+    def face(user):
+        if user not in warps:
+            angle, scale = rng.uniform(-25, 25), rng.uniform(0.8, 1.2)
+            warps[user] = (crops[user % len(crops)], cv2.getRotationMatrix2D((100, 100), angle, scale),
+                           rng.uniform(0.7, 1.3))
+        base, matrix, gain = warps[user]
+        jitter = matrix.copy()
+        jitter[:, 2] += rng.normal(0, 2, 2)
+        img = cv2.warpAffine(base, jitter, FACE_SIZE, borderMode=cv2.BORDER_REFLECT) * gain
+        return np.clip(img + rng.normal(0, 6, img.shape), 0, 255).astype(np.uint8)
+
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    matcher = FaceMatcher(None, [])
+    enrolled = 0
+    results = {}
+    for count in users:
+        new = [(user, face(user)) for user in range(enrolled, count) for _ in range(per_user)]
+        faces, labels = [f for _, f in new], np.array([u for u, _ in new], np.int32)
+        (recognizer.update if enrolled else recognizer.train)(faces, labels)
+        matcher.add(extract(faces), labels)
+        enrolled = count
+
+        truth = rng.integers(0, count, (frames, faces_per_frame))
+        queries = [[face(int(user)) for user in frame] for frame in truth]
+
+        started = time.perf_counter()
+        opencv = np.array([[recognizer.predict(f)[0] for f in frame] for frame in queries])
+        opencv_ms = 1000 * (time.perf_counter() - started) / frames
+
+        started = time.perf_counter()
+        fast = np.array([matcher.predict(frame)[0] for frame in queries])
+        fast_ms = 1000 * (time.perf_counter() - started) / frames
+
+        results[count] = {"samples": len(matcher), "opencv_ms_per_frame": round(opencv_ms, 2),
+                          "matcher_ms_per_frame": round(fast_ms, 2),
+                          "same_as_opencv": round(float((fast == opencv).mean()), 3),
+                          "accuracy": round(float((fast == truth).mean()), 3)}
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from engine.auth.trainer import path
+
+    parser = argparse.ArgumentParser(description="Benchmark LBPH identification against many enrolled users")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--per-user", type=int, default=5, help="samples enrolled per user")
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+    for count, result in benchmark(path, args.users, args.per_user, args.frames).items():
+        print(f"{count:>5} users: {result}")
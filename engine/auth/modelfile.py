@@ -0,0 +1,157 @@
+# Run from the project folder: python -m engine.auth.modelfile --help
+import json
+import os
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+MAGIC = b"LBPHFACE"
+FORMAT_VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct("<8sII")  # magic, format version, header length
+
+
+class ModelFileError(Exception):
+    pass
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _checksum(*arrays):
+    crc = 0
+    for array in arrays:
+        crc = zlib.crc32(memoryview(np.ascontiguousarray(array)).cast("B"), crc)
+    return crc
+
+
+# Binary LBPH model: a short JSON header with the parameters, then the labels
+# (int32) and the histograms (float32, one row per sample), both raw and
+# 64-byte aligned so load() can map them instead of parsing anything. Rows
+# are sorted by label, the order FaceMatcher keeps them in.
+def save(path, histograms, labels, radius=1, neighbors=8, grid_x=8, grid_y=8, threshold=float(np.finfo(np.float64).max)):
+    labels = np.asarray(labels, np.int32).ravel()
+    histograms = np.asarray(histograms, np.float32).reshape(len(labels), -1)
+    order = np.argsort(labels, kind="stable")
+    labels, histograms = labels[order], np.ascontiguousarray(histograms[order])
+
+    header = {"radius": radius, "neighbors": neighbors, "grid_x": grid_x, "grid_y": grid_y, "threshold": threshold,
+              "count": len(labels), "dim": histograms.shape[1], "crc32": _checksum(labels, histograms)}
+    # offsets depend on the header length, so settle them before writing
+    for _ in range(2):
+        text = json.dumps(header).encode("utf-8")
+        header["labels_offset"] = _aligned(_PREFIX.size + len(text))
+        header["histograms_offset"] = _aligned(header["labels_offset"] + labels.nbytes)
+    text = json.dumps(header).encode("utf-8")
+    if _PREFIX.size + len(text) > header["labels_offset"]:
+        raise ModelFileError("header grew while laying out the file")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(text)))
+        f.write(text)
+        f.seek(header["labels_offset"])
+        f.write(labels.tobytes())
+        f.seek(header["histograms_offset"])
+        f.write(histograms.tobytes())
+    os.replace(tmp_path, path)  # readers see the old file or the new one, never half of it
+    return header
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise ModelFileError(f"{path} is too short to be a face model")
+        magic, version, length = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ModelFileError(f"{path} is not a binary face model")
+        if version != FORMAT_VERSION:
+            raise ModelFileError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+        return json.loads(f.read(length).decode("utf-8"))
+
+
+# (histograms, labels, header) with both arrays mapped read-only from the file
+def load(path, verify=True):
+    header = read_header(path)
+    count, dim = header["count"], header["dim"]
+    if os.path.getsize(path) < header["histograms_offset"] + count * dim * 4:
+        raise ModelFileError(f"{path} is truncated")
+    if count == 0:
+        return np.empty((0, dim), np.float32), np.empty(0, np.int32), header
+    labels = np.memmap(path, np.int32, "r", header["labels_offset"], (count,))
+    histograms = np.memmap(path, np.float32, "r", header["histograms_offset"], (count, dim))
+    if verify and _checksum(labels, histograms) != header["crc32"]:
+        raise ModelFileError(f"{path} failed its checksum, retrain or convert the model again")
+    return histograms, labels, header
+
+
+def from_recognizer(recognizer, path):
+    histograms = recognizer.getHistograms()
+    histograms = np.vstack([h.reshape(1, -1) for h in histograms]) if histograms else np.empty((0, 0), np.float32)
+    return save(path, histograms, recognizer.getLabels().ravel(), recognizer.getRadius(), recognizer.getNeighbors(),
+                recognizer.getGridX(), recognizer.getGridY(), recognizer.getThreshold())
+
+
+def from_yaml(yaml_path, path):
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(yaml_path)
+    return from_recognizer(recognizer, path)
+
+
+# Write the layout recognizer.write() produces, so recognizer.read() accepts it
+def to_yaml(path, yaml_path):
+    histograms, labels, header = load(path)
+    fs = cv2.FileStorage(yaml_path, cv2.FILE_STORAGE_WRITE)
+    fs.startWriteStruct("opencv_lbphfaces", cv2.FILE_NODE_MAP)
+    fs.write("threshold", float(header["threshold"]))
+    for key in ("radius", "neighbors", "grid_x", "grid_y"):
+        fs.write(key, int(header[key]))
+    fs.startWriteStruct("histograms", cv2.FILE_NODE_SEQ)
+    for row in histograms:
+        fs.write("", np.array(row).reshape(1, -1))
+    fs.endWriteStruct()
+    fs.write("labels", np.array(labels).reshape(-1, 1))
+    fs.startWriteStruct("labelsInfo", cv2.FILE_NODE_SEQ)
+    fs.endWriteStruct()
+    fs.endWriteStruct()
+    fs.release()
+
+
+# Load time of the YAML model vs the binary one
+def benchmark(yaml_path, path):
+    import time
+
+    started = time.perf_counter()
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(yaml_path)
+    yaml_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    histograms, labels, _ = load(path)
+    binary_seconds = time.perf_counter() - started
+    return {"samples": len(labels), "yaml_ms": round(1000 * yaml_seconds, 1), "yaml_mb": round(os.path.getsize(yaml_path) / 2**20, 1),
+            "binary_ms": round(1000 * binary_seconds, 1), "binary_mb": round(os.path.getsize(path) / 2**20, 1)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert face models between OpenCV YAML and the binary format")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("to-binary", "YAML model -> binary"), ("to-yaml", "binary model -> YAML"),
+                            ("bench", "compare load times of a YAML model and its binary copy")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("yaml" if name != "to-yaml" else "binary")
+        command.add_argument("binary" if name != "to-yaml" else "yaml")
+    args = parser.parse_args()
+    if args.command == "to-binary":
+        print(from_yaml(args.yaml, args.binary))
+    elif args.command == "to-yaml":
+        to_yaml(args.binary, args.yaml)
+        print("written", args.yaml)
+    else:
+        print(benchmark(args.yaml, args.binary))
@@ -0,0 +1,181 @@
+import time
+
+import cv2
+import numpy as np
+
+from engine.config import (FACE_DETECT_MIN_SIZE, FACE_DETECT_SCALE, FACE_MOTION_THRESHOLD, FACE_REDETECT_EVERY,
+                           FACE_TRACK_MIN_SCORE)
+
+
+class FaceTrack:
+    def __init__(self, box, template):
+        self.box = box  # (x, y, w, h) in full resolution
+        self.template = template  # face patch from the downscaled frame
+        self.changed = True  # False while the scene is still, so the last prediction still holds
+        self.label = None
+        self.confidence = None
+
+
+# Detect once, then follow the face with template matching. Detection runs on
+# a downscaled frame, only every few frames, and not at all while frame
+# differencing says nothing in view has moved. All per-frame images are
+# written into buffers allocated for the first frame.
+class FacePipeline:
+    def __init__(self, detector, scale=FACE_DETECT_SCALE, redetect_every=FACE_REDETECT_EVERY,
+                 motion_threshold=FACE_MOTION_THRESHOLD, min_size=FACE_DETECT_MIN_SIZE):
+        self.detector = detector  # see detectors.py
+        self.scale = scale
+        self.redetect_every = redetect_every
+        self.motion_threshold = motion_threshold
+        self.min_size = min_size
+        self.shape = None
+        self.tracks = []
+        self.since_detect = 0
+        self.stats = {"frames": 0, "detections": 0, "tracked": 0, "still": 0}
+
+    def _allocate(self, shape):
+        h, w = shape[:2]
+        self.shape = shape
+        self.gray = np.empty((h, w), np.uint8)
+        self.small_size = (max(1, int(w * self.scale)), max(1, int(h * self.scale)))
+        self.small = np.empty(self.small_size[::-1], np.uint8)
+        self.previous = np.zeros_like(self.small)
+        self.diff = np.empty_like(self.small)
+        side = int(min(self.small_size) * self.min_size)
+        self.min_face = (side, side)
+        self.tracks = []
+        self.since_detect = self.redetect_every
+
+    # share of pixels whose grey level changed noticeably since the last frame
+    def motion(self):
+        cv2.absdiff(self.small, self.previous, dst=self.diff)
+        cv2.threshold(self.diff, 15, 255, cv2.THRESH_BINARY, dst=self.diff)
+        return cv2.countNonZero(self.diff) / self.diff.size
+
+    def _detect(self):
+        self.stats["detections"] += 1
+        self.since_detect = 0
+        faces = self.detector.detect(self.small, self.min_face)
+        tracks = []
+        for (x, y, w, h) in faces:
+            template = self.small[y:y + h, x:x + w].copy()
+            box = tuple(int(round(v / self.scale)) for v in (x, y, w, h))
+            tracks.append(FaceTrack(box, template))
+        self.tracks = tracks
+
+    def _track(self):
+        self.stats["tracked"] += 1
+        height, width = self.small.shape
+        kept = []
+        for track in self.tracks:
+            th, tw = track.template.shape
+            x, y = int(track.box[0] * self.scale), int(track.box[1] * self.scale)
+            # search an area twice the face size around the last position
+            x0, y0 = max(0, x - tw // 2), max(0, y - th // 2)
+            x1, y1 = min(width, x + tw + tw // 2), min(height, y + th + th // 2)
+            window = self.small[y0:y1, x0:x1]
+            if window.shape[0] < th or window.shape[1] < tw:
+                continue
+            scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+            _, best, _, (bx, by) = cv2.minMaxLoc(scores)
+            if best < FACE_TRACK_MIN_SCORE:
+                continue
+            nx, ny = x0 + bx, y0 + by
+            track.box = (int(round(nx / self.scale)), int(round(ny / self.scale)), track.box[2], track.box[3])
+            track.changed = True
+            kept.append(track)
+        lost = len(kept) < len(self.tracks)
+        self.tracks = kept
+        return lost
+
+    # Faces in frame as FaceTrack objects; self.gray holds the frame in grayscale
+    def process(self, frame):
+        if self.shape != frame.shape:
+            self._allocate(frame.shape)
+        self.stats["frames"] += 1
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        self.previous, self.small = self.small, self.previous
+        cv2.resize(self.gray, self.small_size, dst=self.small, interpolation=cv2.INTER_AREA)
+        self.since_detect += 1
+
+        first = self.stats["frames"] == 1
+        if not first and self.motion() < self.motion_threshold:
+            # nothing moved: faces (or their absence) are where they were
+            self.stats["still"] += 1
+            for track in self.tracks:
+                track.changed = False
+            return self.tracks
+
+        if not self.tracks or self.since_detect >= self.redetect_every:
+            self._detect()
+        elif self._track():
+            self._detect()
+        return self.tracks
+
+    def reset(self):
+        self.shape = None
+        self.tracks = []
+        self.stats = dict.fromkeys(self.stats, 0)
+
+
+# Replays a video through the old full-frame loop and through the pipeline
+def benchmark(video_path, detector, recognizer=None, max_frames=None):
+    results = {}
+    for mode in ("full-frame", "pipeline"):
+        video = cv2.VideoCapture(video_path)
+        pipeline = FacePipeline(detector)
+        frames = predictions = 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        while max_frames is None or frames < max_frames:
+            ok, frame = video.read()
+            if not ok:
+                break
+            frames += 1
+            if mode == "full-frame":
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                side = int(FACE_DETECT_MIN_SIZE * min(gray.shape))
+                faces = detector.detect(gray, (side, side))
+                for (x, y, w, h) in faces:
+                    if recognizer is not None:
+                        recognizer.predict(gray[y:y + h, x:x + w])
+                    predictions += 1
+            else:
+                for track in pipeline.process(frame):
+                    if not track.changed:
+                        continue
+                    x, y, w, h = track.box
+                    if recognizer is not None:
+                        recognizer.predict(pipeline.gray[y:y + h, x:x + w])
+                    predictions += 1
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        video.release()
+        results[mode] = {
+            "frames": frames,
+            "fps": round(frames / wall, 1) if wall else 0.0,
+            "cpu_percent": round(100 * cpu / wall, 1) if wall else 0.0,
+            "cpu_ms_per_frame": round(1000 * cpu / frames, 2) if frames else 0.0,
+            "predictions": predictions,
+        }
+        if mode == "pipeline":
+            results[mode].update(pipeline.stats)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from engine.auth.detectors import create_detector
+    from engine.auth.trainer import trainer_path
+
+    parser = argparse.ArgumentParser(description="Compare the full-frame face loop with the detect-then-track pipeline")
+    parser.add_argument("video", help="recorded video file")
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    args = parser.parse_args()
+
+    recognizer = None
+    if os.path.isfile(trainer_path):  # python -m engine.auth.trainer --yaml
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(trainer_path)
+    for mode, result in benchmark(args.video, create_detector(), recognizer, args.frames).items():
+        print(f"{mode:>10}: {result}")
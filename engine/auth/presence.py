@@ -0,0 +1,278 @@
+import sys
+import threading
+import time
+
+import cv2
+
+from engine.auth.decision import _log_normal
+from engine.auth.detectors import create_detector
+from engine.auth.users import getUsers
+from engine.config import (FACE_DETECT_MIN_SIZE, FACE_GENUINE_DISTANCE, FACE_IMPOSTOR_DISTANCE,
+                           FACE_PRESENCE_ABSENT_AFTER, FACE_PRESENCE_FPS, FACE_PRESENCE_INTERVAL, FACE_PRESENCE_LOCK,
+                           FACE_PRESENCE_MAX_CPU, FACE_PRESENCE_MOTION, FACE_PRESENCE_RELEASE_CAMERA,
+                           FACE_PRESENCE_RELEASE_MIN_INTERVAL, FACE_PRESENCE_SCALE, FACE_PRESENCE_WARMUP_FRAMES)
+
+PRESENT = "present"
+ABSENT = "absent"
+
+
+# One frame now and then from a camera kept open at a low frame rate, so a
+# sample costs a grab instead of an open. The first frames after opening are
+# dark while exposure settles and are thrown away; before each read the frame
+# the driver buffered since the last sample is dropped. With `release` on the
+# camera is opened for each read and closed right after instead, so between
+# samples the LED is off and video calls can use it. Face auth closes it
+# through CameraManager.share() when it needs the device.
+class SampledCamera:
+    def __init__(self, index, backend, warmup=FACE_PRESENCE_WARMUP_FRAMES, release=FACE_PRESENCE_RELEASE_CAMERA):
+        self.index = index
+        self.backend = backend
+        self.warmup = warmup
+        self.release = release
+        self.cam = None
+        self.lock = threading.Lock()
+
+    def _open(self):
+        cam = cv2.VideoCapture(self.index, self.backend)
+        if not cam.isOpened():
+            cam.release()
+            return None  # busy in another app: skip this sample
+        cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        cam.set(cv2.CAP_PROP_FPS, FACE_PRESENCE_FPS)
+        for _ in range(self.warmup):
+            cam.grab()
+        return cam
+
+    def read(self):
+        with self.lock:
+            if self.cam is None:
+                self.cam = self._open()
+                if self.cam is None:
+                    return None
+            else:
+                self.cam.grab()  # stale: taken whenever the driver last had a free buffer
+            ok, frame = self.cam.read()
+            if not ok or self.release:
+                self.cam.release()
+                self.cam = None
+            return frame if ok else None
+
+    # Give the device up; the next read() opens it again
+    def close(self):
+        with self.lock:
+            if self.cam is not None:
+                self.cam.release()
+                self.cam = None
+
+    def stop(self):
+        self.close()
+
+
+def lock_screen():
+    if sys.platform == "win32":
+        import ctypes
+        ctypes.windll.user32.LockWorkStation()
+
+
+# Checks every `interval` seconds that the owner is still in front of the
+# screen, doing as little as it can: a frame that looks like the last one
+# keeps the last verdict, only a changed frame is searched for faces, and only
+# a face gets the LBPH match. After `absent_after` samples in a row without
+# the owner, on_absent() runs once. When sampling uses more than `max_cpu`
+# percent of a core the interval stretches to stay under it. That is process
+# CPU time, as OpenCV runs detection on threads of its own.
+class PresenceMonitor:
+    def __init__(self, service, source=None, on_absent=None, interval=FACE_PRESENCE_INTERVAL,
+                 absent_after=FACE_PRESENCE_ABSENT_AFTER, max_cpu=FACE_PRESENCE_MAX_CPU, scale=FACE_PRESENCE_SCALE,
+                 motion_threshold=FACE_PRESENCE_MOTION):
+        self.service = service
+        self.source = source
+        self.on_absent = on_absent
+        self.interval = interval
+        self.absent_after = absent_after
+        self.max_cpu = max_cpu
+        self.scale = scale
+        self.motion_threshold = motion_threshold
+        self.detector = None
+        self.previous = None
+        self.state = PRESENT  # the monitor starts right after a successful auth
+        self.misses = 0
+        self.running = False
+        self.thread = None
+        self.started = None
+        self.busy = 0.0
+        self.cpu = 0.0
+        self.stats = {"samples": 0, "still": 0, "detections": 0, "recognitions": 0, "absences": 0}
+
+    def start(self):
+        if self.source is None:
+            from engine.auth.camera import getManager
+            cached = getManager()._cached()
+            if cached is None:
+                print("presence: no camera known yet, not monitoring")
+                return self
+            self.source = SampledCamera(*cached)
+            getManager().share(self.source)
+            if self.source.release and self.interval < FACE_PRESENCE_RELEASE_MIN_INTERVAL:
+                # every open costs seconds and blinks the LED: sample less often, after the same absence
+                self.absent_after = max(1, round(self.absent_after * self.interval / FACE_PRESENCE_RELEASE_MIN_INTERVAL))
+                self.interval = FACE_PRESENCE_RELEASE_MIN_INTERVAL
+        self.service.preload()
+        self.detector = create_detector()
+        self.running = True
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name="presence", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 2)
+        if self.source is not None:
+            self.source.stop()
+
+    def _run(self):
+        while self.running:
+            wall, cpu = time.perf_counter(), time.process_time()
+            self.sample()
+            busy, used = time.perf_counter() - wall, time.process_time() - cpu
+            self.busy += busy
+            self.cpu += used
+            # stretch the wait when this sample alone would go over the CPU budget
+            wait = max(self.interval, 100 * used / self.max_cpu if self.max_cpu else 0) - busy
+            time.sleep(max(0.0, wait))
+
+    def _owner_in(self, gray):
+        self.stats["detections"] += 1
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        side = max(1, int(min(small.shape) * FACE_DETECT_MIN_SIZE))
+        boxes = self.detector.detect(small, (side, side))
+        if not boxes:
+            return False
+        service = self.service
+        if not service.ready.is_set() or service.matcher is None:
+            return True  # someone is there; without a model that's the best we know
+        self.stats["recognitions"] += 1
+        crops = [gray[int(y / self.scale):int((y + h) / self.scale), int(x / self.scale):int((x + w) / self.scale)]
+                 for (x, y, w, h) in boxes]
+        with service.auth_lock:
+            labels, distances = service.matcher.predict(crops)
+        # the owner when one face is likelier the owner's than anyone else's,
+        # by the same distance model the full authentication uses
+        owners = getUsers().owners()
+        return any(int(label) in owners and _log_normal(distance, *FACE_GENUINE_DISTANCE) >
+                   _log_normal(distance, *FACE_IMPOSTOR_DISTANCE) for label, distance in zip(labels, distances))
+
+    def sample(self):
+        # face auth takes the lock before the camera, so it can't start while a sample reads
+        if not self.service.auth_lock.acquire(blocking=False):
+            return self.state  # face auth has the camera
+        try:
+            frame = self.source.read()
+        finally:
+            self.service.auth_lock.release()
+        if frame is None:
+            return self.state
+        self.stats["samples"] += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, (64, 48), interpolation=cv2.INTER_AREA)
+        changed = self.previous is None or (cv2.countNonZero(cv2.threshold(cv2.absdiff(thumb, self.previous), 15, 255,
+                                                                           cv2.THRESH_BINARY)[1]) / thumb.size
+                                            >= self.motion_threshold)
+        self.previous = thumb
+        if changed:
+            present = self._owner_in(gray)
+        else:
+            self.stats["still"] += 1
+            present = self.state == PRESENT and self.misses == 0
+        self.misses = 0 if present else self.misses + 1
+        if self.misses >= self.absent_after and self.state == PRESENT:
+            self.state = ABSENT
+            self.stats["absences"] += 1
+            print(f"presence: owner gone for {self.misses} samples")
+            if self.on_absent is not None:
+                self.on_absent()
+        elif present:
+            self.state = PRESENT
+        return self.state
+
+    def report(self):
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        return dict(self.stats, state=self.state, interval=self.interval,
+                    duty_cycle=round(self.busy / elapsed, 4) if elapsed else 0.0,
+                    cpu_percent=round(100 * self.cpu / elapsed, 2) if elapsed else 0.0)
+
+
+_monitor = None
+
+
+# Hold the session once the owner walks away (main.py asks for face auth again),
+# and lock the machine too if FACE_PRESENCE_LOCK is on. Only one monitor runs
+# however often it is called.
+def startMonitor(service):
+    global _monitor
+    from engine.auth import session
+
+    if _monitor is not None and _monitor.running:
+        # signed in again (or the page reloaded): the owner is here
+        _monitor.state, _monitor.misses = PRESENT, 0
+        return _monitor
+
+    def absent():
+        session.hold("owner left")
+        if FACE_PRESENCE_LOCK:
+            lock_screen()
+
+    _monitor = PresenceMonitor(service, on_absent=absent).start()
+    return _monitor
+
+
+# Whether the monitor has seen the owner since it last had them gone; True
+# when there is no monitor to ask
+def ownerSeen():
+    return _monitor is None or not _monitor.running or _monitor.state == PRESENT
+
+
+# Wait for the next sighting again, after a sign-in that failed
+def forgetOwner():
+    if _monitor is not None:
+        _monitor.state = ABSENT
+
+
+class _VideoClock: # plays a recorded video in real time, for trying the monitor without a camera
+    def __init__(self, path):
+        self.video = cv2.VideoCapture(path)
+        self.fps = self.video.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frames = int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.started = time.monotonic()
+
+    def read(self):
+        index = int((time.monotonic() - self.started) * self.fps)
+        if index >= self.frames:
+            return None
+        self.video.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ok, frame = self.video.read()
+        return frame if ok else None
+
+    def stop(self):
+        self.video.release()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from engine.auth.service import getService
+
+    parser = argparse.ArgumentParser(description="Run the presence monitor and report its duty cycle and CPU")
+    parser.add_argument("--video", help="recorded video instead of the webcam")
+    parser.add_argument("--interval", type=float, default=FACE_PRESENCE_INTERVAL)
+    parser.add_argument("--seconds", type=float, default=60, help="how long to run")
+    args = parser.parse_args()
+
+    source = _VideoClock(args.video) if args.video else None
+    monitor = PresenceMonitor(getService(), source, on_absent=lambda: print("presence: would lock now"),
+                              interval=args.interval).start()
+    time.sleep(args.seconds)
+    monitor.stop()
+    print(monitor.report())
@@ -0,0 +1,87 @@
+import base64
+import threading
+import time
+
+import cv2
+
+from engine.config import FACE_PREVIEW_FPS, FACE_PREVIEW_QUALITY, FACE_PREVIEW_WIDTH
+
+
+# Small JPEG snapshots of the auth camera for the web UI. offer() is called
+# for every frame but only encodes at most `fps` frames a second; the UI loop
+# take()s the newest one, so a slow UI never queues frames up.
+class PreviewFeed:
+    def __init__(self, fps=FACE_PREVIEW_FPS, width=FACE_PREVIEW_WIDTH, quality=FACE_PREVIEW_QUALITY):
+        self.interval = 1.0 / fps if fps else None
+        self.width = width
+        self.quality = quality
+        self.last_sent = 0.0
+        self.latest = None
+        self.lock = threading.Lock()
+        self.encoded = 0
+
+    @property
+    def enabled(self):
+        return self.interval is not None
+
+    def offer(self, frame, boxes=()):
+        now = time.monotonic()
+        if not self.enabled or now - self.last_sent < self.interval:
+            return
+        self.last_sent = now
+        scale = self.width / frame.shape[1]
+        small = cv2.resize(frame, (self.width, int(frame.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+        # boxes are drawn on the small copy, never on the camera frame
+        for (x, y, w, h) in boxes:
+            cv2.rectangle(small, (int(x * scale), int(y * scale)), (int((x + w) * scale), int((y + h) * scale)),
+                          (0, 170, 255), 2)
+        ok, jpeg = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        with self.lock:
+            self.latest = "data:image/jpeg;base64," + base64.b64encode(jpeg.tobytes()).decode("ascii")
+            self.encoded += 1
+
+    # Newest snapshot as a data URL, or None if nothing new since the last call
+    def take(self):
+        with self.lock:
+            latest, self.latest = self.latest, None
+        return latest
+
+
+# Auth loop throughput over a recorded video with the preview on and off
+def benchmark(video_path, detector, max_frames=None):
+    from engine.auth.pipeline import FacePipeline
+
+    results = {}
+    for label, fps in (("preview off", 0), (f"preview {FACE_PREVIEW_FPS} fps", FACE_PREVIEW_FPS)):
+        video = cv2.VideoCapture(video_path)
+        pipeline = FacePipeline(detector)
+        feed = PreviewFeed(fps=fps)
+        frames = 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        while max_frames is None or frames < max_frames:
+            ok, frame = video.read()
+            if not ok:
+                break
+            frames += 1
+            tracks = pipeline.process(frame)
+            feed.offer(frame, [track.box for track in tracks])
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        video.release()
+        results[label] = {"frames": frames, "fps": round(frames / wall, 1),
+                          "cpu_ms_per_frame": round(1000 * cpu / max(1, frames), 2), "previews": feed.encoded}
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from engine.auth.detectors import create_detector
+
+    parser = argparse.ArgumentParser(description="Measure the cost of the face auth preview")
+    parser.add_argument("video", help="recorded video file")
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    args = parser.parse_args()
+    for label, result in benchmark(args.video, create_detector(), args.frames).items():
+        print(f"{label:>16}: {result}")
@@ -1,42 +1,168 @@
+# Run from the project folder: python -m engine.auth.sample
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+
 import cv2
+import numpy as np
+
+from engine.auth.detectors import create_detector
+from engine.auth.pipeline import FacePipeline
+from engine.config import FACE_SAMPLE_COUNT, FACE_SAMPLE_MIN_HASH_DISTANCE, FACE_SAMPLE_MIN_SHARPNESS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+samples_path = os.path.join(BASE_DIR, 'samples')
+captures_path = os.path.join(BASE_DIR, 'trainer', 'captures.json') # not in git, unlike samples/manifest.json
+
+FACE_SIZE = (200, 200) # crops are stored at the size the trainer uses
+
+
+def sharpness(face): # variance of the Laplacian: low means blurry
+    return cv2.Laplacian(face, cv2.CV_64F).var()
+
+
+def dhash(face): # 64-bit difference hash, close hashes mean near-identical faces
+    small = cv2.resize(face, (9, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits((small[:, 1:] > small[:, :-1]).ravel())
+
+
+# Encodes accepted crops to JPEG and appends them to one zip archive on its
+# own thread, so the capture loop never waits for the disk
+class SampleWriter:
+    def __init__(self, path, quality=90):
+        self.path = path
+        self.quality = quality
+        self.queue = queue.Queue()
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name="sample-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        with zipfile.ZipFile(self.path + '.tmp', 'w', zipfile.ZIP_STORED) as archive: # JPEGs don't compress further
+            while True:
+                face = self.queue.get()
+                if face is None:
+                    break
+                ok, jpeg = cv2.imencode('.jpg', face, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    self.written += 1
+                    archive.writestr(f"{self.written}.jpg", jpeg.tobytes())
+        os.replace(self.path + '.tmp', self.path)
+
+    def put(self, face):
+        self.queue.put(face)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        return self.written
+
+
+def add_capture(name, face_id, count):
+    # the trainer reads this to know the archive holds face crops that need no detection
+    try:
+        with open(captures_path) as f:
+            captures = json.load(f)
+    except (OSError, ValueError):
+        captures = {}
+    captures[name] = {"user": int(face_id), "crop": True, "samples": count}
+    os.makedirs(os.path.dirname(captures_path), exist_ok=True)
+    with open(captures_path + '.tmp', 'w') as f:
+        json.dump(captures, f, indent=1)
+    os.replace(captures_path + '.tmp', captures_path)
+
+
+# Take `count` sharp, different-looking face crops of one user into
+# samples/face.<id>.<time>.zip. `source` is anything with read() -> frame or
+# None: the webcam stream, or a recorded video for testing.
+def capture(face_id, source, count=FACE_SAMPLE_COUNT, show=True):
+    name = "face." + str(face_id) + '.' + time.strftime("%Y%m%d%H%M%S") + ".zip"
+    writer = SampleWriter(os.path.join(samples_path, name))
+    pipeline = FacePipeline(create_detector()) # same detector and settings as face auth
+    face = np.empty(FACE_SIZE[::-1], np.uint8)
+    hashes = np.empty((count, 8), np.uint8)
+    accepted, frames = 0, 0
+    rejected = {"blurry": 0, "duplicate": 0}
+    started = time.perf_counter()
+
+    while accepted < count:
+        img = source.read()
+        if img is None:
+            break
+        frames += 1
+        tracks = pipeline.process(img)
+        # only the biggest face, so someone walking past isn't enrolled too
+        track = max(tracks, key=lambda t: t.box[2] * t.box[3], default=None)
+        if track is not None and track.changed:
+            x, y, w, h = track.box
+            cv2.resize(pipeline.gray[y:y+h, x:x+w], FACE_SIZE, dst=face, interpolation=cv2.INTER_AREA)
+            digest = dhash(face)
+            if sharpness(face) < FACE_SAMPLE_MIN_SHARPNESS:
+                rejected["blurry"] += 1
+            elif accepted and np.unpackbits(hashes[:accepted] ^ digest, axis=1).sum(axis=1).min() < FACE_SAMPLE_MIN_HASH_DISTANCE:
+                rejected["duplicate"] += 1
+            else:
+                hashes[accepted] = digest
+                accepted += 1
+                writer.put(face.copy())
 
-cam = cv2.VideoCapture(1, cv2.CAP_DSHOW) #create a video capture object which is helpful to capture videos through webcam
-cam.set(3, 640) # set video FrameWidth
-cam.set(4, 480) # set video FrameHeight
+        if show:
+            for t in tracks:
+                x, y, w, h = t.box
+                cv2.rectangle(img, (x,y), (x+w,y+h), (255,0,0), 2) #used to draw a rectangle on any image
+            cv2.imshow('image', img) #Used to display an image in a window
+            if cv2.waitKey(1) & 0xff == 27: # Press 'ESC' to stop
+                break
 
+    written = writer.close()
+    elapsed = time.perf_counter() - started
+    if written:
+        add_capture(name, face_id, written)
+    else:
+        os.remove(writer.path)
+    size = os.path.getsize(writer.path) if written else 0
+    print(f"{written} samples from {frames} frames in {elapsed:.1f}s ({frames / max(elapsed, 1e-9):.0f} fps), "
+          f"rejected {rejected}, {name}: {size / 1024:.0f} KB")
+    return name if written else None
 
-detector = cv2.CascadeClassifier('engine\\auth\\haarcascade_frontalface_default.xml')
-#Haar Cascade classifier is an effective object detection approach
 
-face_id = input("Enter a Numeric user ID  here:  ")
-#Use integer ID for every new face (0,1,2,3,4,5,6,7,8,9........)
+class VideoSource: # recorded video with the same read() as the camera stream
+    def __init__(self, path):
+        self.video = cv2.VideoCapture(path)
 
-print("Taking samples, look at camera ....... ")
-count = 0 # Initializing sampling face count
+    def read(self):
+        ok, frame = self.video.read()
+        return frame if ok else None
 
-while True:
+    def stop(self):
+        self.video.release()
 
-    ret, img = cam.read() #read the frames using the above created object
-    converted_image = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) #The function converts an input image from one color space to another
-    faces = detector.detectMultiScale(converted_image, 1.3, 5)
 
-    for (x,y,w,h) in faces:
+if __name__ == "__main__":
+    import argparse
 
-        cv2.rectangle(img, (x,y), (x+w,y+h), (255,0,0), 2) #used to draw a rectangle on any image
-        count += 1
+    from engine.auth.camera import getManager
 
-        
-        cv2.imwrite("engine\\auth\\samples\\face." + str(face_id) + '.' + str(count) + ".jpg", converted_image[y:y+h,x:x+w])
-        # To capture & Save images into the datasets folder
+    parser = argparse.ArgumentParser(description="Take face samples for the face model")
+    parser.add_argument("--id", help="numeric user ID (asked for when left out)")
+    parser.add_argument("--count", type=int, default=FACE_SAMPLE_COUNT)
+    parser.add_argument("--video", help="take the samples from a recorded video instead of the webcam")
+    parser.add_argument("--headless", action="store_true", help="no preview window")
+    args = parser.parse_args()
 
-        cv2.imshow('image', img) #Used to display an image in a window
+    cam = VideoSource(args.video) if args.video else getManager().acquire() #capture thread on the cached webcam
+    if cam is None:
+        raise SystemExit("Error: Could not open webcam.")
 
-    k = cv2.waitKey(100) & 0xff # Waits for a pressed key
-    if k == 27: # Press 'ESC' to stop
-        break
-    elif count >= 100: # Take 50 sample (More sample --> More accuracy)
-         break
+    face_id = args.id or input("Enter a Numeric user ID  here:  ")
+    #Use integer ID for every new face (0,1,2,3,4,5,6,7,8,9........)
 
-print("Samples taken now closing the program....")
-cam.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+    print("Taking samples, look at camera and turn your head slowly ....... ")
+    capture(int(face_id), cam, args.count, show=not args.headless)
+    print("Samples taken now closing the program....")
+    cam.stop()
+    if not args.headless:
+        cv2.destroyAllWindows()
@@ -0,0 +1,205 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+
+from engine.auth.camera import getManager
+from engine.auth.decision import SequentialDecision, stats as decision_stats
+from engine.auth.detectors import create_detector
+from engine.auth.enroll import STATE_PATH, load_delta, load_model, read_state
+from engine.auth.pipeline import FacePipeline
+from engine.auth.preview import PreviewFeed
+from engine.auth.users import getUsers
+from engine.config import (FACE_AUTH_CONFIDENCE, FACE_AUTH_DEADLINE, FACE_AUTH_HEADLESS, FACE_MODEL_POLL_INTERVAL,
+                           FACE_STILL_WEIGHT)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, 'trainer', 'trainer.lbph')
+
+
+# (label, distance, weight) for every face in the frame, as SequentialDecision
+# takes them. A face that hasn't moved keeps its last prediction at a lower
+# weight; the rest are matched together.
+def predict_tracks(matcher, pipeline, tracks):
+    changed = [track for track in tracks if track.changed]
+    if changed:
+        labels, distances = matcher.predict([pipeline.gray[y:y + h, x:x + w]
+                                             for (x, y, w, h) in (track.box for track in changed)])
+        for track, label, distance in zip(changed, labels, distances):
+            track.label, track.confidence = int(label), 100 - float(distance)
+    return [(track.label, 100 - track.confidence, 1.0 if track.changed else FACE_STILL_WEIGHT) for track in tracks]
+
+
+# Face authentication that stays loaded for the life of the process. The face
+# model (as a FaceMatcher) and the face detector are loaded once on a background
+# thread as soon as preload() is called, so authenticate() only has to open
+# the camera. After that a watcher thread swaps in retrained or newly enrolled
+# models.
+class FaceAuthService:
+    def __init__(self, model_path=MODEL_PATH, detector=None):
+        self.model_path = model_path
+        self.detector_name = detector
+        self.matcher = None
+        self.model_state = None
+        self.state_mtime = None
+        self.detector = None
+        self.error = None
+        self.load_seconds = None
+        self.ready = threading.Event()
+        self.auth_lock = threading.Lock()
+        self.loader = None
+        self.preview = PreviewFeed()
+
+    def preload(self):
+        if self.loader is None:
+            self.loader = threading.Thread(target=self._load, name="face-auth-load", daemon=True)
+            self.loader.start()
+        return self
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            self.detector = create_detector(self.detector_name)
+            self.state_mtime = self._state_mtime()
+            self.matcher, self.model_state = load_model(self.model_path)
+        except Exception as e:
+            self.error = e
+            print("Error:", e)
+        self.load_seconds = time.perf_counter() - started
+        print(f"face auth: model loaded in {self.load_seconds:.2f}s")
+        self.ready.set()
+        threading.Thread(target=self._watch, name="face-model-watch", daemon=True).start()
+
+    def _state_mtime(self):
+        try:
+            return os.stat(STATE_PATH).st_mtime_ns
+        except OSError:
+            return None
+
+    def _watch(self):
+        while True:
+            time.sleep(FACE_MODEL_POLL_INTERVAL)
+            try:
+                self.refresh()
+            except Exception as e:
+                print("face auth: model refresh failed:", e)
+
+    # Pick up a model written by trainer.py or enroll.py since the last look
+    def refresh(self):
+        mtime = self._state_mtime()
+        if mtime is None or mtime == self.state_mtime:
+            return
+        self.state_mtime = mtime
+        started = time.perf_counter()
+        current = self.model_state
+        if current is None or self.matcher is None:
+            matcher, state = load_model(self.model_path)
+            with self.auth_lock:
+                self.matcher, self.model_state, self.error = matcher, state, None
+        else:
+            state = read_state()
+            if state["version"] == current["version"]:
+                return
+            if state["base_version"] != current["base_version"]:
+                # retrained from scratch: load it next to the old one, then swap
+                matcher, state = load_model(self.model_path)
+                with self.auth_lock:
+                    self.matcher, self.model_state = matcher, state
+            else:
+                # histograms of just the new faces, written by enroll()
+                new = [load_delta(delta) for delta in state["deltas"] if delta["version"] > current["version"]]
+                with self.auth_lock:  # add() changes the live matcher, so not during an attempt
+                    for histograms, labels in new:
+                        self.matcher.add(histograms, labels)
+                    self.model_state = state
+        print(f"face auth: switched to model version {state['version']} in {time.perf_counter() - started:.2f}s")
+
+    # Start an authentication attempt and return at once. The future resolves
+    # to 1 when the owner was recognised and 0 when not, at the latest after
+    # `deadline` seconds.
+    def authenticate(self, deadline=FACE_AUTH_DEADLINE):
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self._authenticate(time.monotonic() + deadline))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="face-auth", daemon=True).start()
+        return future
+
+    def _authenticate(self, deadline):
+        self.preload()
+        if not self.ready.wait(max(0.0, deadline - time.monotonic())) or self.matcher is None:
+            return 0
+        with self.auth_lock:
+            return self._recognise(deadline)
+
+    # Debug window with boxes and scores, only used when FACE_AUTH_HEADLESS is off
+    def _show(self, img, tracks):
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        for track in tracks:
+            x, y, w, h = track.box
+            id_, confidence = track.label, track.confidence
+            cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            if confidence >= FACE_AUTH_CONFIDENCE:
+                name = getUsers().name(id_)
+            else:
+                name = "unknown"
+            acc_text = f"  {round(confidence)}%"
+
+            cv2.putText(img, str(name), (x + 5, y - 5), font, 1, (255, 255, 255), 2)
+            cv2.putText(img, str(acc_text), (x + 5, y + h - 5), font, 1, (255, 255, 0), 1)
+        cv2.imshow('camera', img)
+
+    def _recognise(self, deadline):
+        cam = getManager().acquire(max(0.0, deadline - time.monotonic()))
+        if cam is None:
+            return 0
+
+        pipeline = FacePipeline(self.detector)
+        owners = getUsers().owners()
+        decision = SequentialDecision(deadline, owners)
+
+        while decision.pending:
+            img = cam.read()
+            if img is None:
+                print("Failed to grab frame from camera.")
+                decision.cancel()
+                break
+
+            tracks = pipeline.process(img)
+            for label, distance, weight in predict_tracks(self.matcher, pipeline, tracks):
+                decision.add(label, distance, weight)
+
+            self.preview.offer(img, [track.box for track in tracks])
+            if not FACE_AUTH_HEADLESS:
+                self._show(img, tracks)
+                k = cv2.waitKey(10) & 0xff
+                if k == 27:
+                    decision.cancel()
+            decision.tick()
+
+        if decision.result == 0 and decision.reason == "rejected":
+            getManager().release(cam)  # kept open in case the caller tries again
+        else:
+            cam.stop()
+        if not FACE_AUTH_HEADLESS:
+            cv2.destroyAllWindows()
+        print(f"face auth: {decision.reason} after {decision.elapsed:.2f}s and {decision.frames} predictions, "
+              f"time to decision {decision_stats()}")
+        return decision.result
+
+
+_service = None
+
+
+def getService():
+    global _service
+    if _service is None:
+        _service = FaceAuthService()
+    return _service
@@ -0,0 +1,152 @@
+import ctypes
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+
+from engine.config import SESSION_KEY_PATH, SESSION_PATH, SESSION_TTL, SESSION_WATCH_INTERVAL
+
+_held = threading.Event()
+
+
+# Seconds the machine has spent suspended since boot. Windows counts sleep in
+# the tick count but not in the unbiased interrupt time; Linux does the same
+# with CLOCK_BOOTTIME and CLOCK_MONOTONIC. None when neither is available.
+def suspended_seconds():
+    if sys.platform == "win32":
+        unbiased = ctypes.c_ulonglong()
+        if not ctypes.windll.kernel32.QueryUnbiasedInterruptTime(ctypes.byref(unbiased)):
+            return None
+        ticks = ctypes.windll.kernel32.GetTickCount64
+        ticks.restype = ctypes.c_ulonglong
+        return ticks() / 1000 - unbiased.value / 1e7
+    if hasattr(time, "CLOCK_BOOTTIME"):
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - time.clock_gettime(time.CLOCK_MONOTONIC)
+    return None
+
+
+def boot_time():
+    if sys.platform == "win32":
+        ticks = ctypes.windll.kernel32.GetTickCount64
+        ticks.restype = ctypes.c_ulonglong
+        return time.time() - ticks() / 1000
+    if hasattr(time, "CLOCK_BOOTTIME"):
+        return time.time() - time.clock_gettime(time.CLOCK_BOOTTIME)
+    return None
+
+
+# True while the Windows lock screen is up: the input desktop can't be
+# switched to from the user's session then
+def locked():
+    if sys.platform != "win32":
+        return False
+    user32 = ctypes.windll.user32
+    desktop = user32.OpenInputDesktop(0, False, 0x0100)  # DESKTOP_SWITCHDESKTOP
+    if not desktop:
+        return True
+    try:
+        return not user32.SwitchDesktop(desktop)
+    finally:
+        user32.CloseDesktop(desktop)
+
+
+def _key():
+    # random per-machine secret, so a token can't be written by hand or copied from elsewhere
+    try:
+        with open(SESSION_KEY_PATH, "rb") as f:
+            key = f.read()
+        if len(key) == 32:
+            return key
+    except OSError:
+        pass
+    key = os.urandom(32)
+    os.makedirs(os.path.dirname(SESSION_KEY_PATH) or ".", exist_ok=True)
+    with open(SESSION_KEY_PATH, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _sign(claims):
+    payload = json.dumps(claims, sort_keys=True).encode("utf-8")
+    return hmac.new(_key(), payload, hashlib.sha256).hexdigest()
+
+
+# Remember a successful face authentication for SESSION_TTL seconds
+def issue(method="face", ttl=SESSION_TTL):
+    now = time.time()
+    claims = {"method": method, "issued": now, "expires": now + ttl, "boot": boot_time(),
+              "suspended": suspended_seconds()}
+    token = dict(claims, signature=_sign(claims))
+    os.makedirs(os.path.dirname(SESSION_PATH) or ".", exist_ok=True)
+    with open(SESSION_PATH + ".tmp", "w") as f:
+        json.dump(token, f)
+    os.replace(SESSION_PATH + ".tmp", SESSION_PATH)
+    _held.clear()
+    return token
+
+
+def invalidate(reason):
+    try:
+        os.remove(SESSION_PATH)
+        print(f"session: token dropped ({reason})")
+    except FileNotFoundError:
+        pass
+
+
+# Drop the token and refuse commands until the next issue(): the owner is gone
+# and whoever sits down next has to authenticate first
+def hold(reason):
+    _held.set()
+    invalidate(reason)
+
+
+def held():
+    return _held.is_set()
+
+
+# The token's claims when it still vouches for the user, otherwise None (and
+# the token is removed, with the reason printed)
+def check():
+    try:
+        with open(SESSION_PATH) as f:
+            token = json.load(f)
+        signature = token.pop("signature")
+    except (OSError, ValueError, KeyError):
+        return None
+    now = time.time()
+    if not hmac.compare_digest(signature, _sign(token)):
+        reason = "bad signature"
+    elif not token["issued"] - 60 <= now < token["expires"]:
+        reason = "expired"
+    elif token["boot"] is not None and abs(boot_time() - token["boot"]) > 5:
+        reason = "rebooted"
+    elif token["suspended"] is not None and suspended_seconds() - token["suspended"] > 1:
+        reason = "suspended"
+    elif locked():
+        reason = "locked"
+    else:
+        return token
+    invalidate(reason)
+    return None
+
+
+# Drop the token as soon as the screen locks or the machine sleeps. Sleep is
+# also caught afterwards by check(), a lock only while this runs.
+def watch(interval=SESSION_WATCH_INTERVAL):
+    def run():
+        last = time.time()
+        while True:
+            time.sleep(interval)
+            now = time.time()
+            if now - last > interval + 30:  # the wall clock jumped: we were suspended
+                invalidate("suspended")
+            elif locked():
+                invalidate("locked")
+            last = now
+
+    thread = threading.Thread(target=run, name="session-watch", daemon=True)
+    thread.start()
+    return thread
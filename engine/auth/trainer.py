@@ -1,40 +1,164 @@
+# Run from the project folder: python -m engine.auth.trainer
+import hashlib
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
 import numpy as np
-from PIL import Image #pillow package
-import os
 
-path = 'engine\\auth\\samples' # Path for samples already taken
+from engine.auth import modelfile
+from engine.auth.detectors import create_detector
+from engine.config import FACE_DETECT_MIN_SIZE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+path = os.path.join(BASE_DIR, 'samples') # Path for samples already taken
+trainer_path = os.path.join(BASE_DIR, 'trainer', 'trainer.yml') # OpenCV YAML, only written with --yaml
+model_path = os.path.join(BASE_DIR, 'trainer', 'trainer.lbph') # binary copy the assistant loads, see modelfile.py
+cache_path = os.path.join(BASE_DIR, 'trainer', 'samples_cache.npz') # decoded faces keyed by file hash
+manifest_path = os.path.join(path, 'manifest.json') # which of the samples in git are already face crops
+captures_path = os.path.join(BASE_DIR, 'trainer', 'captures.json') # same for samples taken here, written by sample.py
+
+FACE_SIZE = (200, 200) # every face is stored at this size in the cache
+
+_detector = None
+
+
+def init_worker():
+    global _detector
+    cv2.setNumThreads(1) # one process per core already, keep OpenCV from oversubscribing
+    _detector = create_detector() # the detector face auth uses, so training crops look the same
+
+
+def prepare_sample(job): # runs in the pool: decode one sample and return its normalised faces
+    image_path, is_crop = job
+    if image_path.lower().endswith('.zip'): # archive of crops written by sample.py
+        with zipfile.ZipFile(image_path) as archive:
+            images = [cv2.imdecode(np.frombuffer(archive.read(name), np.uint8), cv2.IMREAD_GRAYSCALE)
+                      for name in archive.namelist()]
+        return [cv2.resize(img, FACE_SIZE, interpolation=cv2.INTER_AREA) for img in images if img is not None]
+    gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return []
+    if is_crop:
+        crops = [gray] # sample.py already cut the face out, no need to look for it again
+    else:
+        side = int(FACE_DETECT_MIN_SIZE * min(gray.shape))
+        crops = [gray[y:y+h, x:x+w] for (x, y, w, h) in _detector.detect(gray, (side, side))]
+    return [cv2.resize(crop, FACE_SIZE, interpolation=cv2.INTER_AREA) for crop in crops]
+
+
+def file_hash(image_path):
+    with open(image_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def label_of(image_path): # face.<id>.<count>.jpg or face.<id>.<time>.zip
+    return int(os.path.split(image_path)[-1].split(".")[1])
+
 
-recognizer = cv2.face.LBPHFaceRecognizer_create() # Local Binary Patterns Histograms
-detector = cv2.CascadeClassifier("engine\\auth\\haarcascade_frontalface_default.xml")
-#Haar Cascade classifier is an effective object detection approach
+def _read_json(file_path):
+    try:
+        with open(file_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
 
-def Images_And_Labels(path): # function to fetch the images and labels
+# Sample file -> {"user", "crop", "samples"}, for the samples in git and the ones captured on this machine
+def load_manifest():
+    return dict(_read_json(manifest_path), **_read_json(captures_path))
 
-    imagePaths = [os.path.join(path,f) for f in os.listdir(path)]     
-    faceSamples=[]
+
+def load_cache():
+    if not os.path.isfile(cache_path):
+        return {}
+    with np.load(cache_path) as data:
+        faces, owners, hashes = data['faces'], data['owners'], data['hashes']
+    cache = {}
+    for i, digest in enumerate(hashes):
+        cache[str(digest)] = [faces[j] for j in np.flatnonzero(owners == i)]
+    return cache
+
+
+def save_cache(cache):
+    hashes = sorted(cache)
+    faces, owners = [], []
+    for i, digest in enumerate(hashes):
+        for face in cache[digest]:
+            faces.append(face)
+            owners.append(i)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + '.tmp.npz'
+    np.savez_compressed(tmp_path, hashes=np.array(hashes), owners=np.array(owners, np.int32),
+                        faces=np.array(faces, np.uint8).reshape(-1, *FACE_SIZE[::-1]))
+    os.replace(tmp_path, cache_path)
+
+
+def sample_files(path):
+    return [f for f in sorted(os.listdir(path)) if f.lower().endswith(('.jpg', '.png', '.zip'))]
+
+
+def Images_And_Labels(path, workers=None): # function to fetch the images and labels
+
+    imagePaths = [os.path.join(path, f) for f in sample_files(path)]
+    manifest = load_manifest()
+    cache = load_cache()
+
+    hashes = [file_hash(p) for p in imagePaths]
+    todo = [(p, digest) for p, digest in zip(imagePaths, hashes) if digest not in cache]
+
+    if todo: # only new or changed files are decoded
+        jobs = [(p, manifest.get(os.path.basename(p), {}).get('crop', False)) for p, _ in todo]
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            for (_, digest), faces in zip(todo, pool.map(prepare_sample, jobs, chunksize=16)):
+                cache[digest] = faces
+
+    # forget files that were deleted so the cache doesn't grow forever
+    cache = {digest: cache[digest] for digest in hashes if digest in cache}
+    save_cache(cache)
+
+    faceSamples = []
     ids = []
+    for image_path, digest in zip(imagePaths, hashes):
+        for face in cache[digest]:
+            faceSamples.append(face)
+            ids.append(label_of(image_path))
+
+    return faceSamples, ids, len(todo), len(imagePaths)
+
 
-    for imagePath in imagePaths: # to iterate particular image path
+def train(write_yaml=False):
+    print ("Training faces. It will take a few seconds. Wait ...")
+    started = time.perf_counter()
 
-        gray_img = Image.open(imagePath).convert('L') # convert it to grayscale
-        img_arr = np.array(gray_img,'uint8') #creating an array
+    files = sample_files(path)
+    faces, ids, decoded, total = Images_And_Labels(path)
+    prepared = time.perf_counter() - started
 
-        id = int(os.path.split(imagePath)[-1].split(".")[1])
-        faces = detector.detectMultiScale(img_arr)
+    recognizer = cv2.face.LBPHFaceRecognizer_create() # Local Binary Patterns Histograms
+    recognizer.train(faces, np.array(ids))
 
-        for (x,y,w,h) in faces:
-            faceSamples.append(img_arr[y:y+h,x:x+w])
-            ids.append(id)
+    modelfile.from_recognizer(recognizer, model_path) # written atomically, a running assistant never sees half of it
+    if write_yaml:
+        recognizer.write(trainer_path)  # Save the trained model as trainer.yml
 
-    return faceSamples,ids
+    # the new model holds every sample, so enrollments made before it are folded in
+    from engine.auth.enroll import commit_base
+    version = commit_base(files)
 
-print ("Training faces. It will take a few seconds. Wait ...")
+    elapsed = time.perf_counter() - started
+    print(f"{total} files ({decoded} decoded, {total - decoded} from cache) prepared in {prepared:.2f}s, "
+          f"{len(faces)} faces trained in {elapsed:.2f}s: {len(faces) / elapsed:.0f} samples/sec")
+    print(f"Model trained (version {version}), Now we can recognize your face.")
+    return recognizer
 
-faces,ids = Images_And_Labels(path)
-recognizer.train(faces, np.array(ids))
 
-recognizer.write('engine\\auth\\trainer\\trainer.yml')  # Save the trained model as trainer.yml
+if __name__ == "__main__":
+    import argparse
 
-print("Model trained, Now we can recognize your face.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the face model from engine/auth/samples")
+    parser.add_argument("--yaml", action="store_true", help="also write the OpenCV trainer.yml")
+    train(parser.parse_args().yaml)
@@ -0,0 +1,49 @@
+import sqlite3
+import threading
+import time
+
+from engine import config
+
+
+# Names behind the numeric face IDs, stored in jarvis.db. Only users marked as
+# owner can unlock the assistant; everybody else is recognised but rejected.
+class UserRegistry:
+    def __init__(self, db_path=config.DB_PATH):
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute('''CREATE TABLE IF NOT EXISTS face_users (
+            id INTEGER PRIMARY KEY, name TEXT, owner INTEGER DEFAULT 1, created REAL)''')
+        if self.con.execute("SELECT COUNT(*) FROM face_users").fetchone()[0] == 0:
+            # the user the face model was first trained for
+            self.con.execute("INSERT INTO face_users (id, name, owner, created) VALUES (1, 'susant', 1, ?)",
+                             (time.time(),))
+        self.con.commit()
+        self._load()
+
+    def _load(self):
+        rows = self.con.execute("SELECT id, name, owner FROM face_users").fetchall()
+        self.names = {id_: name for id_, name, _ in rows}
+        self.owner_ids = {id_ for id_, _, owner in rows if owner}
+
+    def add(self, id_, name, owner=True):
+        with self.lock:
+            self.con.execute("INSERT OR REPLACE INTO face_users (id, name, owner, created) VALUES (?, ?, ?, ?)",
+                             (id_, name, int(owner), time.time()))
+            self.con.commit()
+            self._load()
+
+    def name(self, id_):
+        return self.names.get(id_, "unknown")
+
+    def owners(self):
+        return set(self.owner_ids)
+
+
+_users = None
+
+
+def getUsers():
+    global _users
+    if _users is None:
+        _users = UserRegistry()
+    return _users
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from engine import startup
+
+
+class BootStep:
+    def __init__(self, name, fn, after):
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.skipped = False
+        self.started = None
+        self.finished = None
+
+
+# Startup as a graph of steps, each naming the steps it has to wait for.
+# start() runs every step on its own thread as soon as its dependencies are
+# done, so independent work overlaps and the time to ready is the critical
+# path. A step whose dependency failed is skipped, not run.
+class BootGraph:
+    def __init__(self):
+        self.steps = {}
+        self.origin = None
+
+    def add(self, name, fn, after=()):
+        for dependency in after:
+            if dependency not in self.steps:
+                raise ValueError(f"boot step {name} depends on unknown step {dependency}")
+        self.steps[name] = BootStep(name, fn, after)
+        return self
+
+    def start(self):
+        self.origin = time.perf_counter()
+        for step in self.steps.values():
+            threading.Thread(target=self._run, args=(step,), name=f"boot-{step.name}", daemon=True).start()
+        return self
+
+    def _run(self, step):
+        for dependency in step.after:
+            self.steps[dependency].done.wait()
+        failed = [d for d in step.after if self.steps[d].error is not None or self.steps[d].skipped]
+        step.started = time.perf_counter()
+        if failed:
+            step.skipped = True
+        else:
+            try:
+                step.result = step.fn()
+            except Exception as e:
+                step.error = e
+                print(f"boot: {step.name} failed: {e}")
+        step.finished = time.perf_counter()
+        startup.mark(f"boot {step.name} done")
+        step.done.set()
+
+    # Block until the step has finished and return its result
+    def wait(self, name, timeout=None):
+        step = self.steps[name]
+        if not step.done.wait(timeout):
+            raise TimeoutError(f"boot step {name} still running after {timeout}s")
+        return step.result
+
+    def finished(self, name):
+        return self.steps[name].done.is_set()
+
+    # The chain of steps that decided when the last one finished
+    def critical_path(self):
+        done = [step for step in self.steps.values() if step.finished is not None]
+        if not done:
+            return []
+        step = max(done, key=lambda s: s.finished)
+        path = [step.name]
+        while step.after:
+            step = max((self.steps[d] for d in step.after), key=lambda s: s.finished)
+            path.append(step.name)
+        return path[::-1]
+
+    def timeline(self, width=50):
+        steps = [step for step in self.steps.values() if step.started is not None]
+        if not steps:
+            return "boot: nothing ran yet"
+        end = max(step.finished for step in steps) - self.origin
+        scale = width / end if end else 0
+        critical = set(self.critical_path())
+        lines = [f"boot timeline ({end:.2f}s, critical path {' > '.join(self.critical_path())}):"]
+        for step in sorted(steps, key=lambda s: s.started):
+            begin, finish = step.started - self.origin, step.finished - self.origin
+            bar = " " * int(begin * scale) + "#" * max(1, int((finish - begin) * scale))
+            state = "skipped" if step.skipped else "failed" if step.error is not None else ""
+            lines.append(f"  {step.name:<10} {begin:6.2f} -> {finish:6.2f}s {'*' if step.name in critical else ' '} "
+                         f"|{bar:<{width}}| {state}")
+        return "\n".join(lines)
@@ -1,13 +1,21 @@
-import pyttsx3
-import speech_recognition as sr
 import eel
 import time
-def speak(text):
-    text = str(text)
+from engine import supervisor
+from engine.auth import session
+from engine.startup import lazy
+pyttsx3 = lazy("pyttsx3")
+sr = lazy("speech_recognition")
+def createVoiceEngine():
     engine = pyttsx3.init('sapi5')
     voices = engine.getProperty('voices') 
     engine.setProperty('voice', voices[0].id)
     engine.setProperty('rate', 174)
+    return engine
+
+
+def speak(text):
+    text = str(text)
+    engine = createVoiceEngine()
     eel.DisplayMessage(text)
     engine.say(text)
     eel.receiverText(text)
@@ -40,7 +48,12 @@ def takecommand():
     return query.lower()
 
 @eel.expose
+@supervisor.busy()  # speech and listening hold eel's loop until they finish
 def allCommands(message=1):
+    if session.held():
+        # the owner left: nothing runs until they sign in again, back on the face auth screen
+        eel.showFaceAuth()
+        return
 
     if message == 1:
         query = takecommand()
@@ -90,9 +103,15 @@ def allCommands(message=1):
                     whatsApp(contact_no, query, message, name)
 
         else:
-            from engine.features import chatBot
-            chatBot(query)
-    except:
-        print("error")
+            from engine.fastpath import answer, stats
+            reply = answer(query)
+            if reply is not None:
+                print("answered locally:", stats())
+                speak(reply)
+            else:
+                from engine.features import chatBot
+                chatBot(query)
+    except Exception as e:
+        print("error:", repr(e))
     
     eel.ShowHood()
\ No newline at end of file
@@ -1 +1,145 @@
-ASSISTANT_NAME = "jarvis"
\ No newline at end of file
+import os
+
+ASSISTANT_NAME = "jarvis"
+
+DB_PATH = "jarvis.db"
+
+# Chatbot backends, tried in this order until one answers
+# ("hugchat", "openai" for any OpenAI compatible endpoint, "local" for the stand-in server)
+LLM_BACKENDS = ["hugchat", "openai", "local"]
+LLM_TIMEOUT = 20  # seconds allowed for one question, retries included
+LLM_RETRIES = 2  # extra attempts per backend after the first one
+LLM_RETRY_BACKOFF = 0.5  # base delay in seconds, doubled and jittered on every retry
+LLM_BREAKER_THRESHOLD = 3  # consecutive failures before a backend is skipped
+LLM_BREAKER_COOLDOWN = 60  # seconds a tripped backend is skipped before it is tried again
+LLM_STREAM_IDLE_TIMEOUT = 10  # seconds without a new token before a streamed answer is cut off
+LLM_FALLBACK_REPLY = "I'm sorry, I can't reach my language service right now. Please try again in a moment"
+
+HUGCHAT_COOKIES = os.path.join("engine", "cookies.json")
+
+OPENAI_BASE_URL = os.environ.get("JARVIS_LLM_URL", "https://api.openai.com/v1")
+OPENAI_API_KEY = os.environ.get("JARVIS_LLM_KEY", "")
+OPENAI_MODEL = os.environ.get("JARVIS_LLM_MODEL", "gpt-4o-mini")
+
+LOCAL_LLM_HOST = "localhost"
+LOCAL_LLM_PORT = 8089
+
+# Streamed answers: batch tokens for the chat window every STREAM_FLUSH_INTERVAL seconds
+# and start speaking each sentence as soon as it is complete
+STREAM_FLUSH_INTERVAL = 0.05
+STREAM_MIN_SPEECH_CHARS = 40  # short sentences are joined so speech doesn't sound choppy
+
+# Semantic cache: reuse an earlier chatbot answer when a new question means the same thing
+SEMCACHE_PATH = "semcache.npy"
+SEMCACHE_DIM = 2 ** 20  # hashed features, enough that two different words rarely share one
+SEMCACHE_WIDTH = 32  # features kept per question; a longer one keeps its heaviest
+SEMCACHE_CAPACITY = 20000  # answers kept before the least recently used is replaced
+SEMCACHE_THRESHOLD = 0.85  # cosine similarity needed to count as the same question
+SEMCACHE_TTL = 7 * 24 * 3600  # seconds an answer stays usable, 0 keeps it forever
+SEMCACHE_HIT_BATCH = 32  # cache hits counted in memory before they are written to jarvis.db
+SEMCACHE_HIT_DELAY = 2  # seconds from a full batch of hits to writing it, while the answer is spoken
+SEMCACHE_RECENT_POSTINGS = 16384  # features of new answers kept beside the index before it is rebuilt
+SEMCACHE_COMMON_SHARE = 0.01  # a feature in more than this share of the questions is only partly read
+
+# Conversation memory: history sent with each chatbot question stays inside these token budgets
+MEMORY_TOKEN_BUDGET = 1200  # summary + related + recent turns
+MEMORY_RECENT_TOKENS = 600  # newest turns sent word for word
+MEMORY_SUMMARY_TOKENS = 200  # rolling summary of everything older
+MEMORY_RECALL_TOKENS = 250  # older turns brought back because they relate to the question
+MEMORY_RECALL_WINDOW = 200  # how many older turns are searched for related ones
+MEMORY_RECALL_THRESHOLD = 0.3
+
+# Face authentication
+FACE_AUTH_DEADLINE = 30  # seconds before an authentication attempt gives up
+FACE_AUTH_RETRIES = 1  # new attempts after a rejected one at startup; 0 accepts the first reject
+FACE_AUTH_CONFIDENCE = 45  # 100 - LBPH distance needed to accept a face
+FACE_DETECTOR = "haar"  # haar, lbp or dnn; python -m engine.auth.detectors calibrate picks one for this machine
+FACE_DETECTOR_PROFILE_PATH = os.path.join("engine", "auth", "detector.json")
+FACE_DETECT_SCALE = 0.5  # detection runs on the frame shrunk by this factor
+FACE_DETECT_SCALE_FACTOR = 1.1  # cascade image pyramid step (haar and lbp)
+FACE_DETECT_MIN_NEIGHBORS = 4  # cascade hits needed to keep a face (haar and lbp)
+FACE_DETECT_MIN_SIZE = 0.1  # smallest face, as a share of the frame's shorter side
+FACE_DNN_CONFIDENCE = 0.7  # score a dnn detection needs
+FACE_DETECTOR_MIN_RECALL = 0.9  # calibration only picks backends that find the face this often
+FACE_DETECTOR_MIN_PRECISION = 0.9  # ... and whose detections are this often a real face
+FACE_REDETECT_EVERY = 15  # frames a face is tracked before detection runs again
+FACE_MOTION_THRESHOLD = 0.002  # share of changed pixels below which a frame counts as still
+FACE_TRACK_MIN_SCORE = 0.6  # template match score below which a tracked face is lost
+FACE_MODEL_POLL_INTERVAL = 2  # seconds between checks for a retrained or newly enrolled face model
+FACE_MATCH_SHORTLIST = 3  # fewest users whose samples are searched after the coarse per-user pass
+FACE_MATCH_MARGIN = 0.005  # ... more when their centroid similarity is within this share of the best
+FACE_MATCH_SHORTLIST_MAX = 32  # most users searched that way
+FACE_MATCH_CANDIDATES = 16  # samples per face that get the exact chi-square distance
+FACE_SAMPLE_COUNT = 100  # face crops taken per enrollment
+FACE_SAMPLE_MIN_SHARPNESS = 15.0  # Laplacian variance below which a crop counts as blurry
+FACE_SAMPLE_MIN_HASH_DISTANCE = 4  # bits a crop's dHash must differ from every kept one
+
+# Camera discovery: the working index and backend are probed once and cached here
+CAMERA_CACHE_PATH = os.path.join("engine", "auth", "camera.json")
+CAMERA_PREFERRED_INDEX = 1  # tried first (external webcam)
+CAMERA_MAX_INDEX = 4  # indices 0..CAMERA_MAX_INDEX-1 are probed
+CAMERA_WARM_TTL = 60  # seconds a prewarmed camera stays open if nobody uses it
+CAMERA_HOLD_TTL = 10  # seconds the camera stays open after a rejected face auth attempt, for the retry
+
+# Multi-frame auth decision (sequential probability ratio test on LBPH distances)
+FACE_SPRT_ALPHA = 0.01  # accepted false-accept rate
+FACE_SPRT_BETA = 0.05  # accepted false-reject rate
+FACE_GENUINE_DISTANCE = (40.0, 12.0)  # mean and spread of the LBPH distance for the owner
+FACE_IMPOSTOR_DISTANCE = (75.0, 12.0)  # mean and spread for anybody else
+FACE_LLR_CLIP = 2.0  # most evidence one frame can add, so no single frame decides
+FACE_REJECT_MIN_FRAMES = 15  # predictions needed before an attempt can be rejected ahead of the deadline
+FACE_REJECT_MIN_SECONDS = 3.0  # ... and seconds since it started
+FACE_STILL_WEIGHT = 0.25  # weight of a repeated prediction for a face that didn't move
+FACE_AUTH_HEADLESS = True  # no OpenCV window; progress shows in the web UI instead
+FACE_PREVIEW_FPS = 5  # camera snapshots sent to the web UI per second, 0 turns them off
+FACE_PREVIEW_WIDTH = 240
+FACE_PREVIEW_QUALITY = 60  # JPEG quality of the snapshots
+
+# Session token: a restart soon after a successful face auth skips the camera
+SESSION_TTL = 10 * 60  # seconds a successful face auth is remembered
+SESSION_PATH = os.path.join("engine", "auth", "session.json")
+SESSION_KEY_PATH = os.path.join("engine", "auth", "session.key")  # signing key, made on first use
+SESSION_WATCH_INTERVAL = 5  # seconds between lock/suspend checks while the assistant runs
+
+# Presence monitor: after face auth, checks now and then that the owner is still there
+FACE_PRESENCE_INTERVAL = 5  # seconds between camera samples
+FACE_PRESENCE_WARMUP_FRAMES = 5  # frames dropped after opening the camera, while exposure settles
+FACE_PRESENCE_FPS = 5  # frame rate asked of the camera the monitor keeps open
+FACE_PRESENCE_RELEASE_CAMERA = False  # open and close the camera for every sample: LED off between samples, but each open takes seconds
+FACE_PRESENCE_RELEASE_MIN_INTERVAL = 30  # seconds between samples at least, when FACE_PRESENCE_RELEASE_CAMERA is on
+FACE_PRESENCE_SCALE = 0.5  # downscale of a sampled frame before face detection
+FACE_PRESENCE_MOTION = 0.01  # share of changed pixels below which a sample keeps the last verdict
+FACE_PRESENCE_ABSENT_AFTER = 24  # samples in a row without the owner (two minutes) before the session ends
+FACE_PRESENCE_MAX_CPU = 2  # percent of one core the monitor may use; the interval stretches to fit
+FACE_PRESENCE_LOCK = False  # lock the workstation too, not only drop the session token
+
+# Wake words, from the keywords the porcupine engine ships with
+HOTWORD_KEYWORDS = ["jarvis", "alexa"]
+
+# Voice verification: the wake word is checked against the owner's voice template
+VOICE_AUTH = "off"  # "fast" tries the voice before the camera, "second" asks for it after face auth too
+VOICE_HOTWORD_VERIFY = False  # ignore wake words spoken by anybody but an enrolled user
+VOICE_SAMPLE_RATE = 16000  # same as the wake word engine
+VOICE_VERIFY_SECONDS = 1.5  # audio checked per attempt: the wake word and a little around it
+VOICE_ENROLL_COUNT = 5  # recordings of the wake word per enrollment
+VOICE_FRAME_MS = 25
+VOICE_HOP_MS = 10
+VOICE_FFT_SIZE = 512
+VOICE_MEL_BANDS = 40
+VOICE_MFCC = 20
+VOICE_SILENCE_DB = 30  # frames this far below the loudest are skipped as silence
+VOICE_SPREAD_FLOOR = 0.5  # smallest per-feature spread a template is allowed
+VOICE_THRESHOLD_MARGIN = 1.5  # enrollment threshold over the farthest enrollment recording
+VOICE_MAX_DISTANCE = 2.0  # threshold when there are too few recordings to estimate one
+
+# Process supervisor (run.py): heartbeats through shared memory, restarts with backoff
+SUPERVISOR_HEARTBEAT_INTERVAL = 1  # seconds between heartbeats of a child
+SUPERVISOR_POLL_INTERVAL = 0.5  # seconds between checks of the children
+SUPERVISOR_UI_TIMEOUT = 30  # seconds without a heartbeat from eel's loop before the UI process counts as hung
+SUPERVISOR_BUSY_TIMEOUT = 300  # seconds a handler that blocks eel's loop on purpose (speech, listening) may take before that counts as a hang
+SUPERVISOR_HOTWORD_TIMEOUT = 10  # same for the hotword listener, which beats from its audio loop
+SUPERVISOR_BACKOFF_BASE = 1  # seconds before the first restart, doubled on every failure in a row
+SUPERVISOR_BACKOFF_MAX = 60
+SUPERVISOR_STABLE_SECONDS = 60  # a child up this long starts over at the shortest backoff when it fails
+SUPERVISOR_AUDIO_CPUS = None  # CPU numbers for the hotword listener, e.g. [1]; None leaves it to the OS
+SUPERVISOR_METRICS_PATH = "supervisor.json"
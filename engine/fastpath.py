@@ -0,0 +1,356 @@
+import ast
+import datetime
+import operator
+import os
+import re
+import time
+
+from engine.config import ASSISTANT_NAME
+
+# Questions that can be answered on this machine without asking the chatbot.
+# Each handler returns an answer string or None when the question isn't its kind.
+# Handlers only take whole questions of a known form: anything extra ("in
+# london", "tomorrow", "of the next full moon") goes to the chatbot, since a
+# partial match would answer a different question.
+
+_handled = 0
+_asked = 0
+_latencies = []
+
+
+_POLITE = re.compile(r"^(?:(?:hey|ok|okay|so|please|can you|could you|would you|tell me|do you know)\s+)+")
+
+
+def _clean(query):
+    query = query.lower().replace(ASSISTANT_NAME, " ")
+    query = re.sub(r"[?!,]|\.$", " ", query)
+    query = re.sub(r"\s+", " ", query).strip()
+    query = re.sub(r"\s+please$", "", _POLITE.sub("", query))
+    return query
+
+
+# ---- clock and calendar ----
+
+def _time(query):
+    if re.fullmatch(r"(what('s| is) the (current )?time|what time is it|what time it is|(the )?(current )?time)"
+                    r"( now| right now)?|time now", query):
+        return "It's " + datetime.datetime.now().strftime("%I:%M %p").lstrip("0")
+    return None
+
+
+def _date(query):
+    now = datetime.datetime.now()
+    if re.fullmatch(r"(what('s| is) (the|today's) date|(the )?date|today's date|what date is it)( today)?"
+                    r"|date today", query):
+        return "Today is " + now.strftime("%A, %d %B %Y")
+    if re.fullmatch(r"(what day is it|which day is it|what('s| is) the day)( today)?|(what|which) day is today", query):
+        return "It's " + now.strftime("%A")
+    if re.fullmatch(r"what year is it( now)?|(what('s| is) the )?current year", query):
+        return "It's " + str(now.year)
+    return None
+
+
+# ---- arithmetic ----
+
+_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+
+_WORDS = [
+    (r"\bmultiplied by\b|\btimes\b|\binto\b|\bx\b", "*"), (r"\bdivided by\b|\bover\b", "/"),
+    (r"\bplus\b|\badded to\b", "+"), (r"\bminus\b|\bless\b", "-"), (r"\bmod(ulo)?\b", "%"),
+    (r"\bto the power of\b|\bpower\b|\^", "**"), (r"\bsquared\b", "**2"), (r"\bcubed\b", "**3"),
+]
+
+
+# Evaluates plain arithmetic only: numbers, + - * / // % ** and brackets
+def safeEval(expression):
+    def walk(node):
+        if isinstance(node, ast.Expression):
+            return walk(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            left, right = walk(node.left), walk(node.right)
+            if isinstance(node.op, ast.Pow) and abs(right) > 100:
+                raise ValueError("exponent too large")
+            return _OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](walk(node.operand))
+        raise ValueError("unsupported expression")
+
+    return walk(ast.parse(expression, mode="eval"))
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return f"{value:.6g}"
+    return str(value)
+
+
+def _arithmetic(query):
+    match = re.fullmatch(r"(?:(?:what(?:'s| is)|calculate) )?(\d+(?:\.\d+)?) ?(?:percent|%) of (\d+(?:\.\d+)?)", query)
+    if match:
+        value = float(match.group(1)) * float(match.group(2)) / 100
+        return f"{match.group(1)} percent of {match.group(2)} is {_number(value)}"
+    match = re.fullmatch(r"(?:(?:what(?:'s| is)|calculate) )?(?:the )?square root of (\d+(?:\.\d+)?)", query)
+    if match:
+        return f"The square root of {match.group(1)} is {_number(float(match.group(1)) ** 0.5)}"
+
+    match = re.search(r"^(?:what(?:'s| is)|calculate|compute|how much is|solve)\s+(.+)$", query)
+    expression = match.group(1) if match else query
+    for pattern, symbol in _WORDS:
+        expression = re.sub(pattern, symbol, expression)
+    expression = expression.replace("=", "").strip()
+    # only digits, operators and brackets may be left, and at least one operator
+    if not re.fullmatch(r"[\d\s.+\-*/%()]+", expression) or not re.search(r"\d\s*[+\-*/%]", expression):
+        return None
+    try:
+        value = safeEval(expression)
+    except (ValueError, SyntaxError, ZeroDivisionError, OverflowError):
+        return None
+    spoken = expression.replace("**", " to the power of ").replace("*", " times ").replace("/", " divided by ")
+    return re.sub(r"\s+", " ", f"{spoken} is {_number(value)}")
+
+
+# ---- unit conversion ----
+
+# unit -> (dimension, factor to the base unit)
+_UNITS = {
+    "millimeter": ("length", 0.001), "centimeter": ("length", 0.01), "meter": ("length", 1.0),
+    "kilometer": ("length", 1000.0), "inch": ("length", 0.0254), "foot": ("length", 0.3048),
+    "yard": ("length", 0.9144), "mile": ("length", 1609.344),
+    "milligram": ("mass", 0.001), "gram": ("mass", 1.0), "kilogram": ("mass", 1000.0),
+    "ounce": ("mass", 28.349523125), "pound": ("mass", 453.59237), "ton": ("mass", 1000000.0),
+    "milliliter": ("volume", 0.001), "liter": ("volume", 1.0), "gallon": ("volume", 3.785411784),
+    "cup": ("volume", 0.2365882365),
+    "second": ("time", 1.0), "minute": ("time", 60.0), "hour": ("time", 3600.0), "day": ("time", 86400.0),
+    "week": ("time", 604800.0),
+    "byte": ("data", 1.0), "kilobyte": ("data", 1024.0), "megabyte": ("data", 1024.0 ** 2),
+    "gigabyte": ("data", 1024.0 ** 3), "terabyte": ("data", 1024.0 ** 4),
+    "kilometer per hour": ("speed", 1 / 3.6), "mile per hour": ("speed", 0.44704), "meter per second": ("speed", 1.0),
+    "celsius": ("temperature", None), "fahrenheit": ("temperature", None), "kelvin": ("temperature", None),
+}
+
+_ALIASES = {
+    "mm": "millimeter", "cm": "centimeter", "m": "meter", "km": "kilometer", "in": "inch", "ft": "foot",
+    "feet": "foot", "yd": "yard", "mi": "mile", "mg": "milligram", "g": "gram", "kg": "kilogram", "kilo": "kilogram",
+    "oz": "ounce", "lb": "pound", "lbs": "pound", "ml": "milliliter", "l": "liter", "litre": "liter",
+    "metre": "meter", "kilometre": "kilometer", "centimetre": "centimeter", "millimetre": "millimeter",
+    "sec": "second", "min": "minute", "hr": "hour", "kb": "kilobyte", "mb": "megabyte", "gb": "gigabyte",
+    "tb": "terabyte", "kmh": "kilometer per hour", "km/h": "kilometer per hour", "kph": "kilometer per hour",
+    "mph": "mile per hour", "m/s": "meter per second", "c": "celsius", "f": "fahrenheit", "k": "kelvin",
+    "degree celsius": "celsius", "degree fahrenheit": "fahrenheit", "centigrade": "celsius",
+}
+
+
+def _unit(name):
+    name = name.strip().replace("degrees ", "degree ")
+    if name in _ALIASES:
+        return _ALIASES[name]
+    if name in _UNITS:
+        return name
+    # plurals: "miles", "inches", "kilometers per hour"
+    for suffix in ("es", "s"):
+        words = name.split(" ")
+        if words[0].endswith(suffix):
+            single = " ".join([words[0][:-len(suffix)]] + words[1:])
+            if single in _UNITS:
+                return single
+            if single in _ALIASES:
+                return _ALIASES[single]
+    return None
+
+
+def _temperature(value, source, target):
+    kelvin = {"celsius": value + 273.15, "fahrenheit": (value - 32) * 5 / 9 + 273.15, "kelvin": value}[source]
+    return {"celsius": kelvin - 273.15, "fahrenheit": (kelvin - 273.15) * 9 / 5 + 32, "kelvin": kelvin}[target]
+
+
+def _plural(unit):
+    if _UNITS[unit][0] == "temperature":
+        return unit
+    words = unit.split(" ")
+    words[0] = {"inch": "inches", "foot": "feet"}.get(words[0], words[0] + "s")  # "miles per hour"
+    return " ".join(words)
+
+
+# One quantity in one unit to one other unit. "5 feet 10 inches to cm" or
+# "km per liter to mpg" don't match and go to the chatbot instead of being
+# answered for a part of the question.
+def _convert(query):
+    match = re.fullmatch(r"(?:convert |what(?:'s| is) )?(-?\d+(?:\.\d+)?)\s*([a-z/ ]+?)\s+(?:to|in|into)\s+([a-z/ ]+)",
+                         query)
+    if match:
+        number, source_name, target_name = match.groups()
+    else:
+        match = re.fullmatch(r"how many ([a-z/ ]+?) (?:are )?in (-?\d+(?:\.\d+)?)\s*([a-z/ ]+)", query)
+        if not match:
+            return None
+        target_name, number, source_name = match.groups()
+    value = float(number)
+    source, target = _unit(source_name), _unit(target_name)
+    if source is None or target is None or _UNITS[source][0] != _UNITS[target][0]:
+        return None
+    if _UNITS[source][0] == "temperature":
+        result = _temperature(value, source, target)
+    else:
+        result = value * _UNITS[source][1] / _UNITS[target][1]
+    return f"{_number(value)} {source_name.strip()} is {_number(round(result, 4))} {target if result == 1 else _plural(target)}"
+
+
+# ---- system status ----
+
+def _battery():
+    try:
+        import psutil
+        battery = psutil.sensors_battery()
+        if battery is None:
+            return None
+        return battery.percent, battery.power_plugged
+    except ImportError:
+        pass
+    if os.name == "nt":
+        import ctypes
+
+        class SYSTEM_POWER_STATUS(ctypes.Structure):
+            _fields_ = [("ACLineStatus", ctypes.c_byte), ("BatteryFlag", ctypes.c_byte),
+                        ("BatteryLifePercent", ctypes.c_byte), ("SystemStatusFlag", ctypes.c_byte),
+                        ("BatteryLifeTime", ctypes.c_ulong), ("BatteryFullLifeTime", ctypes.c_ulong)]
+
+        status = SYSTEM_POWER_STATUS()
+        if not ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(status)) or status.BatteryLifePercent == -1:
+            return None
+        return status.BatteryLifePercent & 0xff, status.ACLineStatus == 1
+    for supply in ("BAT0", "BAT1"):
+        path = f"/sys/class/power_supply/{supply}"
+        if os.path.isdir(path):
+            with open(path + "/capacity") as f:
+                percent = int(f.read())
+            with open(path + "/status") as f:
+                plugged = f.read().strip() != "Discharging"
+            return percent, plugged
+    return None
+
+
+def _uptime():
+    if os.name == "nt":
+        import ctypes
+        return ctypes.windll.kernel32.GetTickCount64() / 1000
+    with open("/proc/uptime") as f:
+        return float(f.read().split()[0])
+
+
+# (idle, total) CPU time of the whole machine since boot, in any unit
+def _cpu_times():
+    try:
+        import psutil
+        times = psutil.cpu_times()
+        return times.idle + getattr(times, "iowait", 0.0), sum(times)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        import ctypes
+        from ctypes import wintypes
+
+        idle, kernel, user = wintypes.FILETIME(), wintypes.FILETIME(), wintypes.FILETIME()
+        ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel), ctypes.byref(user))
+        value = lambda t: (t.dwHighDateTime << 32) | t.dwLowDateTime
+        return value(idle), value(kernel) + value(user)  # kernel time includes idle time
+    with open("/proc/stat") as f:
+        fields = [int(v) for v in f.readline().split()[1:]]
+    return fields[3] + fields[4], sum(fields)
+
+
+# Usage since the previous sample instead of sleeping through a measuring
+# interval, so the answer takes microseconds. The first sample is taken at
+# import; samples closer together than this repeat the last figure.
+_CPU_MIN_WINDOW = 0.5
+_cpu_sample = None  # (monotonic time, idle, total, percent)
+
+
+def _cpu_percent():
+    global _cpu_sample
+    now = time.monotonic()
+    idle, total = _cpu_times()
+    if _cpu_sample is None:
+        _cpu_sample = (now, idle, total, None)
+        return None
+    then, last_idle, last_total, percent = _cpu_sample
+    if now - then >= _CPU_MIN_WINDOW or percent is None:
+        busy = (total - last_total) - (idle - last_idle)
+        percent = round(100 * busy / max(1, total - last_total), 1)
+        _cpu_sample = (now, idle, total, percent)
+    return percent
+
+
+try:
+    _cpu_percent()
+except Exception:
+    pass  # no CPU counters here; the question then goes to the chatbot
+
+
+def _status(query):
+    if re.fullmatch(r"(what('s| is) (the |my )?)?battery( level| status| percentage| charge)?"
+                    r"|how much battery (is left|do i have( left)?)|(is )?(the |my )?battery charging", query):
+        battery = _battery()
+        if battery is None:
+            return "I can't find a battery on this machine"
+        percent, plugged = battery
+        return f"Battery is at {percent} percent" + (" and charging" if plugged else "")
+    if re.fullmatch(r"(what('s| is) (the |my )?)?(cpu|processor) (usage|load)|how busy is (the|my) (cpu|computer|system)",
+                    query):
+        percent = _cpu_percent()
+        return None if percent is None else f"CPU usage is {percent} percent"
+    if re.fullmatch(r"(what('s| is) (the |my )?)?(system |computer )?uptime"
+                    r"|how long (has|have) (the |my )?(system|computer|pc) been (on|running|up)", query):
+        seconds = int(_uptime())
+        hours, minutes = seconds // 3600, seconds % 3600 // 60
+        return f"The system has been up for {hours} hours and {minutes} minutes"
+    return None
+
+
+HANDLERS = [_time, _date, _status, _convert, _arithmetic]
+
+
+# Answer query locally when possible; None means it should go to the chatbot
+def answer(query):
+    global _handled, _asked
+    started = time.perf_counter()
+    query = _clean(query)
+    _asked += 1
+    for handler in HANDLERS:
+        try:
+            result = handler(query)
+        except Exception as e:
+            print("fastpath:", handler.__name__, repr(e))
+            result = None
+        if result is not None:
+            _handled += 1
+            _latencies.append((time.perf_counter() - started) * 1000)
+            del _latencies[:-500]
+            return result
+    return None
+
+
+# Share of questions answered locally instead of by the chatbot
+def stats():
+    samples = sorted(_latencies)
+    return {
+        "asked": _asked,
+        "answered_locally": _handled,
+        "offload_rate": round(_handled / _asked, 3) if _asked else 0.0,
+        "p50_ms": round(samples[len(samples) // 2], 3) if samples else None,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    for question in sys.argv[1:] or ["what time is it", "what is 15 percent of 240", "convert 10 miles to km",
+                                      "what is (3 + 4) * 12", "battery status", "who made you"]:
+        print(f"{question!r} -> {answer(question)!r}")
+    print(stats())
@@ -1,31 +1,41 @@
 import os
 from shlex import quote
-import re
 import sqlite3
-import struct
 import subprocess
 import time
 import webbrowser
-from playsound import playsound
 import eel
-import pyaudio
-import pyautogui
+from engine import supervisor
+from engine.auth import session
 from engine.command import speak
-from engine.config import ASSISTANT_NAME
-# Playing assiatnt sound function
-import pywhatkit as kit
-import pvporcupine
+from engine.config import ASSISTANT_NAME, DB_PATH, LLM_FALLBACK_REPLY
+from engine.startup import lazy
+# heavy libraries load on first use, not before the UI is up (pywhatkit even goes online on import)
+playsound = lazy("playsound")
+pyautogui = lazy("pyautogui")
+kit = lazy("pywhatkit")
 
 from engine.helper import extract_yt_term, remove_words
-from hugchat import hugchat
+from engine import llm, memory, semcache
+from engine.stream import streamReply
+
+con = None
+cursor = None
 
-con = sqlite3.connect("jarvis.db")
-cursor = con.cursor()
+def openDB():
+    # opened on the first command that needs it instead of at import
+    global con, cursor
+    if con is None:
+        con = sqlite3.connect(DB_PATH)
+        cursor = con.cursor()
+    return cursor
 
+# Playing assiatnt sound function
 @eel.expose
+@supervisor.busy()
 def playAssistantSound():
     music_dir = "www\\assets\\audio\\start_sound.mp3"
-    playsound(music_dir)
+    playsound.playsound(music_dir)
 
     
 def openCommand(query):
@@ -38,6 +48,7 @@ def openCommand(query):
     if app_name != "":
 
         try:
+            cursor = openDB()
             cursor.execute(
                 'SELECT path FROM sys_command WHERE name IN (?)', (app_name,))
             results = cursor.fetchall()
@@ -72,43 +83,10 @@ def PlayYoutube(query):
     kit.playonyt(search_term)
 
 
+# Kept for scripts that call it; run.py starts engine.hotword_worker directly
 def hotword():
-    porcupine=None
-    paud=None
-    audio_stream=None
-    try:
-       
-        # pre trained keywords    
-        porcupine=pvporcupine.create(keywords=["jarvis","alexa"]) 
-        paud=pyaudio.PyAudio()
-        audio_stream=paud.open(rate=porcupine.sample_rate,channels=1,format=pyaudio.paInt16,input=True,frames_per_buffer=porcupine.frame_length)
-        
-        # loop for streaming
-        while True:
-            keyword=audio_stream.read(porcupine.frame_length)
-            keyword=struct.unpack_from("h"*porcupine.frame_length,keyword)
-
-            # processing keyword comes from mic 
-            keyword_index=porcupine.process(keyword)
-
-            # checking first keyword detetcted for not
-            if keyword_index>=0:
-                print("hotword detected")
-
-                # pressing shorcut key win+j
-                import pyautogui as autogui
-                autogui.keyDown("win")
-                autogui.press("j")
-                time.sleep(2)
-                autogui.keyUp("win")
-                
-    except:
-        if porcupine is not None:
-            porcupine.delete()
-        if audio_stream is not None:
-            audio_stream.close()
-        if paud is not None:
-            paud.terminate()
+    from engine.hotword_worker import listen
+    listen()
 
 
 
@@ -120,6 +98,7 @@ def findContact(query):
 
     try:
         query = query.strip().lower()
+        cursor = openDB()
         cursor.execute("SELECT mobile_no FROM contacts WHERE LOWER(name) LIKE ? OR LOWER(name) LIKE ?", ('%' + query + '%', query + '%'))
         results = cursor.fetchall()
         print(results[0][0])
@@ -175,13 +154,33 @@ def whatsApp(mobile_no, message, flag, name):
 
 # chat bot 
 def chatBot(query):
+    if session.held():
+        return None
     user_input = query.lower()
-    chatbot = hugchat.ChatBot(cookie_path="engine\cookies.json")
-    id = chatbot.new_conversation()
-    chatbot.change_conversation(id)
-    response =  chatbot.chat(user_input)
-    print(response)
-    speak(response)
+    cache = semcache.getCache()
+    history = memory.getMemory()
+    prompt = history.buildPrompt(user_input)
+    # a follow-up ("why?", "tell me more about it") gets neither a cached answer nor caches its own
+    standalone = not memory.dependsOnContext(user_input)
+    response = cache.lookup(user_input) if standalone else None
+    if response is not None:
+        print(response)
+        speak(response)
+    else:
+        outcome = {}
+        try:
+            response = streamReply(llm.askStream(prompt, outcome=outcome))
+        except llm.LLMError as e:
+            print("chatbot unavailable:", e)
+            response = LLM_FALLBACK_REPLY
+            speak(response)
+            return response
+        # half an answer, or the offline stand-in's, would be served again for a week
+        if standalone and outcome["complete"] and not outcome["offline"] and response.strip():
+            cache.store(user_input, response)
+        print(response)
+    history.add("user", user_input)
+    history.add("assistant", response)
     return response
 
 # android automation
@@ -0,0 +1,124 @@
+# Run from the project folder: python -m engine.hotword_worker --measure
+# The wake word listener on its own. It needs the keyword engine, the
+# microphone and one key press, so that is all it imports: no UI, chatbot,
+# speech or database modules. Keep it that way; check with --measure.
+import time
+
+STARTED = time.perf_counter()
+
+import struct
+import sys
+from collections import deque
+
+from engine import supervisor
+from engine.config import HOTWORD_KEYWORDS, VOICE_HOTWORD_VERIFY, VOICE_VERIFY_SECONDS
+
+
+# Win+J opens the assistant window. keybd_event instead of pyautogui, which
+# would pull in a dozen modules for one shortcut.
+def press_shortcut():
+    if sys.platform == "win32":
+        import ctypes
+
+        user32 = ctypes.windll.user32
+        VK_LWIN, VK_J, KEYUP = 0x5B, 0x4A, 0x0002
+        user32.keybd_event(VK_LWIN, 0, 0, 0)
+        user32.keybd_event(VK_J, 0, 0, 0)
+        user32.keybd_event(VK_J, 0, KEYUP, 0)
+        time.sleep(2)
+        user32.keybd_event(VK_LWIN, 0, KEYUP, 0)
+    else:
+        import pyautogui
+
+        pyautogui.keyDown("win")
+        pyautogui.press("j")
+        time.sleep(2)
+        pyautogui.keyUp("win")
+
+
+def report():
+    rss = supervisor.rss()
+    return (f"hotword worker: listening {time.perf_counter() - STARTED:.2f}s after start, "
+            f"{rss / 2 ** 20:.0f} MB resident" if rss else "")
+
+
+# Listen until something fails. Errors are not swallowed: the process ends
+# and the supervisor in run.py restarts it.
+def listen():
+    import pvporcupine
+    import pyaudio
+
+    porcupine = None
+    paud = None
+    audio_stream = None
+    try:
+        porcupine = pvporcupine.create(keywords=HOTWORD_KEYWORDS)
+        paud = pyaudio.PyAudio()
+        audio_stream = paud.open(rate=porcupine.sample_rate, channels=1, format=pyaudio.paInt16, input=True,
+                                 frames_per_buffer=porcupine.frame_length)
+
+        # the last VOICE_VERIFY_SECONDS of audio, so the wake word itself can be checked against the owner's voice
+        recent = deque(maxlen=int(VOICE_VERIFY_SECONDS * porcupine.sample_rate / porcupine.frame_length))
+        voices = owners = None
+        if VOICE_HOTWORD_VERIFY:
+            # numpy and the voice templates only when the check is switched on
+            import numpy as np
+
+            from engine.auth.users import getUsers
+            from engine.voiceauth import getVoiceProfiles
+            if getVoiceProfiles().users():
+                voices, owners = getVoiceProfiles(), getUsers().owners()
+
+        supervisor.ready()
+        print(report())
+        unpack = struct.Struct("h" * porcupine.frame_length).unpack_from
+        while True:
+            pcm = audio_stream.read(porcupine.frame_length)
+            supervisor.beat()
+            recent.append(pcm)
+            if porcupine.process(unpack(pcm)) < 0:
+                continue
+            print("hotword detected")
+            if voices is not None:
+                user, distance, accepted = voices.verify(np.frombuffer(b"".join(recent), np.int16), owners,
+                                                         porcupine.sample_rate)
+                if not accepted:
+                    print(f"hotword ignored: not an enrolled voice (distance {distance:.2f})")
+                    continue
+            press_shortcut()
+    finally:
+        if porcupine is not None:
+            porcupine.delete()
+        if audio_stream is not None:
+            audio_stream.close()
+        if paud is not None:
+            paud.terminate()
+
+
+# Import cost of this worker next to the old route through engine.features,
+# each in a fresh interpreter: modules loaded, seconds, resident MB
+def measure():
+    import json
+    import subprocess
+
+    code = ("import sys, time; t = time.perf_counter(); import {module}; {extra}"
+            "from engine.supervisor import rss; import json; "
+            "print(json.dumps([len(sys.modules), time.perf_counter() - t, rss()]))")
+    routes = {"hotword_worker": ("engine.hotword_worker", "import pvporcupine, pyaudio; "),
+              "engine.features": ("engine.features", "")}
+    for name, (module, extra) in routes.items():
+        out = subprocess.run([sys.executable, "-c", code.format(module=module, extra=extra)],
+                             capture_output=True, text=True)
+        if out.returncode:
+            print(f"{name}: import failed: {out.stderr.strip().splitlines()[-1]}")
+            continue
+        modules, seconds, rss = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{name}: {modules} modules, imported in {seconds:.2f}s, "
+              f"{rss / 2 ** 20:.0f} MB resident" if rss else f"{name}: {modules} modules in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    if "--measure" in sys.argv:
+        measure()
+    else:
+        listen()
@@ -0,0 +1,512 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+
+from engine import config
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+class LLMUnavailable(LLMError):
+    pass
+
+
+_END = object()
+
+
+# Blocking client libraries (hugchat) have no timeout of their own, so their
+# calls run on a daemon thread of their own and the caller stops waiting at
+# the deadline. A thread per call, not a pool: a call that hangs can't be
+# cancelled, and in a pool hung calls would take up every worker for good.
+def _inThread(fn, *args):
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-call", daemon=True).start()
+    return future
+
+
+# Run a blocking token generator on a worker thread and hand its tokens over
+# through a queue, so the caller can stop waiting after timeout seconds of silence
+def _threadStream(make_tokens, timeout, name):
+    tokens = queue.Queue()
+
+    def pump():
+        try:
+            for token in make_tokens():
+                tokens.put(token)
+            tokens.put(_END)
+        except Exception as e:
+            tokens.put(e)
+
+    threading.Thread(target=pump, name="llm-stream", daemon=True).start()
+    while True:
+        try:
+            item = tokens.get(timeout=timeout)
+        except queue.Empty:
+            raise LLMTimeout(f"{name} stream stalled for {timeout:.1f}s")
+        if item is _END:
+            return
+        if isinstance(item, LLMError):
+            raise item
+        if isinstance(item, Exception):
+            raise LLMError(f"{name}: {item}") from item
+        timeout = config.LLM_STREAM_IDLE_TIMEOUT
+        yield item
+
+
+class CircuitBreaker:
+    # closed: calls go through, open: calls fail fast, half-open: one trial call
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False  # the half-open trial call is under way
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    # True when a call may go ahead. In half-open only the first caller gets
+    # through, until its success() or failure() settles the state.
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "half-open":
+                if self.trial:
+                    return False
+                self.trial = True
+            return state != "open"
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.trial = False
+            self.failures += 1
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class BackendMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=500)
+        self.lock = threading.Lock()
+
+    def reject(self):
+        with self.lock:
+            self.rejected += 1
+
+    # An error after the call was already recorded, e.g. a stream that broke
+    # off: counted, but adds no latency sample
+    def fail(self, error):
+        with self.lock:
+            if isinstance(error, LLMTimeout):
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+    def record(self, seconds, error=None):
+        with self.lock:
+            self.calls += 1
+            self.latencies.append(seconds)
+            if isinstance(error, LLMTimeout):
+                self.timeouts += 1
+            elif error is not None:
+                self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self.latencies)
+            calls, errors, timeouts, rejected = self.calls, self.errors, self.timeouts, self.rejected
+
+        def pct(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "timeouts": timeouts,
+            "rejected": rejected,
+            "error_rate": round((errors + timeouts) / calls, 3) if calls else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+        }
+
+
+class LLMBackend:
+    name = "base"
+    offline = False  # canned answers only, never worth caching
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(config.LLM_BREAKER_THRESHOLD, config.LLM_BREAKER_COOLDOWN)
+        self.metrics = BackendMetrics()
+
+    # False when the backend is not configured on this machine
+    def available(self):
+        return True
+
+    # Return the full answer for prompt, giving up after timeout seconds
+    def complete(self, prompt, timeout):
+        raise NotImplementedError
+
+    # Yield the answer in pieces as it is generated; timeout bounds the wait
+    # for the first piece. Backends that cannot stream yield one piece.
+    def stream(self, prompt, timeout):
+        yield self.complete(prompt, timeout)
+
+    # Do the slow setup (logging in, connecting) before the first question
+    def warmUp(self):
+        pass
+
+
+class HugChatBackend(LLMBackend):
+    name = "hugchat"
+
+    def __init__(self, cookie_path=config.HUGCHAT_COOKIES):
+        super().__init__()
+        self.cookie_path = cookie_path
+        self.chatbot = None
+        self.login_lock = threading.Lock()
+
+    def _client(self):
+        # logging in is the slow part, so the client is kept between questions
+        with self.login_lock:
+            if self.chatbot is None:
+                from hugchat import hugchat
+                self.chatbot = hugchat.ChatBot(cookie_path=self.cookie_path)
+            return self.chatbot
+
+    def warmUp(self):
+        self._client()
+
+    def _chat(self, prompt):
+        chatbot = self._client()
+        id = chatbot.new_conversation()
+        chatbot.change_conversation(id)
+        return str(chatbot.chat(prompt))
+
+    def complete(self, prompt, timeout):
+        try:
+            return _inThread(self._chat, prompt).result(timeout=timeout)
+        except FutureTimeout:
+            # the call can't be stopped; its thread ends whenever hugchat returns
+            raise LLMTimeout(f"hugchat did not answer within {timeout:.1f}s")
+
+    def _tokens(self, prompt):
+        chatbot = self._client()
+        id = chatbot.new_conversation()
+        chatbot.change_conversation(id)
+        for data in chatbot.chat(prompt):
+            if data and data.get("token"):
+                yield data["token"]
+
+    def stream(self, prompt, timeout):
+        return _threadStream(lambda: self._tokens(prompt), timeout, self.name)
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, base_url=config.OPENAI_BASE_URL, api_key=config.OPENAI_API_KEY, model=config.OPENAI_MODEL):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+
+    def available(self):
+        return bool(self.api_key)
+
+    def _request(self, prompt, timeout, **extra):
+        body = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        body.update(extra)
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = "Bearer " + self.api_key
+        req = urlrequest.Request(self.base_url + "/chat/completions", data=json.dumps(body).encode("utf-8"),
+                                 headers=headers, method="POST")
+        return urlrequest.urlopen(req, timeout=timeout)
+
+    def _error(self, e, timeout):
+        if isinstance(e, TimeoutError) or "timed out" in str(e):
+            return LLMTimeout(f"{self.name} did not answer within {timeout:.1f}s")
+        return LLMError(f"{self.name} request failed: {e}")
+
+    def complete(self, prompt, timeout):
+        try:
+            with self._request(prompt, timeout) as resp:
+                data = json.loads(resp.read().decode("utf-8"))
+        except OSError as e:
+            raise self._error(e, timeout) from e
+        return data["choices"][0]["message"]["content"]
+
+    def _chunks(self, prompt, timeout):
+        # server sent events: one "data: {json}" line per chunk, "data: [DONE]" at the end
+        try:
+            with self._request(prompt, timeout, stream=True) as resp:
+                for line in resp:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        return
+                    delta = json.loads(payload)["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+        except OSError as e:
+            raise self._error(e, timeout) from e
+        raise LLMError(f"{self.name} stream closed before the end of the answer")
+
+    def stream(self, prompt, timeout):
+        # the socket timeout only keeps the reading thread from hanging for good;
+        # _threadStream waits `timeout` for the first chunk and LLM_STREAM_IDLE_TIMEOUT between the rest
+        socket_timeout = max(timeout, config.LLM_STREAM_IDLE_TIMEOUT)
+        return _threadStream(lambda: self._chunks(prompt, socket_timeout), timeout, self.name)
+
+
+class LocalBackend(OpenAIBackend):
+    # Talks to the stand-in server started with `python -m engine.llm --serve`
+    name = "local"
+    offline = True
+
+    def __init__(self, host=config.LOCAL_LLM_HOST, port=config.LOCAL_LLM_PORT):
+        super().__init__(base_url=f"http://{host}:{port}/v1", api_key="", model="jarvis-local")
+
+    def available(self):
+        return True
+
+
+BACKEND_TYPES = {
+    "hugchat": HugChatBackend,
+    "openai": OpenAIBackend,
+    "local": LocalBackend,
+}
+
+_backends = None
+
+
+def getBackends():
+    global _backends
+    if _backends is None:
+        _backends = [BACKEND_TYPES[name]() for name in config.LLM_BACKENDS]
+    return _backends
+
+
+def _backoff(attempt):
+    # exponential backoff with full jitter so retries from restarts don't line up
+    return random.uniform(0, config.LLM_RETRY_BACKOFF * (2 ** attempt))
+
+
+def _call(backend, fn, deadline):
+    last_error = None
+    for attempt in range(config.LLM_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not backend.breaker.allow():
+            backend.metrics.reject()
+            break
+        started = time.monotonic()
+        try:
+            result = fn(remaining)
+        except LLMError as e:
+            last_error = e
+        except Exception as e:
+            last_error = LLMError(f"{backend.name}: {e}")
+        else:
+            backend.metrics.record(time.monotonic() - started)
+            backend.breaker.success()
+            return result
+        backend.metrics.record(time.monotonic() - started, last_error)
+        backend.breaker.failure()
+        print(f"llm: {backend.name} attempt {attempt + 1} failed: {last_error}")
+        delay = _backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            break
+        time.sleep(delay)
+    raise last_error or LLMUnavailable(f"{backend.name} skipped")
+
+
+# Configured backends whose breaker isn't open. This only looks: the half-open
+# trial is taken by the call itself in _call().
+def _usable():
+    for backend in getBackends():
+        if not backend.available():
+            continue
+        if backend.breaker.state == "open":
+            backend.metrics.reject()
+            continue
+        yield backend
+
+
+# Ask the configured backends in order; raises LLMUnavailable when none answered in time
+def ask(prompt, timeout=config.LLM_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    errors = []
+    for backend in _usable():
+        try:
+            return _call(backend, lambda remaining: backend.complete(prompt, remaining), deadline)
+        except LLMError as e:
+            errors.append(f"{backend.name}: {e}")
+        if time.monotonic() >= deadline:
+            break
+    raise LLMUnavailable("; ".join(errors) or "no chatbot backend available")
+
+
+def _firstToken(backend, prompt, timeout):
+    tokens = iter(backend.stream(prompt, timeout))
+    first = next(tokens, "")
+    if not first:
+        raise LLMError(f"{backend.name} sent an empty answer")
+    return first, tokens
+
+
+# Same as ask() but yields the answer piece by piece. Retries and fail-over only
+# happen before the first piece arrives; the deadline covers time to first piece.
+# If given, outcome is filled in with the backend that answered, whether it is
+# the offline stand-in and whether the answer arrived complete, so the caller
+# can tell a real answer from one that broke off.
+def askStream(prompt, timeout=config.LLM_TIMEOUT, outcome=None):
+    outcome = {} if outcome is None else outcome
+    outcome.update(backend=None, offline=False, complete=False)
+    deadline = time.monotonic() + timeout
+    errors = []
+    for backend in _usable():
+        try:
+            first, tokens = _call(backend, lambda remaining: _firstToken(backend, prompt, remaining), deadline)
+        except LLMError as e:
+            errors.append(f"{backend.name}: {e}")
+            if time.monotonic() >= deadline:
+                break
+            continue
+        outcome.update(backend=backend.name, offline=backend.offline)
+        yield first
+        try:
+            yield from tokens
+        except LLMError as e:
+            backend.breaker.failure()
+            backend.metrics.fail(e)
+            print(f"llm: {backend.name} stream broke off: {e}")
+            return
+        outcome["complete"] = True
+        return
+    raise LLMUnavailable("; ".join(errors) or "no chatbot backend available")
+
+
+# Get the first backend that would be asked ready, e.g. while the assistant boots
+def warmUp():
+    for backend in _usable():
+        backend.warmUp()
+        return backend.name
+    return None
+
+
+def metrics():
+    return {backend.name: dict(backend.metrics.snapshot(), state=backend.breaker.state) for backend in getBackends()}
+
+
+def printMetrics():
+    for name, m in metrics().items():
+        print(f"llm {name}: {m}")
+
+
+# Minimal OpenAI compatible server used when no real backend is reachable
+class _LocalHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        messages = body.get("messages") or [{"content": ""}]
+        question = messages[-1].get("content", "")
+        answer = f"I am running in offline mode, so I can't answer \"{question}\" properly yet."
+        if body.get("stream"):
+            self._stream(answer)
+            return
+        time.sleep(self.delay)
+        data = json.dumps({
+            "object": "chat.completion",
+            "model": body.get("model", "jarvis-local"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, answer):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.delay / max(1, len(words)))
+            chunk = {"choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serveLocal(host=config.LOCAL_LLM_HOST, port=config.LOCAL_LLM_PORT, delay=0.0):
+    _LocalHandler.delay = delay
+    server = ThreadingHTTPServer((host, port), _LocalHandler)
+    print(f"local llm stand-in listening on http://{host}:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Jarvis chatbot backends")
+    parser.add_argument("--serve", action="store_true", help="run the local stand-in server")
+    parser.add_argument("--delay", type=float, default=0.0, help="artificial answer delay for the stand-in server")
+    parser.add_argument("--ask", help="ask the configured backends one question")
+    args = parser.parse_args()
+
+    if args.serve:
+        serveLocal(delay=args.delay)
+    elif args.ask:
+        try:
+            print(ask(args.ask))
+        except LLMUnavailable as e:
+            print("unavailable:", e)
+        printMetrics()
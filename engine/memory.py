@@ -0,0 +1,186 @@
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+
+from engine import config
+from engine.semcache import embed, STOPWORDS
+
+_SENTENCE = re.compile(r'(?<=[.!?])\s+')
+
+# Words that point back at earlier turns ("why is it so big", "tell me more")
+_REFERRING = {
+    "it", "its", "that", "this", "these", "those", "they", "them", "their", "he", "him", "his", "she", "her",
+    "there", "then", "else", "more", "again", "also", "too", "why", "same", "another", "other", "instead",
+    "previous", "earlier", "above", "last", "one", "ones",
+}
+_CONTINUING = ("and ", "but ", "so ", "what about", "how about", "what if", "ok ", "okay ")
+
+
+# Rough token count, close enough to keep prompts inside a budget
+def countTokens(text):
+    return max(1, int(len(text.split()) * 1.3))
+
+
+def _trim(text, budget):
+    words = text.split()
+    keep = int(budget / 1.3)
+    return text if len(words) <= keep else " ".join(words[:keep]) + " ..."
+
+
+# Extractive summary: keep the sentences with the most frequent content words,
+# favouring newer ones, in their original order until the token budget is used up
+def summarize(text, budget):
+    sentences = [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+    if countTokens(text) <= budget:
+        return " ".join(sentences)
+    words = Counter(w for w in re.findall(r"[a-z0-9']+", text.lower()) if w not in STOPWORDS and len(w) > 2)
+
+    def score(sentence):
+        found = [words[w] for w in re.findall(r"[a-z0-9']+", sentence.lower()) if w in words]
+        return sum(found) / (len(found) + 1)
+
+    count = len(sentences)
+    ranked = sorted(range(count), key=lambda i: score(sentences[i]) * (0.5 + i / count), reverse=True)
+    chosen, seen, used = [], set(), 0
+    for i in ranked:
+        cost = countTokens(sentences[i])
+        key = re.sub(r"[^a-z ]", "", sentences[i].lower())
+        if used + cost > budget or key in seen:
+            continue
+        chosen.append(i)
+        seen.add(key)
+        used += cost
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+
+# True for a question that only makes sense after the turns before it. Its
+# answer is only right in that conversation, so it mustn't be cached.
+def dependsOnContext(query):
+    words = re.findall(r"[a-z0-9']+", query.lower())
+    if any(w in _REFERRING for w in words) or query.lower().lstrip().startswith(_CONTINUING):
+        return True
+    return sum(w not in STOPWORDS for w in words) < 2  # "why?", "go on": too little to stand alone
+
+
+def _similarity(a, b):
+    common, ia, ib = np.intersect1d(a[0], b[0], assume_unique=True, return_indices=True)
+    return float(a[1][ia] @ b[1][ib]) if len(common) else 0.0
+
+
+# Conversation history for the chatbot. Every turn is stored in jarvis.db;
+# the prompt gets a rolling summary of old turns, the few old turns most
+# related to the question and as many recent turns as the budget allows.
+class ConversationMemory:
+    def __init__(self, db_path=config.DB_PATH, session=None):
+        self.session = session or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute('''CREATE TABLE IF NOT EXISTS conversation_turns (
+            id INTEGER PRIMARY KEY, session TEXT, role TEXT, text TEXT, tokens INTEGER, created REAL)''')
+        self.con.execute('''CREATE INDEX IF NOT EXISTS conversation_turns_session
+            ON conversation_turns (session, id)''')
+        self.con.execute('''CREATE TABLE IF NOT EXISTS conversation_summaries (
+            session TEXT PRIMARY KEY, summary TEXT, upto INTEGER, tokens INTEGER)''')
+        self.con.commit()
+
+    def add(self, role, text):
+        with self.lock:
+            self.con.execute("INSERT INTO conversation_turns (session, role, text, tokens, created) VALUES (?, ?, ?, ?, ?)",
+                             (self.session, role, text, countTokens(text), time.time()))
+            self.con.commit()
+            self._compact()
+
+    def _summary(self):
+        row = self.con.execute("SELECT summary, upto FROM conversation_summaries WHERE session = ?",
+                               (self.session,)).fetchone()
+        return row if row else ("", 0)
+
+    def _recent(self, after):
+        # newest turns that fit the recent budget, oldest first
+        turns, used = [], 0
+        for row in self.con.execute("SELECT id, role, text, tokens FROM conversation_turns "
+                                    "WHERE session = ? AND id > ? ORDER BY id DESC", (self.session, after)):
+            if used + row[3] > config.MEMORY_RECENT_TOKENS and turns:
+                break
+            turns.append(row)
+            used += row[3]
+        return turns[::-1]
+
+    def _compact(self):
+        # turns that fell out of the recent window are folded into the summary
+        summary, upto = self._summary()
+        recent = self._recent(upto)
+        if not recent:
+            return
+        first_recent = recent[0][0]
+        old = self.con.execute("SELECT role, text FROM conversation_turns WHERE session = ? AND id > ? AND id < ? "
+                               "ORDER BY id", (self.session, upto, first_recent)).fetchall()
+        if not old:
+            return
+        text = " ".join([summary] + [_trim(t, config.MEMORY_SUMMARY_TOKENS) if r == "assistant" else t for r, t in old])
+        summary = summarize(text.strip(), config.MEMORY_SUMMARY_TOKENS)
+        self.con.execute("INSERT OR REPLACE INTO conversation_summaries (session, summary, upto, tokens) "
+                         "VALUES (?, ?, ?, ?)", (self.session, summary, first_recent - 1, countTokens(summary)))
+        self.con.commit()
+
+    def _recall(self, query, before, budget):
+        # only a bounded window of older turns is searched, so this stays cheap
+        rows = self.con.execute("SELECT id, role, text, tokens FROM conversation_turns WHERE session = ? AND id < ? "
+                                "ORDER BY id DESC LIMIT ?", (self.session, before, config.MEMORY_RECALL_WINDOW)).fetchall()
+        if not rows:
+            return []
+        target = embed(query)
+        scored = []
+        for row in rows:
+            score = _similarity(target, embed(row[2]))
+            if score >= config.MEMORY_RECALL_THRESHOLD:
+                scored.append((score, row))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        chosen, used = [], 0
+        for score, row in scored:
+            cost = min(row[3], config.MEMORY_RECALL_TOKENS)
+            if used + cost > budget:
+                continue
+            chosen.append(row)
+            used += cost
+        return sorted(chosen)
+
+    # Prompt for query with as much useful history as fits the token budget
+    def buildPrompt(self, query):
+        with self.lock:
+            summary, upto = self._summary()
+            recent = self._recent(upto)
+            first_recent = recent[0][0] if recent else upto + 1
+            budget = config.MEMORY_TOKEN_BUDGET - countTokens(summary) - sum(row[3] for row in recent)
+            recalled = self._recall(query, first_recent, max(0, min(budget, config.MEMORY_RECALL_TOKENS)))
+
+        def line(row):
+            name = "User" if row[1] == "user" else "Assistant"
+            return f"{name}: {_trim(row[2], config.MEMORY_RECALL_TOKENS)}"
+
+        parts = []
+        if summary:
+            parts.append("Summary of the earlier conversation: " + summary)
+        if recalled:
+            parts.append("Related earlier messages:\n" + "\n".join(line(row) for row in recalled))
+        if recent:
+            parts.append("Recent conversation:\n" + "\n".join(line(row) for row in recent))
+        if not parts:
+            return query
+        parts.append("User: " + query)
+        return "\n\n".join(parts)
+
+
+_memory = None
+
+
+def getMemory():
+    global _memory
+    if _memory is None:
+        _memory = ConversationMemory()
+    return _memory
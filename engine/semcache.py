@@ -0,0 +1,423 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from engine import config
+
+# Words that carry little meaning on their own get a lower weight
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "am", "be", "to", "of", "in", "on", "for", "me", "my",
+    "i", "it", "and", "or", "do", "does", "did", "can", "could", "please", "tell", "jarvis", "about",
+}
+
+# Common rephrasings collapse to one word so "who made you" and "who created you" match
+_SYNONYMS = {
+    "created": "make", "create": "make", "creates": "make", "made": "make", "makes": "make",
+    "built": "make", "build": "make", "developed": "make", "develop": "make", "designed": "make",
+    "whats": "what", "what's": "what", "who's": "who", "whos": "who",
+    "your": "you", "yours": "you", "yourself": "you", "u": "you", "ur": "you",
+    "explain": "describe", "define": "describe", "meaning": "describe",
+}
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _tokens(text):
+    words = []
+    for word in _WORD.findall(text.lower()):
+        word = _SYNONYMS.get(word, word)
+        # crude plural stripping keeps "jokes" and "joke" together
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+# Sparse hashed bag of words + bigrams, L2 normalised; returns (feature indices, weights)
+def embed(text, dim=config.SEMCACHE_DIM):
+    words = _tokens(text)
+    features = {}
+    grams = [(w, 0.25 if w in STOPWORDS else 1.0) for w in words]
+    grams += [(a + " " + b, 0.5) for a, b in zip(words, words[1:])]
+    for gram, weight in grams:
+        h = zlib.crc32(gram.encode("utf-8"))
+        index = h % dim
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        features[index] = features.get(index, 0.0) + sign * weight
+    if not features:
+        return np.zeros(0, np.intp), np.zeros(0, np.float32)
+    features = {i: w for i, w in features.items() if w}  # grams whose signs cancelled out
+    index = np.fromiter(features.keys(), np.intp, len(features))
+    weight = np.fromiter(features.values(), np.float32, len(features))
+    norm = np.linalg.norm(weight)
+    if norm == 0:
+        return np.zeros(0, np.intp), np.zeros(0, np.float32)
+    return index, weight / norm
+
+
+# One stored question: SEMCACHE_WIDTH (feature, weight) pairs, the unused ones with weight 0
+_ROW = np.dtype([("feature", np.int32), ("weight", np.float32)])
+_NO_SLOTS = np.zeros(0, np.intp)
+_NO_WEIGHTS = np.zeros(0, np.float64)
+
+
+# Cache of chatbot answers looked up by meaning rather than exact text.
+# Vectors live in a (capacity, width) memmap of (feature, float32 weight) pairs,
+# one row per slot, so a store writes one row. Lookups go through an inverted
+# index built from the rows and held in memory: for every hashed feature, the
+# slots that use it and their weights, see _match for which of them are read.
+class SemanticCache:
+    def __init__(self, db_path=config.DB_PATH, vector_path=config.SEMCACHE_PATH, capacity=config.SEMCACHE_CAPACITY,
+                 dim=config.SEMCACHE_DIM, width=config.SEMCACHE_WIDTH, threshold=config.SEMCACHE_THRESHOLD,
+                 ttl=config.SEMCACHE_TTL):
+        self.dim = dim
+        self.width = width
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()  # the connection, taken after lock when both are needed
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}  # slot -> (hits, last used) not written to the database yet
+        self.writer = None  # timer that writes them
+
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute('''CREATE TABLE IF NOT EXISTS semantic_cache (
+            slot INTEGER PRIMARY KEY, query TEXT, response TEXT, hits INTEGER DEFAULT 0,
+            created REAL, last_used REAL)''')
+        self.con.execute("CREATE TABLE IF NOT EXISTS semantic_cache_layout (dim INTEGER, width INTEGER)")
+        self.con.commit()
+
+        shape = (capacity, width)
+        layout = self.con.execute("SELECT dim, width FROM semantic_cache_layout").fetchone()
+        if os.path.isfile(vector_path):
+            self.vectors = np.load(vector_path, mmap_mode="r+")
+            if self.vectors.shape != shape or self.vectors.dtype != _ROW or layout != (dim, width):
+                # settings changed: the stored vectors are useless
+                del self.vectors
+                os.remove(vector_path)
+                self.con.execute("DELETE FROM semantic_cache")
+        if not os.path.isfile(vector_path):
+            self.vectors = np.lib.format.open_memmap(vector_path, mode="w+", dtype=_ROW, shape=shape)
+            self.con.execute("DELETE FROM semantic_cache_layout")
+            self.con.execute("INSERT INTO semantic_cache_layout (dim, width) VALUES (?, ?)", (dim, width))
+            self.con.commit()
+
+        self.entries = {}
+        self.created = np.zeros(capacity, np.float64)
+        self.last_used = np.zeros(capacity, np.float64)
+        self.size = 0  # slots below this index have been used at least once
+        self.scratch = np.zeros(capacity)  # per slot sums of a lookup, all 0 between lookups
+        for slot, query, response, created, last_used in self.con.execute(
+                "SELECT slot, query, response, created, last_used FROM semantic_cache"):
+            if slot >= capacity:
+                continue
+            self.entries[slot] = (query, response)
+            self.created[slot] = created
+            self.last_used[slot] = last_used
+            self.size = max(self.size, slot + 1)
+        self._index()
+
+    def _index(self):
+        # every posting, sorted by feature: those of keys[i] are at starts[i]:starts[i + 1].
+        # Slots are intp and weights float64 because np.bincount takes those as they are
+        # and converts anything else first, at ten times the cost of the counting itself.
+        rows = np.asarray(self.vectors[:self.size])
+        used = rows["weight"] != 0
+        counts = np.bincount(rows["feature"][used])
+        # features in more than SEMCACHE_COMMON_SHARE of the questions are common, and each
+        # slot gets the norm of its weights on them; both stay fixed until the next rebuild
+        self.common = np.flatnonzero(counts > config.SEMCACHE_COMMON_SHARE * self.size)
+        common = np.isin(rows["feature"], self.common) & used
+        self.unread = np.zeros(self.capacity)
+        self.unread[:self.size] = np.sqrt(np.where(common, rows["weight"].astype(np.float64) ** 2, 0.0).sum(axis=1))
+        slots = np.nonzero(used)[0]
+        features = rows["feature"][used].astype(np.intp)
+        weights = rows["weight"][used].astype(np.float64)
+        # within a feature, the slots most made of common features come first
+        order = np.lexsort((-self.unread[slots], features))
+        features = features[order]
+        bounds = np.flatnonzero(np.diff(features)) + 1
+        self.keys = features[np.concatenate(([0], bounds))] if len(features) else _NO_SLOTS
+        self.starts = np.concatenate(([0], bounds, [len(features)]))
+        self.slots, self.weights = slots[order], weights[order]
+        self.norms = -self.unread[self.slots]  # ascending within each run, for searchsorted
+        # postings of questions stored since: feature -> (slots, weights), searched
+        # on the side until there are enough of them to be worth a rebuild
+        self.recent = {}
+        self.recent_count = 0
+
+    def _forget(self, slot):
+        # the postings of a replaced question stay in place with weight 0 until the next rebuild
+        old = self.vectors[slot]
+        for f in old["feature"][old["weight"] != 0].tolist():
+            i = np.searchsorted(self.keys, f)
+            if i < len(self.keys) and self.keys[i] == f:
+                part = slice(self.starts[i], self.starts[i + 1])
+                self.weights[part][self.slots[part] == slot] = 0.0
+            if f in self.recent:
+                slots, weights = self.recent[f]
+                weights[slots == slot] = 0.0
+        # its replacement has all of its postings in recent, which are always read
+        self.unread[slot] = 0.0
+
+    # (position in the query, slots, weights) of the runs of postings of the query's
+    # features: the run in the index, and the recent one when there is one. Of a common
+    # feature's run in the index, only the slots with at least `level` of unread norm.
+    def _postings(self, index, common, level):
+        found = []
+        for j, (f, i) in enumerate(zip(index.tolist(), np.searchsorted(self.keys, index).tolist())):
+            if i < len(self.keys) and self.keys[i] == f:
+                start, end = self.starts[i], self.starts[i + 1]
+                if common[j]:
+                    end = start + np.searchsorted(self.norms[start:end], -level, side="right")
+                found.append((j, self.slots[start:end], self.weights[start:end]))
+            if f in self.recent:
+                found.append((j, *self.recent[f]))
+        return found
+
+    # (slots, scores) of the slots the runs name, with their summed contributions
+    def _scatter(self, runs, weight):
+        if sum(len(slots) for _, slots, _ in runs) * 8 > self.size:
+            # most of the index: one pass over every slot beats adding the runs one by one
+            slots = np.concatenate([slots for _, slots, _ in runs])
+            contributions = np.concatenate([weights * weight[j] for j, _, weights in runs])
+            scores = np.bincount(slots, contributions, minlength=self.size)
+            named = np.flatnonzero(scores)
+            return named, scores[named]
+        # no run names a slot twice, so each is added in one go; sums are taken out (and
+        # the slot zeroed) on the first run naming the slot, the runs after it find 0
+        for j, slots, weights in runs:
+            self.scratch[slots] += weights * weight[j]
+        found = []
+        for _, slots, _ in runs:
+            found.append(self.scratch[slots])
+            self.scratch[slots] = 0.0
+        if not found:
+            return _NO_SLOTS, np.zeros(0)
+        slots = np.concatenate([slots for _, slots, _ in runs])
+        scores = np.concatenate(found)
+        named = scores != 0
+        return slots[named], scores[named]
+
+    def _rescore(self, candidates, index, weight):
+        # exact cosine of each candidate's row with the query
+        rows = np.asarray(self.vectors)
+        features, weights = rows["feature"][candidates], rows["weight"][candidates]
+        order = np.argsort(index)
+        at = np.searchsorted(index[order], features)
+        at[at == len(index)] = 0
+        shared = index[order][at] == features
+        return np.where(shared, weights * weight[order][at], 0.0).sum(axis=1)
+
+    # (slots, scores) of the slots whose cosine with the query reaches threshold.
+    # Rare features are read in full. Common ones are read only for the slots that
+    # are mostly made of them: a slot can't beat the norm of the query on the
+    # common features times its own norm there (Cauchy-Schwarz), so one that has
+    # less than threshold / that in them needs the rare features to get anywhere.
+    # The few of those that get close are scored from their rows.
+    def _match(self, index, weight, threshold):
+        if len(self.common):
+            common = self.common[np.minimum(np.searchsorted(self.common, index), len(self.common) - 1)] == index
+        else:
+            common = np.zeros(len(index), bool)
+        shared = np.sqrt(np.sum(weight[common].astype(np.float64) ** 2))
+        level = threshold / shared if shared else np.inf
+        slots, scores = self._scatter(self._postings(index, common, level), weight)
+        if shared:
+            # what the unread common postings could still add; a slot nothing was read
+            # for can't get past shared * level = threshold with that alone
+            rest = self.unread[slots]
+            rest[rest >= level] = 0.0
+            close = np.flatnonzero((rest > 0) & (scores + shared * rest >= threshold))
+            scores[close] = self._rescore(slots[close], index, weight)
+        keep = scores >= threshold
+        return slots[keep], scores[keep]
+
+    def _embed(self, query):
+        index, weight = embed(query, self.dim)
+        if len(index) > self.width:
+            # a very long question keeps its heaviest features, asked or stored alike
+            keep = np.argsort(-np.abs(weight))[:self.width]
+            index, weight = index[keep], weight[keep] / np.linalg.norm(weight[keep])
+        return index, weight
+
+    def _search(self, query, k, threshold):
+        index, weight = self._embed(query)
+        if len(index) == 0 or self.size == 0:
+            return []
+        candidates, scores = self._match(index, weight, threshold)
+        if self.ttl:
+            fresh = self.created[candidates] >= time.time() - self.ttl
+            candidates, scores = candidates[fresh], scores[fresh]
+        best = np.argsort(-scores)[:k]
+        return [(float(scores[i]), int(candidates[i])) for i in best if candidates[i] in self.entries]
+
+    # Best (score, query, response) matches above the threshold, highest first
+    def search(self, query, k=3, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        with self.lock:
+            return [(score, *self.entries[slot]) for score, slot in self._search(query, k, threshold)]
+
+    # Cached answer for a query that means the same as an earlier one, or None
+    def lookup(self, query):
+        started = time.perf_counter()
+        with self.lock:
+            found = self._search(query, 1, self.threshold)
+            if not found:
+                self.misses += 1
+                return None
+            score, slot = found[0]
+            cached_query, response = self.entries[slot]
+            now = time.time()
+            self.hits += 1
+            self.last_used[slot] = now
+            # a commit per hit would cost more than the lookup, so hit counts are written in batches
+            self.pending[slot] = (self.pending.get(slot, (0, 0))[0] + 1, now)
+            if len(self.pending) >= config.SEMCACHE_HIT_BATCH and self.writer is None:
+                # written a moment later, while the answer is spoken: the commit takes the
+                # disk and the CPU, and would slow down whichever lookup ran beside it
+                self.writer = threading.Timer(config.SEMCACHE_HIT_DELAY, self.flushHits)
+                self.writer.daemon = True
+                self.writer.start()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"semcache: hit {score:.2f} for \"{cached_query}\" in {elapsed:.2f}ms")
+        return response
+
+    def _writeHits(self, pending):
+        # a hit older than the row went to the question that had the slot before
+        self.con.executemany("UPDATE semantic_cache SET hits = hits + ?, last_used = ? WHERE slot = ? AND created <= ?",
+                             [(hits, used, slot, used) for slot, (hits, used) in pending.items()])
+
+    def store(self, query, response):
+        index, weight = self._embed(query)
+        if len(index) == 0:
+            return
+        row = np.zeros(self.width, _ROW)
+        row["feature"][:len(index)] = index
+        row["weight"][:len(index)] = weight
+        now = time.time()
+        with self.lock:
+            if self.size < self.capacity:
+                slot = self.size
+                self.size += 1
+            else:
+                # full: reuse the least recently used slot
+                slot = int(np.argmin(self.last_used[:self.size]))
+            self.pending.pop(slot, None)
+            pending, self.pending = self.pending, {}
+            self._forget(slot)
+            self.vectors[slot] = row
+            if self.recent_count + len(index) > config.SEMCACHE_RECENT_POSTINGS:
+                self._index()
+            else:
+                # arrays, copied on every store, as lookups are what has to be fast
+                for f, w in zip(index.tolist(), weight.tolist()):
+                    slots, weights = self.recent.get(f, (_NO_SLOTS, _NO_WEIGHTS))
+                    self.recent[f] = (np.append(slots, slot), np.append(weights, w))
+                self.recent_count += len(index)
+            self.entries[slot] = (query, response)
+            self.created[slot] = now
+            self.last_used[slot] = now
+            with self.db_lock:
+                self._writeHits(pending)
+                self.con.execute("INSERT OR REPLACE INTO semantic_cache (slot, query, response, hits, created, "
+                                 "last_used) VALUES (?, ?, ?, 0, ?, ?)", (slot, query, response, now, now))
+                self.con.commit()
+
+    def flushHits(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.writer = None
+        with self.db_lock:
+            self._writeHits(pending)
+            self.con.commit()
+
+    def flush(self):
+        writer = self.writer
+        if writer is not None:
+            writer.cancel()
+        self.flushHits()
+        self.vectors.flush()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+_cache = None
+
+
+def getCache():
+    global _cache
+    if _cache is None:
+        _cache = SemanticCache()
+        atexit.register(_cache.flush)
+    return _cache
+
+
+def _bench(entries, lookups=1000, vocabulary=20000):
+    import contextlib
+    import io
+    import itertools
+    import random
+    import tempfile
+
+    # questions as people ask them: a few common words, then content words from a large
+    # vocabulary used as often as Zipf's law says (a handful all the time, most rarely)
+    common = "what how why who when where is are the a of to in you me can do tell".split()
+    words = ("weather time play song open youtube make joke news today capital country city river mountain "
+             "distance speed weight python code write poem story explain physics chemistry history math "
+             "number movie book game sport team score").split() + [f"word{i}" for i in range(vocabulary)]
+    ranks = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    def question():
+        return " ".join(random.choices(common, k=random.randint(1, 3)) +
+                        random.choices(words, cum_weights=ranks, k=random.randint(2, 6)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SemanticCache(os.path.join(tmp, "bench.db"), os.path.join(tmp, "bench.npy"), capacity=entries)
+        started = time.perf_counter()
+        for i in range(entries):
+            cache.store(question(), f"answer {i}")
+        print(f"stored {entries} entries in {time.perf_counter() - started:.1f}s")
+        # search() on new questions, then lookup() on stored ones: hits, including the hit count bookkeeping
+        asked = [question() for _ in range(lookups)]
+        stored = [query for query, response in random.sample(list(cache.entries.values()), lookups)]
+        for name, fn, queries in (("search", lambda q: cache.search(q, k=5), asked), ("hit", cache.lookup, stored)):
+            timings = []
+            with contextlib.redirect_stdout(io.StringIO()):
+                for query in queries:
+                    started = time.perf_counter()
+                    fn(query)
+                    timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f"{name} at {entries} entries: p50 {timings[len(timings) // 2]:.3f}ms, "
+                  f"p99 {timings[int(len(timings) * 0.99)]:.3f}ms")
+        cache.flush()
+        cache.con.close()
+        del cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Jarvis semantic answer cache")
+    parser.add_argument("--bench", type=int, metavar="ENTRIES", help="measure lookup latency with a synthetic cache")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="distinct words in the synthetic questions")
+    parser.add_argument("--search", help="show the closest cached questions")
+    args = parser.parse_args()
+
+    if args.bench:
+        _bench(args.bench, vocabulary=args.vocabulary)
+    elif args.search:
+        for score, query, response in getCache().search(args.search, k=5, threshold=0.0):
+            print(f"{score:.3f}  {query}  ->  {response[:60]}")
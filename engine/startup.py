@@ -0,0 +1,164 @@
+# Run from the project folder: python -m engine.startup bench
+# Startup timing: lazy imports for heavy libraries, an import profiler in the
+# style of `python -X importtime`, and a timeline up to the UI and to ready.
+# Import this first so its clock starts before everything else is imported.
+import builtins
+import importlib
+import os
+import sys
+import time
+
+STARTED = time.perf_counter()
+EAGER = os.environ.get("JARVIS_EAGER_IMPORTS") == "1"  # baseline for the benchmark: no lazy imports
+PROFILE = "--profile-startup" in sys.argv or os.environ.get("JARVIS_PROFILE_STARTUP") == "1"
+
+marks = []  # (stage, seconds since STARTED)
+imports = []  # (module, self seconds, cumulative seconds, depth) in import order
+deferred = {}  # module -> seconds its lazy import took at first use
+
+
+# Stand-in for a module that is only imported when one of its attributes is
+# first used, so libraries the UI doesn't need aren't loaded before it shows
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            deferred[self._name] = time.perf_counter() - started
+            self.__dict__["_module"] = module
+            if PROFILE:
+                print(f"startup: lazy import of {self._name} took {1000 * deferred[self._name]:.0f} ms")
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded yet"
+        return f"<lazy module {self._name!r}, {state}>"
+
+
+def lazy(name):
+    module = LazyModule(name)
+    if EAGER:
+        module._load()
+    return module
+
+
+def mark(stage):
+    marks.append((stage, time.perf_counter() - STARTED))
+    if PROFILE:
+        print(f"startup: {stage} at {marks[-1][1]:.3f}s")
+
+
+# Time every first import, self and cumulative like -X importtime, by
+# wrapping __import__ while the profile flag is on
+def _profile_imports():
+    original = builtins.__import__
+    stack = []
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        label = name
+        if level:
+            return original(name, globals, locals, fromlist, level)
+        if name in sys.modules:
+            # `from package import module` loads the submodules without coming back through here
+            missing = [item for item in fromlist or () if not hasattr(sys.modules[name], item)]
+            if not missing:
+                return original(name, globals, locals, fromlist, level)
+            label = ", ".join(f"{name}.{item}" for item in missing)
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            children = stack.pop()
+            imports.append((label, total - children, total, len(stack)))
+            if stack:
+                stack[-1] += total
+
+    builtins.__import__ = timed_import
+
+
+def report(top=25):
+    lines = ["startup timeline:"]
+    lines += [f"  {seconds:8.3f}s  {stage}" for stage, seconds in marks]
+    if imports:
+        lines.append(f"slowest imports (self / cumulative ms), {len(imports)} modules:")
+        for name, own, total, depth in sorted(imports, key=lambda row: row[2], reverse=True)[:top]:
+            lines.append(f"  {1000 * own:8.1f} / {1000 * total:8.1f}  {'  ' * depth}{name}")
+    if deferred:
+        lines.append("deferred until first use: " + ", ".join(f"{name} {1000 * s:.0f} ms" for name, s in deferred.items()))
+    return "\n".join(lines)
+
+
+if PROFILE:
+    os.environ["JARVIS_PROFILE_STARTUP"] = "1"  # child processes profile themselves too
+    _profile_imports()
+
+
+# Seconds to import `module` in a fresh interpreter, `runs` times. A cold run
+# gets an empty bytecode cache; warm runs share one filled by a first run.
+# (The OS file cache can't be emptied from here, so cold means recompiling.)
+def _time_imports(module, runs, eager, cold, workdir):
+    import subprocess
+
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    env = dict(os.environ, JARVIS_EAGER_IMPORTS="1" if eager else "0", JARVIS_PROFILE_STARTUP="0")
+    results = []
+    for run in range(runs + (0 if cold else 1)):
+        env["PYTHONPYCACHEPREFIX"] = os.path.join(workdir, f"cold{run}" if cold else "warm")
+        out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        if out.returncode:
+            raise RuntimeError(f"importing {module} failed:\n{out.stderr.strip()}")
+        results.append(float(out.stdout.strip().splitlines()[-1]))
+    return sorted(results if cold else results[1:])
+
+
+def benchmark(modules=("main",), runs=5):
+    import tempfile
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        for module in modules:
+            for cold in (True, False):
+                for eager in (True, False):
+                    seconds = _time_imports(module, runs, eager, cold, workdir)
+                    rows.append({"module": module, "cache": "cold" if cold else "warm",
+                                 "imports": "eager" if eager else "lazy",
+                                 "median_ms": round(1000 * seconds[len(seconds) // 2]),
+                                 "min_ms": round(1000 * seconds[0])})
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Startup import time, eager vs lazy, cold vs warm")
+    sub = parser.add_subparsers(dest="command", required=True)
+    command = sub.add_parser("bench", help="time importing the entry modules in fresh interpreters")
+    command.add_argument("--modules", nargs="+", default=["main", "engine.features"])
+    command.add_argument("--runs", type=int, default=5)
+    command = sub.add_parser("profile", help="per-module import times of one module")
+    command.add_argument("module", nargs="?", default="main")
+    command.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        for row in benchmark(args.modules, args.runs):
+            print(row)
+    else:
+        PROFILE = True
+        _profile_imports()
+        __import__(args.module)
+        mark(f"{args.module} imported")
+        print(report(args.top))
@@ -0,0 +1,147 @@
+import queue
+import re
+import threading
+import time
+
+import eel
+
+from engine.command import createVoiceEngine
+from engine.config import STREAM_FLUSH_INTERVAL, STREAM_MIN_SPEECH_CHARS
+
+_END = object()
+_SENTENCE_END = re.compile(r'(?<=[.!?;:])\s+|\n+')
+
+
+# Cuts streamed text into sentences that can be handed to text to speech
+class SentenceBuffer:
+    def __init__(self, min_chars=STREAM_MIN_SPEECH_CHARS):
+        self.min_chars = min_chars
+        self.pending = ""
+        self.held = ""
+        self.first = True
+
+    def feed(self, text):
+        parts = _SENTENCE_END.split(self.pending + text)
+        # the last part has no sentence end yet
+        self.pending = parts.pop()
+        ready = []
+        for sentence in parts:
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            self.held = (self.held + " " + sentence).strip()
+            # the first sentence goes out at once so speech starts early
+            if self.first or len(self.held) >= self.min_chars:
+                ready.append(self.held)
+                self.held = ""
+                self.first = False
+        return ready
+
+    def flush(self):
+        rest = (self.held + " " + self.pending).strip()
+        self.held = self.pending = ""
+        return [rest] if rest else []
+
+
+# Speaks queued sentences one after another on its own thread, so tokens
+# keep arriving while a sentence is being spoken
+class SpeechWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sentences = queue.Queue()
+        self.first_spoken_at = None
+
+    def say(self, text):
+        self.sentences.put(text)
+
+    def close(self):
+        self.sentences.put(None)
+
+    def run(self):
+        try:
+            # sapi5 is a COM object and every thread has to initialise COM itself
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pass
+        engine = createVoiceEngine()
+        while True:
+            text = self.sentences.get()
+            if text is None:
+                break
+            if self.first_spoken_at is None:
+                self.first_spoken_at = time.monotonic()
+            engine.say(text)
+            engine.runAndWait()
+
+
+# Show and speak a streamed answer as it arrives. Tokens are pushed to the chat
+# window in batches every `interval` seconds and complete sentences are spoken
+# while the rest is still generated. Returns the whole answer.
+def streamReply(tokens, interval=STREAM_FLUSH_INTERVAL):
+    started = time.monotonic()
+    inbox = queue.Queue()
+
+    def produce():
+        try:
+            for token in tokens:
+                inbox.put(token)
+        except Exception as e:
+            inbox.put(e)
+        inbox.put(_END)
+
+    threading.Thread(target=produce, daemon=True).start()
+    speech = SpeechWorker()
+    speech.start()
+    sentences = SentenceBuffer()
+
+    text = ""
+    error = None
+    first_token_at = None
+    done = False
+    while not done:
+        batch = []
+        while True:
+            try:
+                item = inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                done = True
+                break
+            if isinstance(item, Exception):
+                error = item
+            elif item:
+                batch.append(item)
+
+        if batch:
+            chunk = "".join(batch)
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+                eel.receiverStart()
+            text += chunk
+            eel.receiverAppend(chunk)
+            for sentence in sentences.feed(chunk):
+                eel.DisplayMessage(sentence)
+                speech.say(sentence)
+        if not done:
+            # eel.sleep yields to the UI loop instead of blocking it
+            eel.sleep(interval)
+
+    for sentence in sentences.flush():
+        eel.DisplayMessage(sentence)
+        speech.say(sentence)
+    if first_token_at is not None:
+        eel.receiverEnd()
+    generated_at = time.monotonic()
+    speech.close()
+    while speech.is_alive():
+        eel.sleep(interval)
+
+    if error is not None and not text:
+        raise error
+    if first_token_at is not None:
+        spoken = speech.first_spoken_at or generated_at
+        print(f"stream: first token {first_token_at - started:.2f}s, first speech {spoken - started:.2f}s, "
+              f"generated {generated_at - started:.2f}s")
+    return text
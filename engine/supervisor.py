@@ -0,0 +1,294 @@
+# Run from the project folder: python -m engine.supervisor status
+# Keeps the assistant's processes alive. Every child writes a heartbeat into a
+# shared-memory block; the supervisor restarts a child that exits or stops
+# beating, with exponential backoff, and keeps restart and uptime metrics.
+import contextlib
+import ctypes
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+
+from engine.config import (SUPERVISOR_BACKOFF_BASE, SUPERVISOR_BACKOFF_MAX, SUPERVISOR_BUSY_TIMEOUT,
+                           SUPERVISOR_HEARTBEAT_INTERVAL, SUPERVISOR_METRICS_PATH, SUPERVISOR_POLL_INTERVAL,
+                           SUPERVISOR_STABLE_SECONDS)
+
+# Per child in the status block: last heartbeat (time.monotonic(), shared by all
+# processes on the machine), pid, the child's resident memory in bytes, and
+# when it said it was ready (0 until then)
+FIELDS = 4
+BEAT, PID, RSS, READY = range(FIELDS)
+
+_status = None
+_slot = None
+_busy = {}  # blocking calls in progress -> when they started
+_busy_lock = threading.Lock()
+
+
+# Resident set size of this process in bytes, None where it can't be read
+def rss():
+    if sys.platform == "win32":
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = Counters(cb=ctypes.sizeof(Counters))
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+# Called by a child to say it is still working. Children that run a loop of
+# their own call this from the loop (the hotword listener from its audio loop,
+# the UI from a greenlet on eel's loop); the others get a thread that beats
+# for them.
+def beat():
+    if _status is not None:
+        _status[_slot * FIELDS + BEAT] = time.monotonic()
+
+
+# Wraps work that blocks a child's own loop on purpose (the UI's speech,
+# listening and WhatsApp automation hold eel's loop for as long as they take):
+# the heartbeat thread beats for it meanwhile, for up to SUPERVISOR_BUSY_TIMEOUT
+# seconds, so it isn't taken for a hang. Also usable as a decorator.
+@contextlib.contextmanager
+def busy():
+    token = object()
+    with _busy_lock:
+        _busy[token] = time.monotonic()
+    try:
+        yield
+    finally:
+        with _busy_lock:
+            del _busy[token]
+
+
+def _blocked():
+    with _busy_lock:
+        return bool(_busy) and time.monotonic() - min(_busy.values()) < SUPERVISOR_BUSY_TIMEOUT
+
+
+# Called by a child once it is up: the supervisor reports the time from start to here
+def ready():
+    if _status is not None:
+        _status[_slot * FIELDS + RSS] = rss() or 0
+        _status[_slot * FIELDS + READY] = time.monotonic()
+
+
+def _beat_rss():
+    if _status is not None:
+        _status[_slot * FIELDS + RSS] = rss() or 0
+
+
+def _child(target, status, slot, beats_itself):
+    global _status, _slot
+    _status, _slot = status, slot
+    status[slot * FIELDS + PID] = os.getpid()
+    beat()
+
+    def run():
+        while True:
+            if not beats_itself or _blocked():
+                beat()
+            _beat_rss()
+            time.sleep(SUPERVISOR_HEARTBEAT_INTERVAL)
+
+    threading.Thread(target=run, name="heartbeat", daemon=True).start()
+    target()
+
+
+# Priority and CPU affinity of another process. "high" is the highest class
+# that can't starve the rest of the machine (not Windows' realtime class).
+def set_priority(pid, priority, cpus=None):
+    if sys.platform == "win32":
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x0200 | 0x0400, False, pid)  # PROCESS_SET_INFORMATION | QUERY_INFORMATION
+        if not handle:
+            return False
+        try:
+            kernel32.SetPriorityClass(handle, {"high": 0x80, "normal": 0x20, "low": 0x4000}[priority])
+            if cpus:
+                kernel32.SetProcessAffinityMask(handle, ctypes.c_size_t(sum(1 << cpu for cpu in cpus)))
+        finally:
+            kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, {"high": -10, "normal": 0, "low": 10}[priority])
+    except PermissionError:
+        pass  # raising priority needs privileges on Linux; keep what we have
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(pid, cpus)
+    return True
+
+
+class Child:
+    def __init__(self, name, target, slot, priority="normal", cpus=None, heartbeat_timeout=30.0, beats_itself=False,
+                 stop_all_on_exit=False):
+        self.name = name
+        self.target = target
+        self.slot = slot
+        self.priority = priority
+        self.cpus = cpus
+        self.heartbeat_timeout = heartbeat_timeout
+        self.beats_itself = beats_itself
+        self.stop_all_on_exit = stop_all_on_exit  # a clean exit of this one ends the assistant
+        self.process = None
+        self.started = None
+        self.failures = 0  # in a row, for the backoff
+        self.reported = False  # startup time of the current run logged
+        self.restart_at = None
+        self.metrics = {"starts": 0, "restarts": 0, "crashes": 0, "hangs": 0, "last_exit": None,
+                        "uptime_total": 0.0, "uptime_longest": 0.0, "rss_peak": 0, "startup_seconds": None,
+                        "rss_at_ready": None}
+
+
+# Starts the children, watches them and restarts the ones that die or hang
+class Supervisor:
+    def __init__(self, metrics_path=SUPERVISOR_METRICS_PATH):
+        self.children = []
+        self.metrics_path = metrics_path
+        self.status = None
+        self.running = False
+        self.started = None
+
+    def add(self, name, target, **options):
+        self.children.append(Child(name, target, len(self.children), **options))
+        return self
+
+    def _start(self, child):
+        now = time.monotonic()
+        self.status[child.slot * FIELDS + BEAT] = now  # grace period until the first beat of its own
+        self.status[child.slot * FIELDS + READY] = 0.0
+        child.reported = False
+        child.process = multiprocessing.Process(target=_child, name=child.name,
+                                                args=(child.target, self.status, child.slot, child.beats_itself))
+        child.process.start()
+        child.started = now
+        child.restart_at = None
+        child.metrics["starts"] += 1
+        set_priority(child.process.pid, child.priority, child.cpus)
+        print(f"supervisor: {child.name} started, pid {child.process.pid}, priority {child.priority}")
+
+    def _stopped(self, child, reason):
+        uptime = time.monotonic() - child.started
+        child.metrics["uptime_total"] += uptime
+        child.metrics["uptime_longest"] = max(child.metrics["uptime_longest"], uptime)
+        child.metrics["last_exit"] = reason
+        # a child that ran for a while before failing starts over at the shortest delay
+        child.failures = 1 if uptime >= SUPERVISOR_STABLE_SECONDS else child.failures + 1
+        delay = min(SUPERVISOR_BACKOFF_MAX, SUPERVISOR_BACKOFF_BASE * 2 ** (child.failures - 1))
+        child.restart_at = time.monotonic() + delay
+        child.process = None
+        print(f"supervisor: {child.name} {reason} after {uptime:.0f}s, restarting in {delay:.0f}s")
+
+    def _check(self, child):
+        now = time.monotonic()
+        if child.process is None:
+            if now >= child.restart_at:
+                child.metrics["restarts"] += 1
+                self._start(child)
+            return True
+        child.metrics["rss_peak"] = max(child.metrics["rss_peak"], int(self.status[child.slot * FIELDS + RSS]))
+        ready_at = self.status[child.slot * FIELDS + READY]
+        if ready_at and not child.reported:
+            child.reported = True
+            child.metrics["startup_seconds"] = round(ready_at - child.started, 2)
+            child.metrics["rss_at_ready"] = int(self.status[child.slot * FIELDS + RSS])
+            print(f"supervisor: {child.name} ready {ready_at - child.started:.2f}s after start, "
+                  f"{child.metrics['rss_at_ready'] / 2 ** 20:.0f} MB resident")
+        code = child.process.exitcode
+        if code is not None:
+            if code == 0 and child.stop_all_on_exit:
+                child.metrics["uptime_total"] += now - child.started
+                child.metrics["uptime_longest"] = max(child.metrics["uptime_longest"], now - child.started)
+                child.metrics["last_exit"] = "exited"
+                child.process = None
+                return False
+            child.metrics["crashes"] += 1
+            self._stopped(child, f"exited with code {code}")
+        elif now - self.status[child.slot * FIELDS + BEAT] > child.heartbeat_timeout:
+            child.metrics["hangs"] += 1
+            child.process.terminate()
+            child.process.join(5)
+            if child.process.is_alive():
+                child.process.kill()
+                child.process.join()
+            self._stopped(child, f"missed heartbeats for {child.heartbeat_timeout:.0f}s")
+        return True
+
+    def metrics(self):
+        now = time.monotonic()
+        result = {"uptime": round(now - self.started, 1) if self.started else 0.0, "children": {}}
+        for child in self.children:
+            m = dict(child.metrics)
+            running = child.process is not None and child.process.is_alive()
+            m["running"] = running
+            m["pid"] = child.process.pid if running else None
+            m["uptime_current"] = round(now - child.started, 1) if running else 0.0
+            m["uptime_total"] = round(m["uptime_total"] + m["uptime_current"], 1)
+            m["uptime_longest"] = round(max(m["uptime_longest"], m["uptime_current"]), 1)
+            m["rss_mb"] = round(self.status[child.slot * FIELDS + RSS] / 2 ** 20, 1) if running else None
+            m["heartbeat_age"] = round(now - self.status[child.slot * FIELDS + BEAT], 1) if running else None
+            result["children"][child.name] = m
+        return result
+
+    def _save_metrics(self):
+        with open(self.metrics_path + ".tmp", "w") as f:
+            json.dump(dict(self.metrics(), written=time.strftime("%Y-%m-%d %H:%M:%S")), f, indent=2)
+        os.replace(self.metrics_path + ".tmp", self.metrics_path)
+
+    def stop(self):
+        self.running = False
+        for child in self.children:
+            if child.process is not None and child.process.is_alive():
+                child.process.terminate()
+                child.process.join(5)
+
+    # Blocks until a child with stop_all_on_exit exits cleanly (or Ctrl+C)
+    def run(self):
+        self.status = RawArray("d", FIELDS * len(self.children))
+        self.started = time.monotonic()
+        self.running = True
+        for child in self.children:
+            self._start(child)
+        last_save = 0.0
+        try:
+            while self.running:
+                time.sleep(SUPERVISOR_POLL_INTERVAL)
+                if not all(self._check(child) for child in self.children):
+                    break
+                if time.monotonic() - last_save >= 10:
+                    self._save_metrics()
+                    last_save = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            self._save_metrics()
+        return self.metrics()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Assistant process supervisor")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="print the metrics of the running (or last) supervisor")
+    args = parser.parse_args()
+
+    try:
+        with open(SUPERVISOR_METRICS_PATH) as f:
+            print(json.dumps(json.load(f), indent=2))
+    except OSError:
+        print(f"no metrics at {SUPERVISOR_METRICS_PATH}: the supervisor hasn't run yet")
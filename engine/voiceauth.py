@@ -0,0 +1,276 @@
+# Run from the project folder: python -m engine.voiceauth --help
+import functools
+import sqlite3
+import threading
+import time
+import wave
+
+import numpy as np
+
+from engine import config
+
+_EPS = 1e-10
+
+
+def _hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+
+def _mel_to_hz(mel):
+    return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+
+# Triangular mel filters over the rfft bins, made once per sample rate
+@functools.lru_cache(maxsize=4)
+def mel_filterbank(rate, n_fft=config.VOICE_FFT_SIZE, bands=config.VOICE_MEL_BANDS):
+    edges = _mel_to_hz(np.linspace(_hz_to_mel(20.0), _hz_to_mel(rate / 2), bands + 2))
+    bins = np.fft.rfftfreq(n_fft, 1.0 / rate)
+    lower, centre, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (centre - lower)
+    falling = (upper - bins) / (upper - centre)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=4)
+def _dct_matrix(bands=config.VOICE_MEL_BANDS, coefficients=config.VOICE_MFCC):
+    # orthonormal DCT-II as a matrix, so every frame is transformed in one product
+    n = np.arange(bands)
+    k = np.arange(coefficients)[:, None]
+    matrix = np.cos(np.pi * k * (2 * n + 1) / (2 * bands)) * np.sqrt(2.0 / bands)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+# MFCCs of the voiced frames of int16 or float audio, one row per 10 ms frame.
+# Silence is dropped: frames more than VOICE_SILENCE_DB below the loudest one
+# say nothing about the speaker.
+def mfcc(pcm, rate=config.VOICE_SAMPLE_RATE):
+    signal = np.asarray(pcm, dtype=np.float32)
+    if pcm.dtype == np.int16:
+        signal /= 32768.0
+    signal = np.append(signal[:1], signal[1:] - 0.97 * signal[:-1])  # pre-emphasis
+    length, hop = int(rate * config.VOICE_FRAME_MS / 1000), int(rate * config.VOICE_HOP_MS / 1000)
+    if len(signal) < length:
+        return np.empty((0, config.VOICE_MFCC), np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(signal, length)[::hop] * np.hamming(length).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames, config.VOICE_FFT_SIZE)) ** 2 / config.VOICE_FFT_SIZE
+    energy = np.log(power.sum(axis=1) + _EPS)
+    voiced = energy > energy.max() - config.VOICE_SILENCE_DB / 10 * np.log(10)
+    mel = np.log(power[voiced] @ mel_filterbank(rate).T + _EPS)
+    return mel @ _dct_matrix().T
+
+
+# Fixed-length voice print of one utterance: mean and spread of the cepstra
+# (without c0, which is only loudness) and of their frame-to-frame change
+def embed(pcm, rate=config.VOICE_SAMPLE_RATE):
+    coefficients = mfcc(pcm, rate)[:, 1:]
+    if len(coefficients) < 10:
+        raise ValueError("not enough speech in the recording")
+    deltas = np.diff(coefficients, axis=0)
+    return np.concatenate([coefficients.mean(axis=0), coefficients.std(axis=0), deltas.std(axis=0)])
+
+
+# Distance of voice prints to a template, in template spreads (RMS z-score)
+def distance(prints, mean, spread):
+    return np.sqrt((((np.atleast_2d(prints) - mean) / spread) ** 2).mean(axis=1))
+
+
+# Enrollment template: the average voice print and how much it varies, with a
+# floor so a few very similar recordings don't make the template too strict.
+# The threshold starts out a margin above the farthest enrollment recording
+# from the template built without it.
+def make_template(prints):
+    prints = np.asarray(prints, dtype=np.float64)
+    mean = prints.mean(axis=0)
+    spread = np.sqrt(prints.var(axis=0) + config.VOICE_SPREAD_FLOOR ** 2)
+    if len(prints) > 2:
+        held_out = [distance(prints[i], np.delete(prints, i, axis=0).mean(axis=0), spread)[0] for i in range(len(prints))]
+        threshold = max(held_out) * config.VOICE_THRESHOLD_MARGIN
+    else:
+        threshold = config.VOICE_MAX_DISTANCE
+    return mean, spread, float(threshold)
+
+
+# Voice templates per user, kept in jarvis.db next to the face users
+class VoiceProfiles:
+    def __init__(self, db_path=config.DB_PATH):
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(db_path, check_same_thread=False)
+        self.con.execute('''CREATE TABLE IF NOT EXISTS voice_templates (
+            user INTEGER PRIMARY KEY, mean BLOB, spread BLOB, threshold REAL, utterances INTEGER, updated REAL)''')
+        self.con.commit()
+        self.templates = None
+
+    def _load(self):
+        if self.templates is None:
+            self.templates = {user: (np.frombuffer(mean), np.frombuffer(spread), threshold)
+                              for user, mean, spread, threshold in
+                              self.con.execute("SELECT user, mean, spread, threshold FROM voice_templates")}
+        return self.templates
+
+    def users(self):
+        with self.lock:
+            return set(self._load())
+
+    # Build and store a user's template from a few recordings of the wake word
+    def enroll(self, user, recordings, rate=config.VOICE_SAMPLE_RATE):
+        mean, spread, threshold = make_template([embed(pcm, rate) for pcm in recordings])
+        with self.lock:
+            self.con.execute("INSERT OR REPLACE INTO voice_templates (user, mean, spread, threshold, utterances, updated) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", (int(user), mean.tobytes(), spread.tobytes(), threshold,
+                                                           len(recordings), time.time()))
+            self.con.commit()
+            self.templates = None
+        return threshold
+
+    def set_threshold(self, user, threshold):
+        with self.lock:
+            self.con.execute("UPDATE voice_templates SET threshold = ? WHERE user = ?", (float(threshold), int(user)))
+            self.con.commit()
+            self.templates = None
+
+    # (user, distance, accepted) for the closest enrolled voice among `users`
+    # (everybody when None); user is None when nobody is enrolled
+    def verify(self, pcm, users=None, rate=config.VOICE_SAMPLE_RATE):
+        with self.lock:
+            templates = self._load()
+        candidates = [user for user in templates if users is None or user in users]
+        try:
+            voice = embed(pcm, rate)
+        except ValueError:
+            return None, float("inf"), False
+        best, best_distance, accepted = None, float("inf"), False
+        for user in candidates:
+            mean, spread, threshold = templates[user]
+            d = float(distance(voice, mean, spread)[0])
+            if d < best_distance:
+                best, best_distance, accepted = user, d, d <= threshold
+        return best, best_distance, accepted
+
+
+_profiles = None
+
+
+def getVoiceProfiles():
+    global _profiles
+    if _profiles is None:
+        _profiles = VoiceProfiles()
+    return _profiles
+
+
+def record(seconds, rate=config.VOICE_SAMPLE_RATE):
+    import pyaudio
+
+    paud = pyaudio.PyAudio()
+    try:
+        stream = paud.open(rate=rate, channels=1, format=pyaudio.paInt16, input=True, frames_per_buffer=512)
+        pcm = stream.read(int(seconds * rate), exception_on_overflow=False)
+        stream.close()
+    finally:
+        paud.terminate()
+    return np.frombuffer(pcm, np.int16)
+
+
+def read_wav(path):
+    with wave.open(path) as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        pcm = np.frombuffer(f.readframes(f.getnframes()), np.int16)
+        if f.getnchannels() > 1:
+            pcm = pcm.reshape(-1, f.getnchannels())[:, 0]
+        return pcm, f.getframerate()
+
+
+# One spoken wake word from the microphone, checked against the owners'
+# voices. 1 when accepted, 0 when not, like face authentication.
+def authenticate(seconds=config.VOICE_VERIFY_SECONDS):
+    from engine.auth.users import getUsers
+
+    pcm = record(seconds)
+    started = time.perf_counter()
+    user, d, accepted = getVoiceProfiles().verify(pcm, getUsers().owners())
+    print(f"voice auth: {'accepted' if accepted else 'rejected'} user {user} at distance {d:.2f} "
+          f"in {1000 * (time.perf_counter() - started):.1f} ms")
+    return 1 if accepted else 0
+
+
+def _equal_error_rate(genuine, impostor):
+    # sweep the threshold over every score seen; the EER is where both error rates meet
+    genuine, impostor = np.sort(genuine), np.sort(impostor)
+    best = (float("inf"), None, None)
+    for threshold in np.concatenate([genuine, impostor]):
+        frr = 1.0 - np.searchsorted(genuine, threshold, side="right") / len(genuine)
+        far = np.searchsorted(impostor, threshold, side="right") / len(impostor)
+        if abs(frr - far) < best[0]:
+            best = (abs(frr - far), (frr + far) / 2, float(threshold))
+    return best[1], best[2]
+
+
+# Enrollment and verification latency and the equal error rate, enrolling on
+# the first `enroll_count` genuine recordings and testing on the rest
+def benchmark(genuine, impostor, enroll_count=5):
+    genuine, impostor = [read_wav(path) for path in genuine], [read_wav(path) for path in impostor]
+    if len(genuine) <= enroll_count or not impostor:
+        raise ValueError(f"need more than {enroll_count} genuine and at least one impostor recording")
+    started = time.perf_counter()
+    mean, spread, threshold = make_template([embed(pcm, rate) for pcm, rate in genuine[:enroll_count]])
+    enroll_ms = 1000 * (time.perf_counter() - started)
+    seconds, scores = [], {"genuine": [], "impostor": []}
+    for kind, recordings in (("genuine", genuine[enroll_count:]), ("impostor", impostor)):
+        for pcm, rate in recordings:
+            started = time.perf_counter()
+            scores[kind].append(float(distance(embed(pcm, rate), mean, spread)[0]))
+            seconds.append(time.perf_counter() - started)
+    seconds.sort()
+    eer, eer_threshold = _equal_error_rate(scores["genuine"], scores["impostor"])
+    return {"enroll_ms": round(enroll_ms, 1), "verify_p50_ms": round(1000 * seconds[len(seconds) // 2], 2),
+            "verify_p90_ms": round(1000 * seconds[int(0.9 * (len(seconds) - 1))], 2),
+            "EER": round(float(eer), 3), "eer_threshold": round(eer_threshold, 3), "enroll_threshold": round(threshold, 3),
+            "FRR_at_enroll_threshold": round(float(np.mean(np.array(scores["genuine"]) > threshold)), 3),
+            "FAR_at_enroll_threshold": round(float(np.mean(np.array(scores["impostor"]) <= threshold)), 3)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Speaker verification on the wake word")
+    sub = parser.add_subparsers(dest="command", required=True)
+    command = sub.add_parser("enroll", help="record (or read) a few wake words and store the user's voice template")
+    command.add_argument("--user", type=int, default=1)
+    command.add_argument("--wav", nargs="*", default=[], help="16-bit WAV recordings instead of the microphone")
+    command.add_argument("--count", type=int, default=config.VOICE_ENROLL_COUNT, help="recordings to make")
+    command = sub.add_parser("verify", help="check one recording against the enrolled voices")
+    command.add_argument("--wav", help="16-bit WAV recording instead of the microphone")
+    command = sub.add_parser("bench", help="latency and equal error rate on recorded samples")
+    command.add_argument("--genuine", nargs="+", required=True, help="recordings of the user")
+    command.add_argument("--impostor", nargs="+", required=True, help="recordings of other people")
+    command.add_argument("--enroll", type=int, default=config.VOICE_ENROLL_COUNT,
+                         help="genuine recordings used for the template")
+    command.add_argument("--save-user", type=int, help="store the EER threshold for this enrolled user")
+    args = parser.parse_args()
+
+    profiles = getVoiceProfiles()
+    if args.command == "enroll":
+        if args.wav:
+            recordings = [read_wav(path) for path in args.wav]
+        else:
+            recordings = []
+            for i in range(args.count):
+                input(f"[{i + 1}/{args.count}] press Enter, then say \"{config.ASSISTANT_NAME}\"")
+                recordings.append((record(config.VOICE_VERIFY_SECONDS), config.VOICE_SAMPLE_RATE))
+        started = time.perf_counter()
+        threshold = profiles.enroll(args.user, [pcm for pcm, _ in recordings], recordings[0][1])
+        print(f"user {args.user} enrolled from {len(recordings)} recordings in "
+              f"{1000 * (time.perf_counter() - started):.1f} ms, threshold {threshold:.2f}")
+    elif args.command == "verify":
+        pcm, rate = read_wav(args.wav) if args.wav else (record(config.VOICE_VERIFY_SECONDS), config.VOICE_SAMPLE_RATE)
+        started = time.perf_counter()
+        user, d, accepted = profiles.verify(pcm, rate=rate)
+        print(f"user {user}, distance {d:.2f}: {'accepted' if accepted else 'rejected'} "
+              f"in {1000 * (time.perf_counter() - started):.1f} ms")
+    else:
+        report = benchmark(args.genuine, args.impostor, args.enroll)
+        print(report)
+        if args.save_user is not None:
+            profiles.set_threshold(args.save_user, report["eer_threshold"])
+            print(f"threshold of user {args.save_user} set to {report['eer_threshold']}")
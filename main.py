@@ -1,29 +1,165 @@
 import os
+
+from engine import startup  # first: startup times are measured from here
+
 import eel
 
 from engine.features import *
 from engine.command import *
-from engine.auth import recoganize
+from engine import llm, memory, semcache
+from engine.auth import presence, session
+from engine.auth.camera import getManager
+from engine.auth.presence import startMonitor
+from engine.auth.service import getService
+from engine import voiceauth
+from engine import supervisor
+from engine.boot import BootGraph
+from engine.config import ASSISTANT_NAME, FACE_AUTH_RETRIES, SUPERVISOR_HEARTBEAT_INTERVAL, VOICE_AUTH
+
+faceAuth = getService()
+boot = BootGraph()
+startup.mark("imports done")
+
+def ready(how):
+    startup.mark(f"ready ({how})")
+    print(f"ready {startup.marks[-1][1]:.2f}s after start ({how})")
+    print(boot.timeline())
+    if startup.PROFILE:
+        print(startup.report())
+    session.watch()
+    startMonitor(faceAuth)  # ends the session when the owner walks away; one monitor across page reloads
+
+# Heartbeat for run.py's supervisor, from a greenlet on eel's loop: it stops
+# when the loop hangs, which a thread of its own would not notice. Handlers
+# that block the loop on purpose run under supervisor.busy() instead.
+def heartbeat():
+    while True:
+        supervisor.beat()
+        eel.sleep(SUPERVISOR_HEARTBEAT_INTERVAL)
+
+# The command lookups in features.py open jarvis.db on first use, on the eel
+# thread that runs them: sqlite connections stay on the thread that made them
+def openDatabases():
+    memory.getMemory()
+    semcache.getCache()
+
+# Without a session token face auth follows, so its model and the camera get ready meanwhile
+def loadFaceModel():
+    if not boot.wait("session"):
+        faceAuth.preload().ready.wait()
+
+def warmCamera():
+    if not boot.wait("session"):
+        manager = getManager().prewarm()
+        if manager.warming is not None:
+            manager.warming.join()
+
+# Voice, face or both as VOICE_AUTH says; "voice" or "face" for how the user
+# got in, None when they didn't. `intro` is spoken while the camera runs.
+def signIn(intro):
+    # enrolled voice: the wake word either replaces the camera ("fast") or is asked for after it ("second")
+    voice = VOICE_AUTH != "off" and bool(voiceauth.getVoiceProfiles().users())
+    if voice and VOICE_AUTH == "fast":
+        speak(f"Say {ASSISTANT_NAME} to sign in")
+        if voiceauth.authenticate():
+            return "voice"
+    # camera auth starts right away; adb connect and the intro speech run alongside it
+    auth = faceAuth.authenticate()
+    eel.hideLoader()
+    speak(intro)
+    # a reject ends it, after at most FACE_AUTH_RETRIES more attempts on the still open camera
+    retries = FACE_AUTH_RETRIES
+    while True:
+        while not auth.done():
+            frame = faceAuth.preview.take()
+            if frame is not None:
+                eel.updateFacePreview(frame)
+            eel.sleep(0.1)
+        flag = auth.result()
+        if flag == 1 or retries <= 0:
+            break
+        retries -= 1
+        auth = faceAuth.authenticate()
+    getManager().close()
+    while not boot.finished("adb"):
+        eel.sleep(0.1)
+    if flag == 1 and voice and VOICE_AUTH == "second":
+        speak(f"Now say {ASSISTANT_NAME}")
+        flag = voiceauth.authenticate()
+    return "face" if flag == 1 else None
+
+# The presence monitor holds the session when the owner walks away: commands are
+# refused and the face auth screen comes back until they sign in again. An
+# attempt starts whenever the monitor sees them, so the camera isn't kept on.
+def guard():
+    while True:
+        eel.sleep(1)
+        if not session.held():
+            continue
+        eel.showFaceAuth()
+        while session.held():
+            if not presence.ownerSeen():
+                eel.sleep(1)
+                continue
+            with supervisor.busy():  # the sign-in holds eel's loop
+                how = signIn("Welcome back. Look at the camera to unlock")
+                if how is None:
+                    speak("I couldn't verify you, I'll try again when I see you")
+                    presence.forgetOwner()
+                    continue
+                session.issue(how)
+                eel.hideStart()
+                playAssistantSound()
+            startMonitor(faceAuth)  # the owner is back: sampling starts over from present
+
 def start():
-    
-    eel.init("www")
+    # each step waits only for what it needs; everything else overlaps
+    boot.add("session", session.check)  # a recent face auth (no lock, sleep or reboot since) is still good
+    boot.add("face model", loadFaceModel, after=["session"])
+    boot.add("camera", warmCamera, after=["session"])
+    boot.add("adb", lambda: subprocess.call([r'device.bat']))
+    boot.add("db", openDatabases)
+    boot.add("chatbot", llm.warmUp)
+    boot.add("sound", playAssistantSound)
+    boot.add("eel", lambda: eel.init("www"))
+    boot.add("ui", lambda: os.system('start msedge.exe --app="http://localhost:8000/index.html"'), after=["eel"])
+    boot.start()
 
-    playAssistantSound()
     @eel.expose
+    @supervisor.busy()  # the intro speeches hold eel's loop
     def init():
-        subprocess.call([r'device.bat'])
-        eel.hideLoader()
-        speak("Let's begin the face authentication process. Kindly sit in front of the camera, look straight ahead, and remain still while I capture your facial data")
-        flag = recoganize.AuthenticateFace()
-        if flag == 1:
+        if session.held():
+            eel.showFaceAuth()  # reloaded while the owner was away: guard() signs them back in
+            return
+        resumed = boot.wait("session")
+        if resumed:
+            eel.hideStart()
+            playAssistantSound()
+            ready("session token")
+            return
+        how = signIn("Let's begin the face authentication process. Kindly sit in front of the camera, look straight ahead, and remain still while I capture your facial data")
+        if how == "voice":
+            session.issue("voice")
+            eel.hideStart()
+            playAssistantSound()
+            ready("voice")
+        elif how == "face":
+            session.issue()
             eel.hideFaceAuth()
             speak("Face authentication has been successfully completed. Your identity has been verified, and you now have secure access to the system ")
             eel.hideFaceAuthSuccess()
             speak(" welcome, Sir. Your AI assistant is online and ready. How may I assist you today?")
             eel.hideStart()
             playAssistantSound()
+            ready("face auth")
         else:
             speak("I'm sorry, the face authentication was not successful. Kindly try again")
-    os.system('start msedge.exe --app="http://localhost:8000/index.html"')
+    boot.wait("ui")
+    startup.mark("ui launched")
+    supervisor.ready()  # run.py's supervisor logs startup time and resident memory of this process
+    eel.spawn(heartbeat)
+    eel.spawn(guard)
+    if startup.PROFILE:
+        print(startup.report())
 
     eel.start('index.html', mode=None, host='localhost', block=True)
\ No newline at end of file
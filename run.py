@@ -1,7 +1,10 @@
  
 
-import multiprocessing
-import subprocess
+import os
+import sys
+
+from engine.config import SUPERVISOR_AUDIO_CPUS, SUPERVISOR_HOTWORD_TIMEOUT, SUPERVISOR_UI_TIMEOUT
+from engine.supervisor import Supervisor
 
 # To run Jarvis
 def startJarvis():
@@ -14,20 +17,28 @@ def startJarvis():
 def listenHotword():
         # Code for process 2
         print("Process 2 is running.")
-        from engine.features import hotword
-        hotword()
+        from engine import startup
+        from engine.hotword_worker import listen  # the slim worker, not engine.features
+        startup.mark("hotword imports done")
+        if startup.PROFILE:
+            print(startup.report())
+        listen()
 
 
     # Start both processes
 if __name__ == '__main__':
-        p1 = multiprocessing.Process(target=startJarvis)
-        p2 = multiprocessing.Process(target=listenHotword)
-        p1.start()
-        p2.start()
-        p1.join()
-
-        if p2.is_alive():
-            p2.terminate()
-            p2.join()
+        # python run.py --profile-startup: both processes print their import times and startup timeline
+        if "--profile-startup" in sys.argv:
+            os.environ["JARVIS_PROFILE_STARTUP"] = "1"
+        # both processes are restarted when they crash or hang; closing the UI stops everything
+        supervisor = Supervisor()
+        supervisor.add("ui", startJarvis, heartbeat_timeout=SUPERVISOR_UI_TIMEOUT, beats_itself=True,
+                       stop_all_on_exit=True)
+        supervisor.add("hotword", listenHotword, priority="high", cpus=SUPERVISOR_AUDIO_CPUS,
+                       heartbeat_timeout=SUPERVISOR_HOTWORD_TIMEOUT, beats_itself=True)
+        metrics = supervisor.run()
 
-        print("system stop")
\ No newline at end of file
+        print("system stop")
+        for name, m in metrics["children"].items():
+            print(f"{name}: {m['starts']} starts, {m['crashes']} crashes, {m['hangs']} hangs, "
+                  f"up {m['uptime_total']:.0f}s in total")
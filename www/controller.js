@@ -49,6 +49,43 @@ $(document).ready(function () {
         
     }
 
+    // Streamed answers: open an empty bubble, then append text as it arrives
+    eel.expose(receiverStart)
+    function receiverStart() {
+
+        var chatBox = document.getElementById("chat-canvas-body");
+        chatBox.innerHTML += `<div class="row justify-content-start mb-4">
+            <div class = "width-size">
+            <div class="receiver_message streaming"></div>
+            </div>
+        </div>`;
+        chatBox.scrollTop = chatBox.scrollHeight;
+
+    }
+
+    eel.expose(receiverAppend)
+    function receiverAppend(text) {
+
+        var chatBox = document.getElementById("chat-canvas-body");
+        var bubbles = chatBox.getElementsByClassName("streaming");
+        if (bubbles.length == 0) {
+            receiverStart();
+        }
+        bubbles[bubbles.length - 1].textContent += text;
+        chatBox.scrollTop = chatBox.scrollHeight;
+
+    }
+
+    eel.expose(receiverEnd)
+    function receiverEnd() {
+
+        var bubbles = document.getElementsByClassName("streaming");
+        while (bubbles.length > 0) {
+            bubbles[0].classList.remove("streaming");
+        }
+
+    }
+
     
     // Hide Loader and display Face Auth animation
     eel.expose(hideLoader)
@@ -57,6 +94,13 @@ $(document).ready(function () {
         $("#Loader").attr("hidden", true);
         $("#FaceAuth").attr("hidden", false);
 
+    }
+    // Low rate camera preview while face authentication runs
+    eel.expose(updateFacePreview)
+    function updateFacePreview(dataUrl) {
+
+        $("#FacePreview").attr("src", dataUrl).attr("hidden", false);
+
     }
     // Hide Face auth and display Face Auth success animation
     eel.expose(hideFaceAuth)
@@ -76,6 +120,21 @@ $(document).ready(function () {
     }
 
 
+    // Back to the Start Page's face auth, after the owner left
+    eel.expose(showFaceAuth)
+    function showFaceAuth() {
+
+        $("#Oval").attr("hidden", true).removeClass("animate__animated animate__zoomIn");
+        $("#SiriWave").attr("hidden", true);
+        $("#Loader").attr("hidden", true);
+        $("#FaceAuthSuccess").attr("hidden", true);
+        $("#HelloGreet").attr("hidden", true);
+        $("#FacePreview").attr("hidden", true);
+        $("#FaceAuth").attr("hidden", false);
+        $("#Start").attr("hidden", false);
+
+    }
+
     // Hide Start Page and display blob
     eel.expose(hideStart)
     function hideStart() {